@@ -1,16 +1,18 @@
 import gradio as gr
-import chess
-import chess.pgn
-import io
-import requests
-from collections import defaultdict
 import os
 import logging
-from core.core import analyze_games
+from core.jobs import analyze_games_job, start_jobs_server
+from core.metrics import start_metrics_server
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+METRICS_PORT = os.environ.get('METRICS_PORT')
+# Analyses spend most of their time waiting on network calls, so let several run at once
+GRADIO_CONCURRENCY = int(os.environ.get('GRADIO_CONCURRENCY', 8))
+# Optional JSON API over the same job queue the UI uses
+JOBS_API_PORT = os.environ.get('JOBS_API_PORT')
+
 with gr.Blocks(title="Chess Study Plan Pro", theme=gr.themes.Soft()) as demo:
     gr.Markdown("""
     # ♟️ Professional Shaxmat O'quv Rejasi
@@ -35,8 +37,8 @@ with gr.Blocks(title="Chess Study Plan Pro", theme=gr.themes.Soft()) as demo:
             gr.Markdown("### 📁 PGN fayl yuklash")
             pgn_upload = gr.File(
                 label="PGN faylni yuklang",
-                file_types=[".pgn"],
-                type="binary"
+                file_types=[".pgn", ".gz", ".bz2", ".zst"],
+                type="filepath"
             )
             username_pgn = gr.Textbox(
                 label="Foydalanuvchi nomi (PGN uchun)",
@@ -69,7 +71,7 @@ with gr.Blocks(title="Chess Study Plan Pro", theme=gr.themes.Soft()) as demo:
             puzzle3_board = gr.HTML()
     
     analyze_btn.click(
-        fn=analyze_games,
+        fn=analyze_games_job,
         inputs=[username_chesscom, pgn_upload, username_pgn],
         outputs=[
             stats_output,
@@ -99,4 +101,12 @@ with gr.Blocks(title="Chess Study Plan Pro", theme=gr.themes.Soft()) as demo:
     - ✅ Kitoblar va kurslar tavsiyasi
     """)
 
-demo.launch()
\ No newline at end of file
+# Analysis workers import this module as __mp_main__, so only the real entry
+# point may bind ports or launch the UI
+if __name__ == '__main__':
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT))
+    if JOBS_API_PORT:
+        start_jobs_server(int(JOBS_API_PORT))
+    demo.queue(default_concurrency_limit=GRADIO_CONCURRENCY)
+    demo.launch()
@@ -0,0 +1,68 @@
+import argparse
+import io
+import sys
+import time
+import chess.pgn
+from benchmarks.corpus import load_corpus
+from core.ingest import build_offsets
+
+HEADERS = '[Event "Rated blitz game"]\n[White "a"]\n[Black "b"]\n[Result "1-0"]\n\n'
+
+# (name, PGN text, expected games). Checked before every run so the timings
+# below are never reported for an index that splits games differently from
+# chess.pgn.read_game
+KNOWN_SPLITS = [
+    ("moves only", "1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 1-0\n", 1),
+    ("headerless between headed", HEADERS + "1. e4 e5 1-0\n\n1. d4 d5 0-1\n\n" + HEADERS + "1. c4 c5 1-0\n", 3),
+    ("comment line starting with [", HEADERS + "1. e4 { a comment wrapped\n[%clk 0:02:59] } e5 2. Nf3 1-0\n", 1),
+    ("byte order mark and blank lines", "﻿" + HEADERS + "1. e4 1-0\n\n\n\n" + HEADERS + "1. d4 1-0\n", 2),
+]
+
+
+def count_games(pgn_text):
+    pgn_io = io.StringIO(pgn_text)
+    count = 0
+    while chess.pgn.read_game(pgn_io) is not None:
+        count += 1
+    return count
+
+
+def check_known():
+    failures = []
+    for name, pgn_text, expected in KNOWN_SPLITS:
+        data = pgn_text.encode('utf-8')
+        offsets = build_offsets(data)
+        if len(offsets) != expected or count_games(pgn_text) != expected:
+            failures.append(f"{name}: indexed {len(offsets)}, read_game {count_games(pgn_text)}, expected {expected}")
+            continue
+        texts = [data[start:end].decode('utf-8') for start, end in zip(offsets, list(offsets[1:]) + [len(data)])]
+        if sum(count_games(text) for text in texts) != expected:
+            failures.append(f"{name}: indexed game texts do not each hold one game")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PGN indexing: known game boundaries, then bytes per second")
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    failures = check_known()
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+    print(f"{len(KNOWN_SPLITS)} known splits ok")
+
+    data = load_corpus(args.games).encode('utf-8')
+    best = None
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        offsets = build_offsets(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{len(offsets)} games, {len(data) / 1e6:.1f} MB: {best * 1000:.1f} ms, {len(data) / 1e6 / best:.1f} MB/s")
+
+
+if __name__ == '__main__':
+    main()
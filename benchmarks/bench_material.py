@@ -0,0 +1,94 @@
+import argparse
+import random
+import time
+import chess
+import chess.pgn
+from core.material import MaterialTracker, count_material
+
+
+def load_corpus(path, limit):
+    games = []
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        while len(games) < limit:
+            game = chess.pgn.read_game(f)
+            if game is None:
+                break
+            games.append((game.board(), list(game.mainline_moves())))
+    return games
+
+
+def random_corpus(count, seed):
+    rnd = random.Random(seed)
+    games = []
+    for _ in range(count):
+        board = chess.Board()
+        moves = []
+        for _ in range(rnd.randint(20, 160)):
+            legal = list(board.legal_moves)
+            if not legal:
+                break
+            move = rnd.choice(legal)
+            moves.append(move)
+            board.push(move)
+        games.append((chess.Board(), moves))
+    return games
+
+
+def bench_recount(games):
+    for start, moves in games:
+        board = start.copy(stack=False)
+        for move in moves:
+            material_before = count_material(board)
+            board.push(move)
+            material_after = count_material(board)
+            abs(material_after - material_before)
+            len(board.piece_map()) <= 10
+
+
+def bench_tracker(games):
+    for start, moves in games:
+        board = start.copy(stack=False)
+        tracker = MaterialTracker(board)
+        for move in moves:
+            tracker.push(board, move)
+            board.push(move)
+            tracker.is_endgame()
+
+
+def bench_push_only(games):
+    for start, moves in games:
+        board = start.copy(stack=False)
+        for move in moves:
+            board.push(move)
+
+
+def timed(fn, games, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(games)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-move cost of material recount vs incremental tracking")
+    parser.add_argument('--pgn', help="PGN corpus to replay (default: random games)")
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    games = load_corpus(args.pgn, args.games) if args.pgn else random_corpus(args.games, args.seed)
+    total_moves = sum(len(moves) for _, moves in games)
+
+    baseline = timed(bench_push_only, games, args.repeat)
+    print(f"{len(games)} games, {total_moves} moves (push only: {baseline / total_moves * 1e6:.2f} us/move)")
+    for name, fn in (('recount', bench_recount), ('tracker', bench_tracker)):
+        elapsed = timed(fn, games, args.repeat) - baseline
+        print(f"{name:>8}: {elapsed / total_moves * 1e6:.2f} us/move over push")
+
+
+if __name__ == '__main__':
+    main()
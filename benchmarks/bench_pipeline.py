@@ -0,0 +1,194 @@
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import chess
+import chess.pgn
+from benchmarks.corpus import PLAYER, ROOT_DIR, load_corpus
+from core.core import (
+    analyze_game_detailed, build_stats_report, categorize_mistakes, iter_game_analyses,
+    new_color_stats, new_opening_stats, average_rating
+)
+from core.columnar import AnalysisTable
+
+DEFAULT_SIZES = [10, 1000, 10000, 100000]
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+    result = {}
+    for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0)):
+        result[name] = ordered[min(len(ordered) - 1, int(fraction * (len(ordered) - 1) + 0.5))] * 1000
+    return result
+
+
+def stage_parse(pgn_text, state):
+    latencies = []
+    games = []
+    pgn_io = io.StringIO(pgn_text)
+    while True:
+        start = time.perf_counter()
+        game = chess.pgn.read_game(pgn_io)
+        if game is None:
+            break
+        latencies.append(time.perf_counter() - start)
+        games.append(game)
+    state['games'] = games
+    return len(games), sum(1 for game in games for _ in game.mainline_moves()), latencies
+
+
+def stage_analyze(pgn_text, state):
+    latencies = []
+    analyses = []
+    for game in state['games']:
+        start = time.perf_counter()
+        analyses.append(analyze_game_detailed(game, PLAYER))
+        latencies.append(time.perf_counter() - start)
+    state['analyses'] = analyses
+    return len(analyses), None, latencies
+
+
+def stage_fused(pgn_text, state):
+    # The production path: analysis happens while the PGN is parsed
+    latencies = []
+    iterator = iter_game_analyses(io.StringIO(pgn_text), PLAYER)
+    while True:
+        start = time.perf_counter()
+        item = next(iterator, None)
+        if item is None:
+            break
+        latencies.append(time.perf_counter() - start)
+    return len(latencies), None, latencies
+
+
+def stage_aggregate(pgn_text, state):
+    start = time.perf_counter()
+    table = AnalysisTable.from_analyses(state['analyses'])
+    opening_stats = new_opening_stats()
+    color_stats = new_color_stats()
+    table.tally(opening_stats, color_stats)
+    weaknesses = categorize_mistakes(table)
+    state['table'] = table
+    state['aggregates'] = (weaknesses, opening_stats, color_stats)
+    return len(state['analyses']), None, [time.perf_counter() - start]
+
+
+def stage_report(pgn_text, state):
+    start = time.perf_counter()
+    weaknesses, opening_stats, color_stats = state['aggregates']
+    build_stats_report(state['table'], weaknesses, opening_stats, color_stats, average_rating([]))
+    return len(state['analyses']), None, [time.perf_counter() - start]
+
+
+STAGES = [
+    ('parse', stage_parse),
+    ('analyze', stage_analyze),
+    ('fused', stage_fused),
+    ('aggregate', stage_aggregate),
+    ('report', stage_report),
+]
+
+
+def run_stages(pgn_text, trace_memory):
+    state = {}
+    results = {}
+    for name, stage in STAGES:
+        gc.collect()
+        if trace_memory:
+            tracemalloc.start()
+        games, moves, latencies = stage(pgn_text, state)
+        # Stages time only their own work, so bookkeeping like move counting is excluded
+        elapsed = sum(latencies)
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        results[name] = {'games': games, 'moves': moves, 'seconds': elapsed, 'latencies': latencies, 'peak_bytes': peak}
+    return results
+
+
+def summarize(timing, memory, total_moves):
+    summary = {}
+    for name, result in timing.items():
+        moves = result['moves'] if result['moves'] is not None else total_moves
+        seconds = result['seconds']
+        summary[name] = {
+            'games': result['games'],
+            'moves': moves,
+            'seconds': seconds,
+            'games_per_s': result['games'] / seconds if seconds else None,
+            'moves_per_s': moves / seconds if seconds else None,
+            'latency_ms': percentiles(result['latencies']),
+            'peak_mem_bytes': memory[name]['peak_bytes'] if memory else None
+        }
+    return summary
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'python_chess': chess.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit or None
+    }
+
+
+def print_summary(size, summary, baseline):
+    print(f"\n== {size} games ==")
+    print(f"{'stage':>10} {'games/s':>10} {'moves/s':>11} {'p50 ms':>9} {'p99 ms':>9} {'peak MB':>9} {'vs base':>8}")
+    for name, stats in summary.items():
+        latency = stats['latency_ms']
+        peak = f"{stats['peak_mem_bytes'] / 1e6:9.1f}" if stats['peak_mem_bytes'] is not None else f"{'-':>9}"
+        ratio = f"{'-':>8}"
+        base = (baseline or {}).get(str(size), {}).get(name)
+        if base and base.get('seconds') and stats['seconds']:
+            ratio = f"{base['seconds'] / stats['seconds']:7.2f}x"
+        print(f"{name:>10} {stats['games_per_s'] or 0:10.0f} {stats['moves_per_s'] or 0:11.0f} "
+              f"{latency.get('p50', 0):9.3f} {latency.get('p99', 0):9.3f} {peak} {ratio}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage throughput, latency and memory on synthetic PGN corpora")
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES), help="comma-separated corpus sizes")
+    parser.add_argument('--seed', type=int, default=2024)
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc pass")
+    parser.add_argument('--output', help="write results as JSON to this path")
+    parser.add_argument('--compare', help="previous JSON results to compare against")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f).get('results')
+
+    results = {}
+    for size in (int(s) for s in args.sizes.split(',') if s):
+        pgn_text = load_corpus(size, args.seed)
+        timing = run_stages(pgn_text, trace_memory=False)
+        # Memory is measured in a separate pass so tracemalloc does not skew timings
+        memory = None if args.no_memory else run_stages(pgn_text, trace_memory=True)
+        summary = summarize(timing, memory, timing['parse']['moves'])
+        results[str(size)] = summary
+        print_summary(size, summary, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'seed': args.seed, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
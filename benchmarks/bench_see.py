@@ -0,0 +1,64 @@
+import argparse
+import io
+import time
+import chess.pgn
+from benchmarks.corpus import load_corpus
+from core.see import is_hanging
+
+
+def count_heuristic(board, square):
+    # The attacker/defender count comparison SEE replaced, verbatim, for comparison
+    if not board.is_attacked_by(not board.turn, square):
+        return False
+    attackers = len(board.attackers(not board.turn, square))
+    defenders = len(board.attackers(board.turn, square))
+    return attackers > defenders
+
+
+def collect_positions(games, limit):
+    # Boards right after each quiet move, which is where the analyzer asks
+    positions = []
+    pgn_io = io.StringIO(load_corpus(games))
+    while len(positions) < limit:
+        game = chess.pgn.read_game(pgn_io)
+        if game is None:
+            break
+        board = game.board()
+        for move in game.mainline_moves():
+            quiet = not board.is_capture(move)
+            board.push(move)
+            if quiet:
+                positions.append((board.copy(stack=False), move.to_square))
+    return positions[:limit]
+
+
+def timed(fn, positions, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for board, square in positions:
+            fn(board, square)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static exchange evaluation: per-call cost against the count heuristic")
+    parser.add_argument('--games', type=int, default=1000, help="synthetic corpus size to draw positions from")
+    parser.add_argument('--positions', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    positions = collect_positions(args.games, args.positions)
+    see_hits = sum(1 for board, square in positions if is_hanging(board, square))
+    count_hits = sum(1 for board, square in positions if count_heuristic(board, square))
+    print(f"{len(positions)} positions after quiet moves: SEE flags {see_hits}, count heuristic flags {count_hits}")
+
+    for name, fn in (('count', count_heuristic), ('see', is_hanging)):
+        elapsed = timed(fn, positions, args.repeat)
+        print(f"{name:>6}: {elapsed / len(positions) * 1e6:.2f} us/call")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_PGN = '''[Event "Startup benchmark"]
+[White "player"]
+[Black "opponent"]
+[WhiteElo "1500"]
+[BlackElo "1500"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 3. Bc4 Nf6 4. Ng5 d5 5. exd5 Nxd5 6. Nxf7 Kxf7 7. Qf3+ Ke6 8. Nc3 1-0
+'''
+
+# Runs in a fresh interpreter so every measurement is a cold start
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import core.core
+import_done = time.perf_counter()
+core.core.prepare_analysis(None, sys.argv[1].encode('utf-8'), 'player')
+first_done = time.perf_counter()
+core.core.prepare_analysis(None, sys.argv[1].encode('utf-8'), 'player')
+second_done = time.perf_counter()
+model_ms = None
+if '--with-model' in sys.argv:
+    from core.ai_integration import get_model
+    model_start = time.perf_counter()
+    try:
+        get_model()
+        model_ms = (time.perf_counter() - model_start) * 1000
+    except Exception:
+        pass
+print(json.dumps({
+    'import_ms': (import_done - start) * 1000,
+    'first_request_ms': (first_done - import_done) * 1000,
+    'warm_request_ms': (second_done - first_done) * 1000,
+    'model_init_ms': model_ms
+}))
+'''
+
+
+def run_probe(with_model):
+    args = [sys.executable, '-c', PROBE, SAMPLE_PGN]
+    if with_model:
+        args.append('--with-model')
+    env = dict(os.environ, ANALYSIS_WORKERS='1')
+    output = subprocess.run(args, cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import and first-request latency")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--with-model', action='store_true', help="also time building the Gemini client")
+    parser.add_argument('--output', help="write the summary as JSON to this path")
+    args = parser.parse_args()
+
+    samples = [run_probe(args.with_model) for _ in range(args.runs)]
+    summary = {}
+    for key in samples[0]:
+        values = [s[key] for s in samples if s[key] is not None]
+        if values:
+            summary[key] = {'p50': percentile(values, 0.5), 'max': max(values)}
+
+    for key, stats in summary.items():
+        print(f"{key:>18}: p50 {stats['p50']:8.1f} ms   max {stats['max']:8.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'runs': args.runs, 'summary': summary, 'samples': samples}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
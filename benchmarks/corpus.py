@@ -0,0 +1,88 @@
+import os
+import random
+import chess
+import chess.pgn
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(ROOT_DIR, 'benchmarks', '.corpora')
+CORPUS_FORMAT = 1
+
+PLAYER = 'bench_player'
+POOL_SIZE = 1500
+ECO_CODES = ['A00', 'A04', 'A10', 'B01', 'B20', 'B30', 'B90', 'C00', 'C20', 'C42', 'C50', 'C60', 'D00', 'D02', 'D30', 'E60', 'Z99']
+OPENING_NAMES = ['Sicilian Defense', 'French Defense', "Queen's Gambit", 'Italian Game', 'Ruy Lopez']
+TIME_CONTROLS = ['60', '180', '180+2', '300', '600', '900+10', '1800']
+RESULTS = ['1-0', '0-1', '1/2-1/2', '*']
+
+
+def _random_movetext(rnd):
+    # Lengths follow a rough club distribution: many short games, a long tail
+    plies = min(int(rnd.lognormvariate(4.2, 0.45)), 400)
+    board = chess.Board()
+    game = chess.pgn.Game()
+    node = game
+    for _ in range(plies):
+        legal = list(board.legal_moves)
+        if not legal:
+            break
+        captures = [m for m in legal if board.is_capture(m)]
+        move = rnd.choice(captures) if captures and rnd.random() < 0.3 else rnd.choice(legal)
+        node = node.add_variation(move)
+        board.push(move)
+    exporter = chess.pgn.StringExporter(headers=False, variations=False, comments=False)
+    movetext = game.accept(exporter)
+    return movetext[:-1].rstrip() if movetext.endswith('*') else movetext
+
+
+def _headers(rnd):
+    user_white = rnd.random() < 0.5
+    opponent = f"opponent_{rnd.randrange(5000)}"
+    result = rnd.choice(RESULTS)
+    completeness = rnd.random()
+
+    if completeness < 0.05:
+        return [], result
+
+    headers = [('White', PLAYER if user_white else opponent), ('Black', opponent if user_white else PLAYER), ('Result', result)]
+    if completeness < 0.15:
+        return headers, result
+
+    headers[:0] = [('Event', 'Rated game'), ('Site', 'https://example.org'), ('Date', f"2024.{rnd.randint(1, 12):02d}.{rnd.randint(1, 28):02d}")]
+    if completeness > 0.3:
+        headers += [('WhiteElo', str(rnd.randint(800, 2600))), ('BlackElo', str(rnd.randint(800, 2600)))]
+    if completeness > 0.5:
+        headers.append(('TimeControl', rnd.choice(TIME_CONTROLS)))
+    if completeness > 0.6:
+        headers.append(('ECO', rnd.choice(ECO_CODES)))
+    if completeness > 0.85:
+        headers.append(('Opening', rnd.choice(OPENING_NAMES)))
+    return headers, result
+
+
+def generate_corpus(games, seed=2024):
+    # A pool of random move sequences is shared across sizes so that the
+    # 100k corpus stays cheap to generate while headers vary per game
+    rnd = random.Random(seed)
+    pool = [_random_movetext(rnd) for _ in range(min(POOL_SIZE, games))]
+    parts = []
+    for _ in range(games):
+        headers, result = _headers(rnd)
+        header_text = "".join(f'[{name} "{value}"]\n' for name, value in headers)
+        parts.append(f"{header_text}\n{rnd.choice(pool)} {result}\n")
+    return "\n".join(parts)
+
+
+def corpus_path(games, seed=2024):
+    return os.path.join(CORPUS_DIR, f"corpus_v{CORPUS_FORMAT}_{games}_{seed}.pgn")
+
+
+def load_corpus(games, seed=2024):
+    path = corpus_path(games, seed)
+    if not os.path.exists(path):
+        os.makedirs(CORPUS_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(generate_corpus(games, seed))
+        os.replace(tmp_path, path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
@@ -0,0 +1,139 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from core import ai_integration, metrics
+from core.core import new_color_stats, new_opening_stats
+
+# A stand-in for the Gemini client with controllable latency, for exercising
+# deadlines, hedging and batching without network access:
+#   from core.ai_integration import set_model
+#   set_model(FakeModel(latency=2.0, slow_rate=0.05, slow_latency=30))
+
+
+class ResourceExhausted(Exception):
+    # Same name and .code as google.api_core's 429 error
+    code = 429
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    def __init__(self, latency=0.5, jitter=0.1, slow_rate=0.0, slow_latency=10.0, error_rate=0.0, throttle_rate=0.0, chunks=5, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.chunks = chunks
+        self.model_name = 'fake-gemini'
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def _draw(self):
+        with self.lock:
+            self.calls += 1
+            roll = self.random.random()
+            slow = self.random.random() < self.slow_rate
+            latency = self.slow_latency if slow else max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        if roll < self.throttle_rate:
+            raise ResourceExhausted("429 Resource has been exhausted")
+        if roll < self.throttle_rate + self.error_rate:
+            raise RuntimeError("fake model error")
+        return latency
+
+    def answer(self, prompt):
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]
+        return f"Soxta murabbiy javobi {digest}"
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        # Like the real client, a call past its request_options timeout fails
+        # instead of holding its thread
+        latency = self._draw()
+        timeout = (request_options or {}).get('timeout')
+        if stream:
+            return self._stream(prompt, latency, timeout)
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("504 Deadline Exceeded")
+        time.sleep(latency)
+        return FakeResponse(self.answer(prompt))
+
+    def _stream(self, prompt, latency, timeout):
+        text = self.answer(prompt)
+        step = -(-len(text) // self.chunks)
+        start = time.monotonic()
+        for i in range(0, len(text), step):
+            time.sleep(latency / self.chunks)
+            if timeout is not None and time.monotonic() - start > timeout:
+                raise TimeoutError("504 Deadline Exceeded")
+            yield FakeResponse(text[i:i + step])
+
+
+def sample_stats(i):
+    opening_stats = new_opening_stats()
+    opening_stats['Sicilian Defense'].update(wins=i % 7, losses=3, draws=1, total=i % 7 + 4)
+    color_stats = new_color_stats()
+    color_stats['white']['wins'] = i % 5
+    weaknesses = [{'category': "Qo'pol xatolar", 'count': 10 + i, 'percentage': 50.0}]
+    # total_games differs per call, so every prompt misses the response cache
+    return weaknesses, opening_stats, color_stats, 100 + i
+
+
+def run(model, calls, concurrency, timeout, hedge_percentile):
+    ai_integration.set_model(model)
+    ai_integration.AI_HEDGE_PERCENTILE = hedge_percentile
+    with ai_integration._latency_lock:
+        ai_integration._latencies.clear()
+    fallbacks_before = sum(metrics.REGISTRY.counter_value('ai_fallback_total', reason=reason) for reason in ('timeout', 'error'))
+    hedges_before = metrics.REGISTRY.counter_value('ai_hedges_total', outcome='launched')
+
+    def one(i):
+        start = time.perf_counter()
+        ai_integration.get_comprehensive_analysis(*sample_stats(i), timeout=timeout)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(one, range(calls)))
+
+    def pick(fraction):
+        return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 1)
+
+    return {
+        'hedge_percentile': hedge_percentile,
+        'p50_ms': pick(0.5), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99), 'max_ms': round(latencies[-1] * 1000, 1),
+        'fallbacks': sum(metrics.REGISTRY.counter_value('ai_fallback_total', reason=reason) for reason in ('timeout', 'error')) - fallbacks_before,
+        'hedges': metrics.REGISTRY.counter_value('ai_hedges_total', outcome='launched') - hedges_before,
+        'model_calls': model.calls
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tail latency of the AI call against a fake model, with and without hedging")
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--slow-rate', type=float, default=0.05)
+    parser.add_argument('--slow-latency', type=float, default=5.0)
+    parser.add_argument('--timeout', type=float, default=2.0)
+    parser.add_argument('--hedge-percentile', type=float, default=0.9)
+    args = parser.parse_args()
+
+    # The rate limiter is not under test here
+    ai_integration.AI_HEDGE_MIN_SAMPLES = min(ai_integration.AI_HEDGE_MIN_SAMPLES, args.concurrency)
+    ai_integration.get_limiter('gemini').rate = 0
+    for hedge_percentile in (0, args.hedge_percentile):
+        model = FakeModel(args.latency, args.latency / 4, args.slow_rate, args.slow_latency, seed=1)
+        print(json.dumps(run(model, args.calls, args.concurrency, args.timeout, hedge_percentile)))
+
+
+if __name__ == '__main__':
+    main()
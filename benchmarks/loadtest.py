@@ -0,0 +1,402 @@
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import chess.pgn
+from benchmarks.corpus import generate_corpus
+from benchmarks.fake_gemini import FakeModel
+from core import ai_integration, chess_api, metrics, puzzles
+from core.ratelimit import RATE_LIMITS, get_limiter
+
+# Drives simulated users through one instance with every upstream replaced
+# by a local stand-in, ramping concurrency to find where latency collapses:
+#   python -m benchmarks.loadtest --concurrency 1,4,16,64 --requests 100
+# Against the Gradio app, start it with the same stand-ins in one shell and
+# point the harness at it from another:
+#   python -m benchmarks.loadtest --serve-app
+#   python -m benchmarks.loadtest --target gradio --url http://127.0.0.1:7860
+
+PUZZLE_THEMES = ['crushing', 'hangingPiece', 'advantage', 'attackingF2F7', 'pin', 'skewer', 'discoveredAttack', 'opening',
+                 'middlegame', 'fork', 'defensiveMove', 'endgame', 'advancedPawn', 'promotion', 'tactics']
+TIME_CLASSES = [('blitz', '180+2'), ('blitz', '300'), ('rapid', '600'), ('rapid', '900+10')]
+RESULTS = [('1-0', 'win', 'resigned'), ('0-1', 'resigned', 'win'), ('1/2-1/2', 'agreed', 'agreed')]
+MOVETEXT_POOL = 400
+GRADIO_API_NAME = 'analyze_games_job'
+
+
+class Faults:
+    # Latency and failure profile of one stand-in upstream
+    def __init__(self, latency, jitter, error_rate=0.0, throttle_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {'ok': 0, 'error': 0, 'throttled': 0}
+
+    def draw(self):
+        with self.lock:
+            roll = self.random.random()
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            outcome = 'throttled' if roll < self.throttle_rate else 'error' if roll < self.throttle_rate + self.error_rate else 'ok'
+            self.counts[outcome] += 1
+        time.sleep(delay)
+        return outcome
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+def movetext_pool(size=MOVETEXT_POOL, seed=2024):
+    exporter = chess.pgn.StringExporter(headers=False, variations=False, comments=False)
+    pgn_io = io.StringIO(generate_corpus(size, seed))
+    pool = []
+    while True:
+        game = chess.pgn.read_game(pgn_io)
+        if game is None:
+            break
+        movetext = game.accept(exporter).rsplit(' ', 1)[0]
+        if movetext:
+            pool.append(movetext)
+    return pool
+
+
+class ChessComStub:
+    # Serves /player/<name>, its archive list and monthly archives for any
+    # name; each player's games are derived from the name, so separate
+    # processes serving the same name agree
+    def __init__(self, faults, months=2, games_per_month=25, seed=2024):
+        self.faults = faults
+        self.months = months
+        self.games_per_month = games_per_month
+        self.pool = movetext_pool(seed=seed)
+        self.archives = {}
+        self.lock = threading.Lock()
+        self.server = None
+
+    def month_list(self):
+        now = datetime.now(timezone.utc)
+        months = []
+        year, month = now.year, now.month
+        for _ in range(self.months):
+            months.append((year, month))
+            year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+        return list(reversed(months))
+
+    def _archive(self, player, year, month):
+        key = (player, year, month)
+        with self.lock:
+            cached = self.archives.get(key)
+        if cached is not None:
+            return cached
+
+        rnd = random.Random(f"{player}/{year}/{month}")
+        end_time = int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp())
+        games = []
+        for i in range(self.games_per_month):
+            opponent = f"opponent_{rnd.randrange(5000)}"
+            user_white = rnd.random() < 0.5
+            white, black = (player, opponent) if user_white else (opponent, player)
+            white_elo, black_elo = rnd.randint(900, 2200), rnd.randint(900, 2200)
+            result, white_result, black_result = rnd.choice(RESULTS)
+            time_class, time_control = rnd.choice(TIME_CLASSES)
+            end_time += rnd.randint(600, 36000)
+            headers = [('Event', 'Live Chess'), ('Site', 'Chess.com'), ('White', white), ('Black', black), ('Result', result),
+                       ('WhiteElo', white_elo), ('BlackElo', black_elo), ('TimeControl', time_control), ('EndTime', end_time)]
+            pgn = "".join(f'[{name} "{value}"]\n' for name, value in headers) + f"\n{rnd.choice(self.pool)} {result}\n"
+            games.append({
+                'url': f"https://www.chess.com/game/live/{player}-{year}{month:02d}-{i}",
+                'pgn': pgn,
+                'time_class': time_class,
+                'end_time': end_time,
+                'white': {'username': white, 'rating': white_elo, 'result': white_result},
+                'black': {'username': black, 'rating': black_elo, 'result': black_result}
+            })
+        body = json.dumps({'games': games}).encode('utf-8')
+        archive = (body, '"' + hashlib.sha1(body).hexdigest() + '"')
+        with self.lock:
+            self.archives[key] = archive
+        return archive
+
+    def route(self, path, base):
+        # (status, body, etag)
+        parts = path.strip('/').split('/')
+        if len(parts) < 2 or parts[0] != 'player':
+            return 404, b'{}', None
+        player = parts[1].lower()
+        if len(parts) == 2:
+            return 200, json.dumps({'username': player}).encode('utf-8'), None
+        if parts[2:] == ['games', 'archives']:
+            archives = [f"{base}/player/{player}/games/{year}/{month:02d}" for year, month in self.month_list()]
+            return 200, json.dumps({'archives': archives}).encode('utf-8'), None
+        if len(parts) == 5 and parts[2] == 'games' and parts[3].isdigit() and parts[4].isdigit():
+            body, etag = self._archive(player, int(parts[3]), int(parts[4]))
+            return 200, body, etag
+        return 404, b'{}', None
+
+    def start(self, host='127.0.0.1', port=0):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                outcome = stub.faults.draw()
+                if outcome != 'ok':
+                    self.send_response(429 if outcome == 'throttled' else 500)
+                    if outcome == 'throttled':
+                        self.send_header('Retry-After', '1')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                status, body, etag = stub.route(self.path, f"http://{host}:{self.server.server_port}")
+                if etag is not None and self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                if etag is not None:
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='chess-com-stub', daemon=True).start()
+        return f"http://{host}:{self.server.server_port}"
+
+
+class SlowPuzzleStore:
+    # Puzzles come from the local store rather than a Lichess endpoint, so
+    # the stand-in injects the upstream's latency and failures at the lookup;
+    # a failure takes fetch_lichess_puzzles' generic-link fallback
+    def __init__(self, store, faults):
+        self.store = store
+        self.faults = faults
+        self.count = store.count
+
+    def find_puzzles(self, themes, rating, count, window=300, rng=None):
+        if self.faults.draw() != 'ok':
+            raise RuntimeError("puzzle stand-in failure")
+        return self.store.find_puzzles(themes, rating, count, window, rng)
+
+
+def build_puzzle_stub(faults, directory, size=20000, seed=2024):
+    rnd = random.Random(seed)
+    csv_path = os.path.join(directory, 'puzzles.csv')
+    with open(csv_path, 'w', encoding='utf-8') as f:
+        f.write("PuzzleId,Rating,Themes\n")
+        for i in range(size):
+            themes = " ".join(rnd.sample(PUZZLE_THEMES, 2))
+            f.write(f"p{i:07d},{rnd.randint(600, 2800)},{themes}\n")
+    store_path = os.path.join(directory, 'puzzles.bin')
+    puzzles.build_puzzle_store(csv_path, store_path)
+    return SlowPuzzleStore(puzzles.PuzzleStore(store_path), faults)
+
+
+def install_stubs(args):
+    # Points this process's clients at the stand-ins
+    chess_com = ChessComStub(Faults(args.chess_com_latency, args.chess_com_latency / 4, args.chess_com_error_rate,
+                                    args.chess_com_throttle_rate, seed=1),
+                             months=args.months, games_per_month=args.games_per_month)
+    chess_api.CHESS_COM_API_URL = chess_com.start()
+
+    puzzle_store = build_puzzle_stub(Faults(args.puzzle_latency, args.puzzle_latency / 4, args.puzzle_error_rate, seed=2),
+                                     tempfile.mkdtemp(prefix='uzchess-loadtest-'))
+    with puzzles._store_lock:
+        puzzles._store = puzzle_store
+        puzzles._store_loaded = True
+
+    model = FakeModel(args.gemini_latency, args.gemini_latency / 4, args.gemini_slow_rate, args.gemini_slow_latency,
+                      args.gemini_error_rate, args.gemini_throttle_rate, seed=3)
+    ai_integration.set_model(model)
+
+    if not args.keep_rate_limits:
+        # The stand-ins are not rate limited; keep the buckets to measure them instead
+        for service in RATE_LIMITS:
+            get_limiter(service).rate = 0
+    return {'chess_com': chess_com.faults, 'puzzles': puzzle_store.faults, 'gemini': model}
+
+
+def is_error(outputs):
+    return not outputs or str(outputs[0]).startswith('❌')
+
+
+def call_analyze(username):
+    from core.core import analyze_games
+    return analyze_games(username, None, None)
+
+
+def call_jobs(username):
+    from core.jobs import analyze_games_job
+    outputs = None
+    for outputs in analyze_games_job(username, None, ""):
+        pass
+    return outputs
+
+
+def gradio_caller(url, timeout):
+    # Gradio's HTTP call API: POST queues the event, GET streams its updates
+    # as server-sent events until "complete" or "error"
+    import requests
+    session = requests.Session()
+    endpoint = f"{url.rstrip('/')}/gradio_api/call/{GRADIO_API_NAME}"
+
+    def call(username):
+        response = session.post(endpoint, json={'data': [username, None, ""]}, timeout=timeout)
+        response.raise_for_status()
+        event_id = response.json()['event_id']
+        event = None
+        with session.get(f"{endpoint}/{event_id}", stream=True, timeout=timeout) as stream:
+            stream.raise_for_status()
+            for line in stream.iter_lines(decode_unicode=True):
+                if line.startswith('event:'):
+                    event = line[len('event:'):].strip()
+                elif line.startswith('data:') and event in ('complete', 'error'):
+                    if event == 'error':
+                        return None
+                    return json.loads(line[len('data:'):].strip())
+        return None
+
+    return call
+
+
+def percentile(ordered, fraction):
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 1) if ordered else None
+
+
+def counter_total(name, label, values):
+    return sum(metrics.REGISTRY.counter_value(name, **{label: value}) for value in values)
+
+
+def run_level(call, concurrency, requests, user_pool, prefix, stubs):
+    if user_pool:
+        users = [f"{prefix}_{i % user_pool}" for i in range(requests)]
+    else:
+        # Fresh names per level so caches from the previous level do not flatter it
+        users = [f"{prefix}_c{concurrency}_{i}" for i in range(requests)]
+    before = {name: faults.snapshot() for name, faults in stubs.items() if isinstance(faults, Faults)}
+    model_calls = stubs['gemini'].calls if 'gemini' in stubs else 0
+    fallbacks = counter_total('ai_fallback_total', 'reason', ('timeout', 'error'))
+    degraded = counter_total('fanout_degraded_total', 'reason', ('timeout', 'error'))
+
+    def one(username):
+        start = time.perf_counter()
+        try:
+            failed = is_error(call(username))
+        except Exception:
+            failed = True
+        return time.perf_counter() - start, failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, users))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, failed in results if failed)
+    level = {
+        'concurrency': concurrency,
+        'requests': requests,
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(requests / elapsed, 2) if elapsed else None,
+        'p50_ms': percentile(latencies, 0.5),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+        'error_rate': round(errors / requests, 4) if requests else 0.0
+    }
+    if stubs:
+        # Upstream traffic and degradations only show in-process
+        level['upstream'] = {name: {key: count - before[name][key] for key, count in faults.snapshot().items()}
+                             for name, faults in stubs.items() if isinstance(faults, Faults)}
+        level['upstream']['gemini_calls'] = stubs['gemini'].calls - model_calls
+        level['ai_fallbacks'] = counter_total('ai_fallback_total', 'reason', ('timeout', 'error')) - fallbacks
+        level['degraded'] = counter_total('fanout_degraded_total', 'reason', ('timeout', 'error')) - degraded
+    return level
+
+
+def print_level(level):
+    print(f"{level['concurrency']:>6} {level['requests']:>8} {level['throughput_rps'] or 0:9.2f} {level['p50_ms'] or 0:9.0f} "
+          f"{level['p95_ms'] or 0:9.0f} {level['p99_ms'] or 0:9.0f} {level['error_rate'] * 100:7.1f}%", flush=True)
+
+
+def add_stub_arguments(parser):
+    parser.add_argument('--months', type=int, default=2, help="archives per stand-in player")
+    parser.add_argument('--games-per-month', type=int, default=25)
+    parser.add_argument('--chess-com-latency', type=float, default=0.15)
+    parser.add_argument('--chess-com-error-rate', type=float, default=0.0)
+    parser.add_argument('--chess-com-throttle-rate', type=float, default=0.0)
+    parser.add_argument('--puzzle-latency', type=float, default=0.1)
+    parser.add_argument('--puzzle-error-rate', type=float, default=0.0)
+    parser.add_argument('--gemini-latency', type=float, default=2.0)
+    parser.add_argument('--gemini-slow-rate', type=float, default=0.02)
+    parser.add_argument('--gemini-slow-latency', type=float, default=30.0)
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0)
+    parser.add_argument('--gemini-throttle-rate', type=float, default=0.0)
+    parser.add_argument('--keep-rate-limits', action='store_true', help="keep the outbound token buckets in force")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput, tail latency and error rate against local stand-ins for every upstream")
+    parser.add_argument('--target', choices=('analyze', 'jobs', 'gradio'), default='analyze',
+                        help="analyze_games in-process, the shared job service in-process, or a running Gradio app")
+    parser.add_argument('--url', default='http://127.0.0.1:7860', help="Gradio app for --target gradio")
+    parser.add_argument('--serve-app', action='store_true', help="run app.py with the stand-ins installed, for --target gradio")
+    parser.add_argument('--concurrency', default='1,4,16,64', help="comma-separated simulated users in flight")
+    parser.add_argument('--requests', type=int, default=64, help="requests per concurrency level")
+    parser.add_argument('--user-pool', type=int, default=0, help="reuse this many player names (0: every request is a new player)")
+    parser.add_argument('--timeout', type=float, default=300.0, help="per-request timeout for --target gradio")
+    parser.add_argument('--output', help="write results as JSON to this path")
+    parser.add_argument('--verbose', action='store_true', help="keep the per-request log lines")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    if args.serve_app:
+        install_stubs(args)
+        # app.py builds and launches the interface on import
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        import app  # noqa: F401
+        return
+
+    stubs = {}
+    if args.target == 'gradio':
+        call = gradio_caller(args.url, args.timeout)
+    else:
+        stubs = install_stubs(args)
+        call = call_analyze if args.target == 'analyze' else call_jobs
+
+    prefix = f"load_{os.getpid()}"
+    print(f"{'conc':>6} {'requests':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8}")
+    levels = []
+    for concurrency in (int(c) for c in args.concurrency.split(',') if c):
+        level = run_level(call, concurrency, args.requests, args.user_pool, prefix, stubs)
+        levels.append(level)
+        print_level(level)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'target': args.target, 'settings': {k: v for k, v in vars(args).items() if k != 'output'}, 'levels': levels}, f, indent=2)
+        print(f"\nResults written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
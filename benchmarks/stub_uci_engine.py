@@ -0,0 +1,71 @@
+import sys
+import chess
+from core.material import count_material_bitboards
+from core.see import capture_value
+
+# A deterministic one-ply UCI engine for exercising the engine pool without a
+# real binary: UCI_ENGINE_PATH="python -m benchmarks.stub_uci_engine"
+
+
+def evaluate(board):
+    # Material from the side to move, minus what the opponent can win next
+    material = count_material_bitboards(board)
+    material = material if board.turn == chess.WHITE else -material
+    return material * 100
+
+
+def search(board):
+    best_move, best_score, nodes = None, None, 0
+    for move in board.legal_moves:
+        nodes += 1
+        board.push(move)
+        if board.is_checkmate():
+            score = 100000
+        else:
+            threat = max((capture_value(board, square) for square in chess.SquareSet(board.occupied_co[not board.turn])), default=0)
+            score = -evaluate(board) - threat * 100
+        board.pop()
+        if best_score is None or score > best_score:
+            best_move, best_score = move, score
+    if best_move is None:
+        return None, (-100000 if board.is_check() else 0), nodes
+    return best_move, best_score, nodes
+
+
+def main():
+    board = chess.Board()
+    for line in sys.stdin:
+        tokens = line.split()
+        if not tokens:
+            continue
+        command = tokens[0]
+        if command == 'uci':
+            print("id name uzchess-stub")
+            print("id author uzchess")
+            print("option name Hash type spin default 16 min 1 max 1024")
+            print("uciok")
+        elif command == 'isready':
+            print("readyok")
+        elif command == 'ucinewgame':
+            board = chess.Board()
+        elif command == 'position':
+            moves_at = tokens.index('moves') if 'moves' in tokens else len(tokens)
+            if tokens[1] == 'startpos':
+                board = chess.Board()
+            else:
+                board = chess.Board(" ".join(tokens[2:moves_at]))
+            for uci in tokens[moves_at + 1:]:
+                board.push_uci(uci)
+        elif command == 'go':
+            move, score, nodes = search(board)
+            score_text = "mate 1" if score == 100000 else f"cp {score}"
+            pv = f" pv {move.uci()}" if move else ""
+            print(f"info depth 1 nodes {nodes} score {score_text}{pv}")
+            print(f"bestmove {move.uci() if move else '0000'}")
+        elif command == 'quit':
+            break
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,95 @@
 
 
 import os
-from collections import defaultdict
+import time
+import queue
+import inspect
+import hashlib
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, TimeoutError as FutureTimeoutError
+from collections import defaultdict, deque
 import logging
-import google.generativeai as genai
+from core.cache import TTLCache, SingleFlight
+from core import metrics
+from core.coaching import build_template_report
+from core.ratelimit import RATE_LIMIT_RETRIES, get_limiter, is_throttling_error, throttle
 
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.0-flash-exp')
+GEMINI_MODEL_NAME = os.environ.get('GEMINI_MODEL_NAME', 'gemini-2.0-flash-exp')
+
+model = None
+_model_lock = threading.Lock()
+
+AI_CACHE_SIZE = int(os.environ.get('AI_CACHE_SIZE', 256))
+AI_CACHE_TTL = float(os.environ.get('AI_CACHE_TTL', 6 * 3600))
+# Past this many seconds a request gets the template report instead of waiting on the model
+AI_TIMEOUT = float(os.environ.get('AI_TIMEOUT', 60))
+# Calls in flight to the model across all requests and batches
+AI_CONCURRENCY = int(os.environ.get('AI_CONCURRENCY', 8))
+# Hedging: a call still running past this latency percentile of recent calls
+# gets a duplicate, and the first answer wins. 0 turns it off
+AI_HEDGE_PERCENTILE = float(os.environ.get('AI_HEDGE_PERCENTILE', 0))
+AI_HEDGE_MIN_SAMPLES = int(os.environ.get('AI_HEDGE_MIN_SAMPLES', 20))
+AI_MAX_HEDGES = int(os.environ.get('AI_MAX_HEDGES', 1))
+AI_LATENCY_WINDOW = 200
+STREAM_CUT_NOTE = "\n\n_(AI javobi vaqt chegarasi tufayli to'xtatildi.)_"
+EMPTY_RESPONSE_ERROR = "AI returned an empty response"
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+_response_cache = TTLCache(AI_CACHE_SIZE, AI_CACHE_TTL, name='ai_response')
+_inflight = SingleFlight()
+_latencies = deque(maxlen=AI_LATENCY_WINDOW)
+_latency_lock = threading.Lock()
+_ai_executor = None
+_ai_executor_lock = threading.Lock()
+_STREAM_END = object()
+
+
+def get_model():
+    # google.generativeai is slow to import, so the client is built on first use
+    global model
+    with _model_lock:
+        if model is None:
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+        return model
+
+
+def _get_ai_executor():
+    global _ai_executor
+    with _ai_executor_lock:
+        if _ai_executor is None:
+            _ai_executor = ThreadPoolExecutor(max_workers=AI_CONCURRENCY, thread_name_prefix='ai')
+        return _ai_executor
+
 
-def get_comprehensive_analysis(weaknesses, opening_stats, color_stats, total_games):
+def set_model(client):
+    # Any object with generate_content(prompt) returning something with .text
+    global model
+    with _model_lock:
+        model = client
+    _response_cache.clear()
+
+
+def get_ai_cache_stats():
+    return {
+        'hits': _response_cache.hits,
+        'misses': _response_cache.misses,
+        'shared_inflight': _inflight.shared,
+        'size': len(_response_cache.entries)
+    }
+
+
+def prompt_fingerprint(prompt, client):
+    model_name = getattr(client, 'model_name', type(client).__name__)
+    return hashlib.sha256(f"{model_name}\0{prompt}".encode('utf-8')).hexdigest()
+
+
+def build_analysis_prompt(weaknesses, opening_stats, color_stats, total_games):
     weakness_text = "\n".join([f"- {w['category']}: {w['count']} marta ({w['percentage']:.1f}%)" for w in weaknesses])
     
     opening_text = "\n".join([f"- {opening}: {stats['total']} o'yin (G'alabalar: {stats['wins']}, Yutqazishlar: {stats['losses']}, Duranglar: {stats['draws']})" 
@@ -57,9 +133,284 @@ Quyidagilarni taqdim eting:
 
 MUHIM: Javobni FAQAT O'ZBEK TILIDA yozing! Aniq va amaliy maslahatlar bering."""
     
+    return prompt
+
+
+def _request_options_supported(client):
+    # The google client takes a per-call timeout; test doubles usually do not
+    try:
+        return 'request_options' in inspect.signature(client.generate_content).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def _remaining(deadline):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("AI deadline passed")
+    return remaining
+
+
+def _call_options(client, deadline):
+    if _request_options_supported(client):
+        return {'request_options': {'timeout': _remaining(deadline)}}
+    return {}
+
+
+def _generate(client, prompt, deadline):
+    limiter = get_limiter('gemini')
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        limiter.acquire(deadline=deadline)
+        options = _call_options(client, deadline)
+        start = time.perf_counter()
+        try:
+            text = client.generate_content(prompt, **options).text
+        except Exception as e:
+            metrics.observe('external_call_seconds', time.perf_counter() - start, service='gemini')
+            metrics.inc('external_calls_total', service='gemini', status='error')
+            if attempt < RATE_LIMIT_RETRIES and is_throttling_error(e):
+                throttle('gemini', attempt)
+                continue
+            raise
+        elapsed = time.perf_counter() - start
+        metrics.observe('external_call_seconds', elapsed, service='gemini')
+        metrics.inc('external_calls_total', service='gemini', status='ok')
+        with _latency_lock:
+            _latencies.append(elapsed)
+        if not text.strip():
+            raise ValueError(EMPTY_RESPONSE_ERROR)
+        return text
+
+
+def hedge_delay():
+    # Seconds after which a still-running call gets a hedge, or None while
+    # hedging is off or too few calls have been timed to know the tail
+    if AI_HEDGE_PERCENTILE <= 0:
+        return None
+    with _latency_lock:
+        samples = sorted(_latencies)
+    if len(samples) < AI_HEDGE_MIN_SAMPLES:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * AI_HEDGE_PERCENTILE))]
+
+
+def _cache_when_done(key):
+    # Calls outlive a caller that gave up; a late answer still warms the cache
+    def store(call):
+        if not call.cancelled() and call.exception() is None:
+            _response_cache.put(key, call.result())
+    return store
+
+
+def _generate_hedged(client, prompt, key, deadline):
+    executor = _get_ai_executor()
+    context = contextvars.copy_context()
+    first_started = []
+    
+    def first_call():
+        first_started.append(time.monotonic())
+        return _generate(client, prompt, deadline)
+    
+    def launch(fn, *args):
+        call = executor.submit(context.copy().run, fn, *args)
+        call.add_done_callback(_cache_when_done(key))
+        return call
+    
+    first = launch(first_call)
+    pending = {first}
+    launched = 1
+    delay = hedge_delay()
+    error = None
+    try:
+        while pending:
+            now = time.monotonic()
+            hedge_at = None
+            if delay is not None and launched <= AI_MAX_HEDGES:
+                # The clock starts when the call does: a call still queued for a
+                # pool thread would only have its hedge queued behind it
+                hedge_at = first_started[0] + delay * launched if first_started else now + delay
+            wait_until = deadline if hedge_at is None else min(deadline, hedge_at)
+            done, pending = wait(pending, timeout=max(0.0, wait_until - now), return_when=FIRST_COMPLETED)
+            for call in done:
+                if call.exception() is not None:
+                    error = call.exception()
+                    continue
+                if call is not first:
+                    metrics.inc('ai_hedges_total', outcome='won')
+                return call.result()
+            if time.monotonic() >= deadline:
+                raise TimeoutError("AI deadline passed")
+            if pending and first_started and hedge_at is not None and time.monotonic() >= first_started[0] + delay * launched:
+                metrics.inc('ai_hedges_total', outcome='launched')
+                pending.add(launch(_generate, client, prompt, deadline))
+                launched += 1
+        raise error
+    finally:
+        # Attempts still queued for a pool thread are dropped; running ones end
+        # at the deadline through their own request timeout
+        for call in pending:
+            call.cancel()
+
+
+def _fallback(reason, weaknesses, opening_stats, color_stats, total_games):
+    metrics.inc('ai_fallback_total', reason=reason)
+    return build_template_report(weaknesses, opening_stats, color_stats, total_games)
+
+
+def get_comprehensive_analysis(weaknesses, opening_stats, color_stats, total_games, timeout=None):
+    # Always returns within the timeout: the model's answer, or the template
+    # report built from the same statistics
+    timeout = AI_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    stats = (weaknesses, opening_stats, color_stats, total_games)
+    prompt = build_analysis_prompt(*stats)
+    try:
+        client = get_model()
+    except Exception as e:
+        logger.error(f"AI model unavailable: {str(e)}")
+        return _fallback('unavailable', *stats)
+    key = prompt_fingerprint(prompt, client)
+    
+    cached = _response_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    future, leader = _inflight.join(key)
+    if not leader:
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            return _fallback('timeout', *stats)
+        except Exception:
+            return _fallback('error', *stats)
+    
     try:
-        response = model.generate_content(prompt)
-        return response.text
+        text = _generate_hedged(client, prompt, key, deadline)
+    except TimeoutError as e:
+        logger.warning(f"AI analysis missed its {timeout:g}s deadline")
+        _inflight.finish(key, future, error=e)
+        return _fallback('timeout', *stats)
     except Exception as e:
         logger.error(f"AI analysis failed: {str(e)}")
-        return f"AI tahlil hozircha mavjud emas: {str(e)}"
+        _inflight.finish(key, future, error=e)
+        return _fallback('error', *stats)
+    _response_cache.put(key, text)
+    _inflight.finish(key, future, result=text)
+    return text
+
+
+def get_comprehensive_analyses(stats_list, timeout=None):
+    # Many players at once: identical prompts are asked once, and at most
+    # AI_CONCURRENCY distinct prompts are in flight, all under one deadline
+    if not stats_list:
+        return []
+    deadline = time.monotonic() + (AI_TIMEOUT if timeout is None else timeout)
+    unique = {}
+    for stats in stats_list:
+        unique.setdefault(build_analysis_prompt(*stats), stats)
+    metrics.observe('ai_batch_prompts', len(unique))
+    
+    def analyze(stats):
+        return get_comprehensive_analysis(*stats, timeout=max(0.0, deadline - time.monotonic()))
+    
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=min(len(unique), AI_CONCURRENCY), thread_name_prefix='ai-batch') as executor:
+        calls = {prompt: executor.submit(context.copy().run, analyze, stats) for prompt, stats in unique.items()}
+        texts = {prompt: call.result() for prompt, call in calls.items()}
+    return [texts[build_analysis_prompt(*stats)] for stats in stats_list]
+
+
+def _stream_into(client, prompt, key, future, chunks, deadline):
+    # Producer side of stream_comprehensive_analysis; it always settles the
+    # single-flight future, even after the consumer stopped listening
+    text = ""
+    limiter = get_limiter('gemini')
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        try:
+            limiter.acquire(deadline=deadline)
+        except TimeoutError as e:
+            _inflight.finish(key, future, error=e)
+            chunks.put(e)
+            return
+        try:
+            options = _call_options(client, deadline)
+            start = time.perf_counter()
+            for chunk in client.generate_content(prompt, stream=True, **options):
+                if not text:
+                    metrics.observe('external_first_chunk_seconds', time.perf_counter() - start, service='gemini')
+                text += chunk.text
+                chunks.put(text)
+                # The consumer stops listening at the deadline, so stop reading too
+                _remaining(deadline)
+            if not text.strip():
+                # Settled as a failure, so an empty answer is neither cached nor shown
+                raise ValueError(EMPTY_RESPONSE_ERROR)
+            break
+        except Exception as e:
+            metrics.inc('external_calls_total', service='gemini', status='error')
+            # A throttled stream can only be retried before any text was shown
+            if not text and attempt < RATE_LIMIT_RETRIES and is_throttling_error(e):
+                throttle('gemini', attempt)
+                continue
+            logger.error(f"AI analysis failed: {str(e)}")
+            _inflight.finish(key, future, error=e)
+            chunks.put(e)
+            return
+    metrics.observe('external_call_seconds', time.perf_counter() - start, service='gemini')
+    metrics.inc('external_calls_total', service='gemini', status='ok')
+    _response_cache.put(key, text)
+    _inflight.finish(key, future, result=text)
+    chunks.put(_STREAM_END)
+
+
+def stream_comprehensive_analysis(weaknesses, opening_stats, color_stats, total_games, timeout=None):
+    # Yields the growing response text; the last value equals get_comprehensive_analysis().
+    # Past the deadline a partial answer is cut off with a note and a missing
+    # one is replaced by the template report
+    deadline = time.monotonic() + (AI_TIMEOUT if timeout is None else timeout)
+    stats = (weaknesses, opening_stats, color_stats, total_games)
+    prompt = build_analysis_prompt(*stats)
+    try:
+        client = get_model()
+    except Exception as e:
+        logger.error(f"AI model unavailable: {str(e)}")
+        yield _fallback('unavailable', *stats)
+        return
+    key = prompt_fingerprint(prompt, client)
+    
+    cached = _response_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    
+    future, leader = _inflight.join(key)
+    if not leader:
+        try:
+            yield future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            yield _fallback('timeout', *stats)
+        except Exception:
+            yield _fallback('error', *stats)
+        return
+    
+    chunks = queue.Queue()
+    _get_ai_executor().submit(contextvars.copy_context().run, _stream_into, client, prompt, key, future, chunks, deadline)
+    text = ""
+    while True:
+        try:
+            item = chunks.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            logger.warning("AI stream missed its deadline")
+            if text:
+                metrics.inc('ai_fallback_total', reason='truncated')
+                yield text + STREAM_CUT_NOTE
+            else:
+                yield _fallback('timeout', *stats)
+            return
+        if item is _STREAM_END:
+            return
+        if isinstance(item, Exception):
+            yield text + STREAM_CUT_NOTE if text.strip() else _fallback('error', *stats)
+            return
+        text = item
+        yield text
@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import queue
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from core import metrics
+from core.core import fetch_puzzles_for, summarize_games, summary_fields
+from core.chess_api import get_user_games_from_chess_com
+from core.ai_integration import AI_CONCURRENCY, get_comprehensive_analyses
+from core.ingest import HeaderFilter, PgnFile
+from core.ratelimit import BATCH, run_with_priority
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+def player_key(source, player):
+    return f"{source}:{player.strip().lower()}"
+
+
+def load_finished(output_path):
+    # Records are appended as players finish, so a crash can leave a torn last line
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('status') == 'ok':
+                finished.add(player_key(record['source'], record['player']))
+    return finished
+
+
+PGN_SUFFIXES = ('.pgn', '.pgn.gz', '.pgn.bz2', '.pgn.zst')
+
+
+def collect_jobs(usernames, pgn_dir):
+    jobs = [('chess_com', username.strip(), None) for username in usernames if username.strip()]
+    if pgn_dir:
+        for name in sorted(os.listdir(pgn_dir)):
+            suffix = next((suffix for suffix in PGN_SUFFIXES if name.lower().endswith(suffix)), None)
+            if suffix:
+                jobs.append(('pgn', name[:-len(suffix)], os.path.join(pgn_dir, name)))
+    return jobs
+
+
+class BatchRunner:
+    def __init__(self, output_path, fetch_workers=4, analyze_workers=1, queue_size=8, with_ai=False, filter_options=None, only_player=False, ai_batch_size=AI_CONCURRENCY):
+        self.output_path = output_path
+        self.filter_options = filter_options or {}
+        self.only_player = only_player
+        self.fetch_workers = fetch_workers
+        self.analyze_workers = analyze_workers
+        self.with_ai = with_ai
+        self.ai_batch_size = max(1, ai_batch_size)
+        self.jobs = queue.Queue()
+        self.fetched = queue.Queue(maxsize=queue_size)
+        self.analyzed = queue.Queue(maxsize=queue_size)
+        self.stats_lock = threading.Lock()
+        self.players = 0
+        self.failed = 0
+        self.games = 0
+
+    def _fetch(self, source, player, path):
+        if source == 'chess_com':
+            pgn_content, error = get_user_games_from_chess_com(player)
+            return pgn_content, error
+        pgn_file = PgnFile(path)
+        pgn_file.apply_filter(HeaderFilter(player=player if self.only_player else None, **self.filter_options))
+        return pgn_file, None
+
+    def _fetch_worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is _DONE:
+                return
+            source, player, path = job
+            start = time.perf_counter()
+            try:
+                pgn_content, error = self._fetch(source, player, path)
+            except Exception as e:
+                pgn_content, error = None, f"❌ Xatolik: {str(e)}"
+            self.fetched.put((source, player, pgn_content, error, start))
+
+    def _analyze_worker(self):
+        while True:
+            item = self.fetched.get()
+            if item is _DONE:
+                return
+            source, player, pgn_content, error, start = item
+            summary = None
+            if error is None:
+                try:
+                    summary = summarize_games(pgn_content, player)
+                    if summary is None:
+                        error = "❌ O'yinlar topilmadi yoki tahlil qilinmadi"
+                except Exception as e:
+                    logger.exception(f"Analysis failed for {player}")
+                    error = f"❌ Xatolik: {str(e)}"
+                finally:
+                    if isinstance(pgn_content, PgnFile):
+                        pgn_content.close()
+            self.analyzed.put((source, player, summary, error, start))
+
+    def _record(self, source, player, summary, error):
+        record = {
+            'player': player,
+            'source': source,
+            'status': 'error' if error else 'ok',
+            'finished_at': datetime.now(timezone.utc).isoformat(timespec='seconds')
+        }
+        if error:
+            record['error'] = error
+        else:
+            record.update(summary_fields(summary))
+            record['puzzles'] = fetch_puzzles_for(summary['weaknesses'], summary['user_rating'])
+        return record
+
+    def _take_ready(self):
+        # Blocks for one analyzed player, then takes whatever else is already
+        # waiting, up to ai_batch_size, so their AI prompts go out together
+        items = [self.analyzed.get()]
+        while len(items) < self.ai_batch_size:
+            try:
+                items.append(self.analyzed.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _safe_record(self, source, player, summary, error):
+        # A reporting failure becomes that player's error record
+        try:
+            return self._record(source, player, summary, error)
+        except Exception as e:
+            logger.exception(f"Reporting failed for {player}")
+            return self._record(source, player, None, f"❌ Xatolik: {str(e)}")
+
+    def _add_ai_analyses(self, records, items):
+        ready = [(record, summary) for record, (_, _, summary, _, _) in zip(records, items) if record['status'] == 'ok']
+        try:
+            texts = get_comprehensive_analyses([(summary['weaknesses'], summary['opening_stats'], summary['color_stats'], len(summary['analyses'])) for _, summary in ready])
+        except Exception:
+            # The records still go out, just without the AI text
+            logger.exception("AI analysis failed for a report batch")
+            return
+        for (record, _), text in zip(ready, texts):
+            record['ai_analysis'] = text
+
+    def _write_record(self, out, record):
+        try:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+        except Exception:
+            # Not written means not finished, so a resumed run retries the player
+            logger.exception(f"Writing the record for {record['player']} failed")
+            record['status'] = 'error'
+
+    def _report_worker(self, out):
+        # Must keep taking from self.analyzed until every analyzer is done:
+        # if it stopped early, the analyzers would block on a full queue and
+        # run() would never return
+        finished_analyzers = 0
+        while finished_analyzers < self.analyze_workers:
+            items = self._take_ready()
+            finished_analyzers += sum(1 for item in items if item is _DONE)
+            items = [item for item in items if item is not _DONE]
+            records = [self._safe_record(*item[:4]) for item in items]
+
+            if self.with_ai:
+                self._add_ai_analyses(records, items)
+
+            for record, item in zip(records, items):
+                record['elapsed_s'] = round(time.perf_counter() - item[4], 3)
+                self._write_record(out, record)
+
+                with self.stats_lock:
+                    self.players += 1
+                    self.games += record.get('games', 0)
+                    if record['status'] != 'ok':
+                        self.failed += 1
+                metrics.inc('batch_players_total', status=record['status'])
+                logger.info(f"[{self.players}] {record['source']}:{record['player']} {record['status']} ({record['elapsed_s']}s)")
+
+    def run(self, jobs):
+        finished = load_finished(self.output_path)
+        pending = [job for job in jobs if player_key(job[0], job[1]) not in finished]
+        if len(pending) < len(jobs):
+            logger.info(f"Resuming: {len(jobs) - len(pending)} players already done")
+
+        for job in pending:
+            self.jobs.put(job)
+        for _ in range(self.fetch_workers):
+            self.jobs.put(_DONE)
+
+        start = time.perf_counter()
+        with open(self.output_path, 'a+', encoding='utf-8') as out:
+            # Terminate a torn line left by a crash before appending
+            if out.tell() > 0:
+                out.seek(out.tell() - 1)
+                if out.read(1) != "\n":
+                    out.write("\n")
+
+            # Outbound calls from batch threads yield to interactive requests at the rate limiter
+            fetchers = [threading.Thread(target=run_with_priority, args=(BATCH, self._fetch_worker), name=f"batch-fetch-{i}") for i in range(self.fetch_workers)]
+            analyzers = [threading.Thread(target=run_with_priority, args=(BATCH, self._analyze_worker), name=f"batch-analyze-{i}") for i in range(self.analyze_workers)]
+            reporter = threading.Thread(target=run_with_priority, args=(BATCH, self._report_worker, out), name="batch-report")
+            for thread in fetchers + analyzers + [reporter]:
+                thread.start()
+
+            for thread in fetchers:
+                thread.join()
+            for _ in analyzers:
+                self.fetched.put(_DONE)
+            for thread in analyzers:
+                thread.join()
+            for _ in analyzers:
+                self.analyzed.put(_DONE)
+            reporter.join()
+
+        elapsed = time.perf_counter() - start
+        summary = {
+            'players': self.players,
+            'failed': self.failed,
+            'skipped': len(jobs) - len(pending),
+            'games': self.games,
+            'elapsed_s': round(elapsed, 2),
+            'players_per_min': round(self.players / elapsed * 60, 2) if elapsed else None,
+            'games_per_s': round(self.games / elapsed, 2) if elapsed else None
+        }
+        logger.info(f"Batch finished: {json.dumps(summary)}")
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze many players headlessly and write one JSON line per player")
+    parser.add_argument('--usernames', nargs='*', default=[], help="Chess.com usernames")
+    parser.add_argument('--usernames-file', help="file with one Chess.com username per line")
+    parser.add_argument('--pgn-dir', help="directory of <player>.pgn files")
+    parser.add_argument('--output', required=True, help="JSONL output; existing successful players are skipped")
+    parser.add_argument('--fetch-workers', type=int, default=4)
+    parser.add_argument('--analyze-workers', type=int, default=1)
+    parser.add_argument('--queue-size', type=int, default=8)
+    parser.add_argument('--with-ai', action='store_true', help="include the Gemini coaching text")
+    parser.add_argument('--ai-batch-size', type=int, default=AI_CONCURRENCY, help="players whose AI prompts are sent together")
+    parser.add_argument('--only-player', action='store_true', help="for PGN files, keep only games the file's player took part in")
+    parser.add_argument('--time-class', action='append', choices=['bullet', 'blitz', 'rapid', 'classical', 'correspondence'], help="for PGN files, keep only these time classes")
+    parser.add_argument('--since', help="for PGN files, keep games on or after this date (YYYY.MM.DD)")
+    parser.add_argument('--until', help="for PGN files, keep games on or before this date (YYYY.MM.DD)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    usernames = list(args.usernames)
+    if args.usernames_file:
+        with open(args.usernames_file, 'r', encoding='utf-8') as f:
+            usernames.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+
+    jobs = collect_jobs(usernames, args.pgn_dir)
+    if not jobs:
+        parser.error("no usernames or PGN files given")
+
+    filter_options = {'time_classes': args.time_class, 'date_from': args.since, 'date_to': args.until}
+    runner = BatchRunner(args.output, args.fetch_workers, args.analyze_workers, args.queue_size, args.with_ai, filter_options, args.only_player, args.ai_batch_size)
+    summary = runner.run(jobs)
+    print(json.dumps(summary))
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
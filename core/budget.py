@@ -0,0 +1,122 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+# Per-request limits, checked between games so a request that hits one stops
+# with the games it has instead of holding a worker; 0 turns a limit off. The
+# deadline is on by default; limits that change which games or moves a report
+# covers are opt-in, and a report cut short by any of them says so at the top
+REQUEST_MAX_GAMES = int(os.environ.get('REQUEST_MAX_GAMES', 0))
+# Half-moves analyzed per game; the rest of a longer game is skipped unparsed
+REQUEST_MAX_PLIES = int(os.environ.get('REQUEST_MAX_PLIES', 0))
+REQUEST_DEADLINE = float(os.environ.get('REQUEST_DEADLINE', 120))
+# Megabytes of PGN text a request may take on, counted in characters of the
+# game texts it analyzes. This bounds input size, not process memory; the
+# parallel path and Chess.com lists do keep every text until the report is built
+REQUEST_MAX_PGN_MB = float(os.environ.get('REQUEST_MAX_PGN_MB', 0))
+
+REASONS = {
+    'games': "o'yinlar soni chegarasiga yetildi",
+    'deadline': "vaqt chegarasiga yetildi",
+    'pgn_size': "PGN hajmi chegarasiga yetildi",
+    'cancelled': "so'rov bekor qilindi"
+}
+
+_current_budget = contextvars.ContextVar('uzchess_budget', default=None)
+
+
+class RequestBudget:
+    def __init__(self, max_games=REQUEST_MAX_GAMES, max_plies=REQUEST_MAX_PLIES, seconds=REQUEST_DEADLINE, max_pgn_mb=REQUEST_MAX_PGN_MB):
+        self.max_games = max_games
+        self.max_plies = max_plies
+        self.seconds = seconds
+        self.max_pgn_chars = int(max_pgn_mb * 1024 * 1024)
+        self.games = 0
+        self.pgn_chars = 0
+        self.truncated_games = 0
+        self.reason = None
+        self.cancelled = threading.Event()
+        self.start()
+
+    def start(self):
+        # Queued jobs restart the clock when a worker picks them up
+        self.deadline = time.monotonic() + self.seconds if self.seconds > 0 else None
+
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _stop(self, reason):
+        if self.reason is None:
+            self.reason = reason
+            metrics.inc('request_budget_exhausted_total', reason=reason)
+            logger.warning(f"Request stopped early ({reason}) after {self.games} games")
+
+    def expired(self):
+        # Deadline or cancellation, for work that is not split into games
+        if self.cancelled.is_set():
+            self._stop('cancelled')
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self._stop('deadline')
+            return True
+        return False
+
+    def take_game(self, pgn_text):
+        if self.reason is not None or self.expired():
+            return False
+        if self.max_games and self.games >= self.max_games:
+            self._stop('games')
+            return False
+        if self.max_pgn_chars and self.pgn_chars + len(pgn_text) > self.max_pgn_chars:
+            self._stop('pgn_size')
+            return False
+        self.games += 1
+        self.pgn_chars += len(pgn_text)
+        return True
+
+    def games_within(self, pgn_texts):
+        for pgn_text in pgn_texts:
+            if not self.take_game(pgn_text):
+                return
+            yield pgn_text
+
+    @property
+    def partial(self):
+        # Why the result covers less than was asked for, or None when it is whole
+        if self.reason is None and self.truncated_games:
+            return 'plies'
+        return self.reason
+
+    def note(self, analyzed):
+        lines = []
+        if self.reason is not None:
+            lines.append(f"> ⚠️ **Qisman natija:** {REASONS[self.reason]}, shuning uchun faqat {analyzed} ta o'yin tahlil qilindi.")
+        if self.truncated_games:
+            lines.append(f"> ⚠️ {self.truncated_games} ta juda uzun o'yinning faqat dastlabki {self.max_plies} yarim yurishi tahlil qilindi.")
+        return "\n>\n".join(lines) or None
+
+
+def current_budget():
+    return _current_budget.get()
+
+
+@contextmanager
+def budget_scope(budget):
+    # Gradio may resume generators on other threads, so avoid token-based resets
+    previous = _current_budget.get()
+    _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.set(previous)
@@ -0,0 +1,205 @@
+import os
+import json
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_SIZE = int(os.environ.get('ANALYSIS_CACHE_SIZE', 20000))
+ANALYSIS_CACHE_PATH = os.environ.get('ANALYSIS_CACHE_PATH')
+
+_analysis_cache = None
+_analysis_cache_lock = threading.Lock()
+
+
+def game_cache_key(pgn_text, username, version, data_version=''):
+    # Whitespace and line wrapping do not change the key, moves and headers do.
+    # data_version covers reference data the analysis reads, like the openings
+    normalized = " ".join(pgn_text.split())
+    if data_version:
+        version = f"{version}+{data_version}"
+    payload = f"{version}\0{username.strip().lower()}\0{normalized}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AnalysisCache:
+    def __init__(self, version, max_entries=ANALYSIS_CACHE_SIZE, path=None, data_version=''):
+        self.version = version
+        self.data_version = data_version
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+
+        if path:
+            self._open_disk(path)
+
+    def _open_disk(self, path):
+        try:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS game_analyses (key TEXT PRIMARY KEY, version INTEGER NOT NULL, value TEXT NOT NULL)"
+            )
+            self.db.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            removed = self.db.execute("DELETE FROM game_analyses WHERE version != ?", (self.version,)).rowcount
+            if removed:
+                logger.info(f"Dropped {removed} cached analyses from older analyzer versions")
+            # Rows keyed under other reference data can never be hit again
+            row = self.db.execute("SELECT value FROM cache_meta WHERE name = 'data_version'").fetchone()
+            if row is None or row[0] != self.data_version:
+                removed = self.db.execute("DELETE FROM game_analyses").rowcount
+                if removed:
+                    logger.info(f"Dropped {removed} cached analyses built from other opening data")
+            self.db.execute("INSERT OR REPLACE INTO cache_meta (name, value) VALUES ('data_version', ?)", (self.data_version,))
+            self.db.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Analysis cache disk tier disabled: {str(e)}")
+            self.db = None
+
+    def key(self, pgn_text, username):
+        return game_cache_key(pgn_text, username, self.version, self.data_version)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                metrics.inc('cache_requests_total', cache='analysis', result='hit')
+                return value
+
+            if self.db is not None:
+                row = self.db.execute("SELECT value FROM game_analyses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value = tuple(json.loads(row[0]))
+                    self._remember(key, value)
+                    self.hits += 1
+                    metrics.inc('cache_requests_total', cache='analysis', result='disk_hit')
+                    return value
+
+            self.misses += 1
+            metrics.inc('cache_requests_total', cache='analysis', result='miss')
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self._remember(key, value)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO game_analyses (key, version, value) VALUES (?, ?, ?)",
+                    (key, self.version, json.dumps(value))
+                )
+
+    def flush(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM game_analyses")
+                self.db.commit()
+
+    def _remember(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+def get_analysis_cache():
+    global _analysis_cache
+    with _analysis_cache_lock:
+        if _analysis_cache is None:
+            from core.core import ANALYZER_VERSION
+            from core.openings import opening_data_fingerprint
+            _analysis_cache = AnalysisCache(ANALYZER_VERSION, ANALYSIS_CACHE_SIZE, ANALYSIS_CACHE_PATH, opening_data_fingerprint())
+        return _analysis_cache
+
+
+class TTLCache:
+    def __init__(self, max_entries, ttl, name='ttl'):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    metrics.inc('cache_requests_total', cache=self.name, result='hit')
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            metrics.inc('cache_requests_total', cache=self.name, result='miss')
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share the first caller's result
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.shared = 0
+
+    def join(self, key):
+        # Returns (future, is_leader); the leader must call finish() exactly once
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = Future()
+            self.calls[key] = future
+            return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        with self.lock:
+            if self.calls.get(key) is future:
+                del self.calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn):
+        future, leader = self.join(key)
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except Exception as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result=result)
+        return result
@@ -1,39 +1,191 @@
+import os
+import re
 import logging
-import requests
 import time
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from core.puzzles import get_puzzle_store
+from core.ratelimit import RATE_LIMIT_RETRIES, THROTTLED_STATUSES, get_limiter, parse_retry_after, throttle
+from core import metrics
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+CHESS_COM_API_URL = os.environ.get('CHESS_COM_API_URL', 'https://api.chess.com/pub').rstrip('/')
+ARCHIVE_FETCH_CONCURRENCY = int(os.environ.get('ARCHIVE_FETCH_CONCURRENCY', 3))
+ARCHIVE_CACHE_SIZE = int(os.environ.get('ARCHIVE_CACHE_SIZE', 2000))
+ARCHIVE_MONTH_REGEX = re.compile(r'/(\d{4})/(\d{2})/?$')
+
+_session = None
+_session_lock = threading.Lock()
+_archive_cache = OrderedDict()
+_archive_cache_lock = threading.Lock()
+
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(4, ARCHIVE_FETCH_CONCURRENCY * 2))
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+            _session.headers.update({'User-Agent': 'Mozilla/5.0'})
+        return _session
+
+
+def _send(url, service, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = _get_session().get(url, **kwargs)
+    except Exception:
+        metrics.inc('external_calls_total', service=service, status='error')
+        raise
+    finally:
+        metrics.observe('external_call_seconds', time.perf_counter() - start, service=service)
+    metrics.inc('external_calls_total', service=service, status=str(response.status_code))
+    return response
+
+
+def _http_get(url, service, **kwargs):
+    # Every outbound call takes a token from the service's shared bucket; a
+    # throttling answer pauses the bucket and is retried with backoff
+    limiter = get_limiter(service)
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        limiter.acquire()
+        response = _send(url, service, **kwargs)
+        if response.status_code not in THROTTLED_STATUSES or attempt == RATE_LIMIT_RETRIES:
+            return response
+        throttle(service, attempt, parse_retry_after(response.headers.get('Retry-After')))
+    return response
+
+
+def _status_error(response, not_found):
+    if response.status_code == 404:
+        return not_found
+    if response.status_code in THROTTLED_STATUSES:
+        return "❌ Chess.com hozir juda ko'p so'rov olmoqda. Birozdan keyin qayta urinib ko'ring."
+    return f"❌ Chess.com xatosi ({response.status_code}). Birozdan keyin qayta urinib ko'ring."
+
+
+def archive_month(archive_url):
+    match = ARCHIVE_MONTH_REGEX.search(archive_url)
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def _is_closed_archive(archive_url):
+    # Past months never change; allow a day for games that finished after midnight
+    month = archive_month(archive_url)
+    if month is None:
+        return False
+    settled = datetime.now(timezone.utc) - timedelta(days=1)
+    return month < (settled.year, settled.month)
+
+
+def _get_cached_archive(archive_url):
+    with _archive_cache_lock:
+        cached = _archive_cache.get(archive_url)
+        if cached is not None:
+            _archive_cache.move_to_end(archive_url)
+        return cached
+
+
+def _store_archive(archive_url, entry):
+    with _archive_cache_lock:
+        _archive_cache[archive_url] = entry
+        _archive_cache.move_to_end(archive_url)
+        while len(_archive_cache) > ARCHIVE_CACHE_SIZE:
+            _archive_cache.popitem(last=False)
+
+
+def fetch_archive_games(archive_url, required=False):
+    # required: a failed month raises instead of reading as a month without games
+    cached = _get_cached_archive(archive_url)
+    if cached is not None and cached['closed']:
+        metrics.inc('cache_requests_total', cache='chess_com_archive', result='hit')
+        return cached['games']
+    
+    headers = {}
+    if cached is not None:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+    
+    try:
+        response = _http_get(archive_url, 'chess_com', timeout=10, headers=headers)
+    except TimeoutError:
+        # The request ran out of time waiting for a rate-limit token
+        if required:
+            raise
+        logger.warning(f"Archive fetch skipped, request out of time: {archive_url}")
+        return cached['games'] if cached is not None else []
+    
+    if response.status_code == 304 and cached is not None:
+        metrics.inc('cache_requests_total', cache='chess_com_archive', result='revalidated')
+        return cached['games']
+    metrics.inc('cache_requests_total', cache='chess_com_archive', result='miss')
+    if response.status_code != 200:
+        logger.warning(f"Archive fetch failed ({response.status_code}): {archive_url}")
+        if cached is not None:
+            return cached['games']
+        if required:
+            raise RuntimeError(f"Chess.com archive fetch failed ({response.status_code}): {archive_url}")
+        return []
+    
+    games = response.json()['games']
+    _store_archive(archive_url, {
+        'games': games,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'closed': _is_closed_archive(archive_url)
+    })
+    return games
+
+
+def fetch_archive_list(username):
+    # Monthly archive URLs, oldest first
+    username = username.strip().lower()
+
+    user_url = f"{CHESS_COM_API_URL}/player/{username}"
+    response = _http_get(user_url, 'chess_com', timeout=10)
+    
+    if response.status_code != 200:
+        return None, _status_error(response, f"❌ Foydalanuvchi topilmadi: {username}")
+    
+    archives_url = f"{CHESS_COM_API_URL}/player/{username}/games/archives"
+    response = _http_get(archives_url, 'chess_com', timeout=10)
+    
+    if response.status_code != 200:
+        return None, _status_error(response, "❌ O'yinlar arxivi topilmadi.")
+    
+    archives = response.json()['archives']
+    if not archives:
+        return None, "❌ O'yinlar topilmadi."
+    return archives, None
+
 
 def get_user_games_from_chess_com(username):
     try:
         logger.info(f"Fetching games for: {username}")
-        username = username.strip().lower()
-        
-        user_url = f"https://api.chess.com/pub/player/{username}"
-        response = requests.get(user_url, timeout=10, headers={'User-Agent': 'Mozilla/5.0'})
-        
-        if response.status_code != 200:
-            return None, f"❌ Foydalanuvchi topilmadi: {username}"
+        archives, error = fetch_archive_list(username)
+        if error:
+            return None, error
         
-        archives_url = f"https://api.chess.com/pub/player/{username}/games/archives"
-        response = requests.get(archives_url, timeout=10, headers={'User-Agent': 'Mozilla/5.0'})
-        
-        if response.status_code != 200:
-            return None, "❌ O'yinlar arxivi topilmadi."
-        
-        archives = response.json()['archives']
-        if not archives:
-            return None, "❌ O'yinlar topilmadi."
+        recent_archives = list(reversed(archives[-3:]))
+        # Run each fetch in a copy of this context so per-request metrics see it
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=ARCHIVE_FETCH_CONCURRENCY) as executor:
+            archive_games = list(executor.map(lambda url: context.copy().run(fetch_archive_games, url), recent_archives))
         
         all_games = []
-        for archive_url in reversed(archives[-3:]):
-            time.sleep(0.3)
-            response = requests.get(archive_url, timeout=10, headers={'User-Agent': 'Mozilla/5.0'})
-            if response.status_code == 200:
-                games = response.json()['games']
-                all_games.extend(games)
+        for games in archive_games:
+            all_games.extend(games)
             if len(all_games) >= 50:
                 break
         
@@ -72,54 +224,16 @@ def fetch_lichess_puzzles(error_types, user_rating=1500, count=5):
         if error_type in theme_mapping:
             lichess_themes.extend(theme_mapping[error_type])
     
-    lichess_themes = list(set(lichess_themes))
+    lichess_themes = list(dict.fromkeys(lichess_themes))
     
     if not lichess_themes:
         lichess_themes = ["tactics"]
     
     try:
-        for theme in lichess_themes[:3]:  # Limit to top 3 themes
-            if len(puzzles) >= count:
-                break
-                
-            url = f"https://lichess.org/api/puzzle/daily"
-            headers = {'Accept': 'application/json'}
-            
-            params = {
-                'max': count,
-                'theme': theme
-            }
-            
-            try:
-                response = requests.get(
-                    "https://lichess.org/api/puzzle/activity",
-                    headers=headers,
-                    timeout=10
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    
-                    # Filter by rating range
-                    for item in data.get('puzzles', []):
-                        if len(puzzles) >= count:
-                            break
-                            
-                        puzzle_rating = item.get('puzzle', {}).get('rating', 1500)
-                        
-                        if abs(puzzle_rating - user_rating) <= 300:
-                            puzzle_id = item.get('puzzle', {}).get('id')
-                            puzzle_themes = item.get('puzzle', {}).get('themes', [])
-                            
-                            puzzles.append({
-                                'id': puzzle_id,
-                                'url': f"https://lichess.org/training/{puzzle_id}",
-                                'theme': theme.title(),
-                                'rating': puzzle_rating,
-                                'themes': puzzle_themes
-                            })
-            except:
-                pass
+        # Local indexed store built from the Lichess puzzle dump, see core/puzzles.py
+        store = get_puzzle_store()
+        if store is not None:
+            puzzles = store.find_puzzles(lichess_themes[:3], user_rating, count, window=300)
         
         # If no puzzles found, provide generic training links
         if not puzzles:
@@ -145,4 +259,4 @@ def fetch_lichess_puzzles(error_types, user_rating=1500, count=5):
                 'themes': [theme]
             })
     
-    return puzzles
\ No newline at end of file
+    return puzzles
@@ -0,0 +1,93 @@
+# Deterministic coaching text built from the same statistics the AI prompt
+# gets, shown when the model is unavailable or misses its deadline
+
+ADVICE = {
+    "Qo'pol xatolar": "Har bir yurishdan oldin raqibning shaxlari, urishlari va hujumlarini tekshiring. Kuniga 10 ta taktik masala yeching.",
+    'Kichik xatolar': "Har bir o'yinda aniq reja tuzing va passiv figuralarni faollashtiring. O'yinlaringizni kompyuter bilan tahlil qilib, baho keskin o'zgargan yurishlarni yozib boring.",
+    'Himoyasiz qoldirish': "Yurish qilgandan keyin har bir figurangiz himoyalanganini tekshiring. \"Hanging piece\" mavzusidagi masalalarni yeching.",
+    'Debyut xatolari': "Debyut tamoyillarini takrorlang: markazni egallang, figuralarni tez rivojlantiring va shohni erta xavfsiz joyga olib boring.",
+    "O'rta o'yin xatolari": "Vilka, bog'lash va ochiq hujum kabi taktik usullarni kuniga 15 daqiqa mashq qiling, ustalar o'yinlaridagi rejalarni o'rganing.",
+    'Endshpil xatolari': "Piyoda va ladya endshpillari hamda opozitsiyani o'rganing. Haftasiga 2-3 marta endshpil pozitsiyalarini bot bilan o'ynab ko'ring."
+}
+
+PUZZLE_THEMES = {
+    "Qo'pol xatolar": "taktika va himoya",
+    'Kichik xatolar': "pozitsion ustunlik",
+    'Himoyasiz qoldirish': "himoyasiz figuralar",
+    'Debyut xatolari': "debyut tuzoqlari",
+    "O'rta o'yin xatolari": "vilka va bog'lash",
+    'Endshpil xatolari': "endshpil"
+}
+
+PHASES = {
+    'Debyut xatolari': "debyut",
+    "O'rta o'yin xatolari": "o'rta o'yin",
+    'Endshpil xatolari': "endshpil"
+}
+
+RESOURCES = (
+    "- **Kitoblar:** Irving Chernev - \"Logical Chess: Move by Move\"; Jeremy Silman - \"Silman's Complete Endgame Course\"",
+    "- **Onlayn kurslar:** Uzchess kurslari, Chess.com Lessons, Lichess Practice",
+    "- **YouTube:** Daniel Naroditsky, GothamChess, ChessNetwork",
+    "- **Mashq:** Lichess Puzzle Storm va o'z reytingingizdan biroz kuchliroq botlar bilan sekin o'yinlar"
+)
+
+MIN_OPENING_GAMES = 3
+
+
+def _win_rate(stats):
+    return stats['wins'] / stats['total'] if stats['total'] else 0.0
+
+
+def build_template_report(weaknesses, opening_stats, color_stats, total_games):
+    lines = [
+        "_AI murabbiy hozircha javob bera olmadi. Quyidagi tavsiyalar statistikangiz asosida avtomatik tuzildi._",
+        "",
+        "### 1. Zaif tomonlar tahlili",
+        ""
+    ]
+    if weaknesses:
+        for w in weaknesses[:5]:
+            advice = ADVICE.get(w['category'], "Bu turdagi xatolarni o'yinlaringizda qidirib, sababini yozib boring.")
+            lines.append(f"- **{w['category']}** ({w['count']} marta, {w['percentage']:.1f}%): {advice}")
+    else:
+        lines.append(f"- {total_games} ta o'yinda jiddiy xatolar topilmadi. Darajangizni saqlash uchun muntazam o'ynang.")
+
+    top = weaknesses[0]['category'] if weaknesses else None
+    lines += [
+        "",
+        "### 2. Shaxsiy o'quv rejasi",
+        "",
+        f"- Har kuni 20-30 daqiqa masala yeching, asosiy mavzu: **{PUZZLE_THEMES.get(top, 'umumiy taktika')}**",
+        "- Haftasiga kamida 3 ta rapid yoki klassik o'yin o'ynang va har birini o'yindan keyin tahlil qiling",
+        "- Debyut repertuaringizni 1-2 ta tizim bilan cheklang va ularning asosiy g'oyalarini yozib oling"
+    ]
+    phase = next((PHASES[w['category']] for w in weaknesses if w['category'] in PHASES), None)
+    if phase:
+        lines.append(f"- Eng ko'p xato qilinadigan bosqich: **{phase}**. Mashg'ulot vaqtining uchdan birini shu bosqichga ajrating")
+
+    lines += ["", "### 3. Tavsiya etilgan resurslar", ""]
+    lines += RESOURCES
+
+    lines += ["", "### 4. Debyut tavsiyalari", ""]
+    played = sorted(((name, stats) for name, stats in opening_stats.items() if stats['total'] >= MIN_OPENING_GAMES),
+                    key=lambda item: (-_win_rate(item[1]), -item[1]['total'], item[0]))
+    if played:
+        best_name, best = played[0]
+        lines.append(f"- **{best_name}** eng yaxshi natijangiz ({_win_rate(best) * 100:.0f}% g'alaba, {best['total']} o'yin). Uni davom ettiring")
+        worst_name, worst = played[-1]
+        if len(played) > 1 and _win_rate(worst) < 0.4:
+            lines.append(f"- **{worst_name}** natijalari past ({_win_rate(worst) * 100:.0f}% g'alaba, {worst['total']} o'yin). Uni chuqurroq o'rganing yoki boshqa tizimga o'ting")
+    else:
+        lines.append(f"- Debyut bo'yicha xulosa qilish uchun o'yinlar kam (har bir debyutda kamida {MIN_OPENING_GAMES} ta o'yin kerak)")
+
+    lines += ["", "### 5. Xulosa", ""]
+    white_total = sum(color_stats['white'].values())
+    black_total = sum(color_stats['black'].values())
+    if white_total and black_total:
+        white_rate = color_stats['white']['wins'] / white_total
+        black_rate = color_stats['black']['wins'] / black_total
+        weaker = 'qora' if black_rate < white_rate else 'oq'
+        lines.append(f"Oq figuralar bilan {white_rate * 100:.0f}%, qora figuralar bilan {black_rate * 100:.0f}% g'alaba qozongansiz; {weaker} figuralar bilan o'yiningizga ko'proq e'tibor bering.")
+    lines.append("Har kuni oz-ozdan, lekin muntazam shug'ullansangiz, natija albatta ko'rinadi. Omad!")
+    return "\n".join(lines)
@@ -0,0 +1,106 @@
+from array import array
+from collections import Counter
+from itertools import compress, repeat
+from operator import add, mul
+
+# Small integer codes; 0 stands for anything the analyzer did not label
+MISTAKE_TYPES = ('', 'blunder', 'mistake', 'hanging_piece')
+PHASES = ('', 'opening', 'middlegame', 'endgame')
+RESULTS = ('', 'win', 'loss', 'draw')
+NO_COLOR = -1
+NO_ELO = -1
+
+_TYPE_CODES = {name: code for code, name in enumerate(MISTAKE_TYPES) if name}
+_PHASE_CODES = {name: code for code, name in enumerate(PHASES) if name}
+_RESULT_CODES = {name: code for code, name in enumerate(RESULTS) if name}
+
+
+class AnalysisTable:
+    # One row per game and one per mistake in parallel typed arrays; aggregates
+    # are Counter group-bys over the code columns instead of walking dicts
+    def __init__(self):
+        self.openings = []
+        self.opening_codes = {}
+
+        self.game_openings = array('I')
+        self.game_colors = array('b')
+        self.game_results = array('B')
+        self.game_plies = array('I')
+        self.game_elos = array('i')
+
+        self.mistake_games = array('I')
+        self.mistake_types = array('B')
+        self.mistake_phases = array('B')
+        self.mistake_moves = array('I')
+
+    @classmethod
+    def from_analyses(cls, analyses):
+        table = cls()
+        for analysis in analyses:
+            table.append(analysis)
+        return table
+
+    def __len__(self):
+        return len(self.game_openings)
+
+    def _opening_code(self, opening):
+        code = self.opening_codes.get(opening)
+        if code is None:
+            code = self.opening_codes[opening] = len(self.openings)
+            self.openings.append(opening)
+        return code
+
+    def append(self, analysis, elo=None):
+        game = len(self.game_openings)
+        user_color = analysis.get('user_color')
+
+        self.game_openings.append(self._opening_code(analysis['opening']))
+        self.game_colors.append(NO_COLOR if user_color is None else int(user_color))
+        self.game_results.append(_RESULT_CODES.get(analysis.get('user_result'), 0))
+        self.game_plies.append(analysis.get('plies', 0))
+        self.game_elos.append(NO_ELO if elo is None else elo)
+
+        for mistake in analysis.get('mistakes', []):
+            self.mistake_games.append(game)
+            self.mistake_types.append(_TYPE_CODES.get(mistake.get('type'), 0))
+            self.mistake_phases.append(_PHASE_CODES.get(mistake.get('phase'), 0))
+            self.mistake_moves.append(mistake.get('move_number') or 0)
+
+    @property
+    def mistake_count(self):
+        return len(self.mistake_types)
+
+    def total_plies(self):
+        return sum(self.game_plies)
+
+    def elos(self):
+        return [elo for elo in self.game_elos if elo != NO_ELO]
+
+    def mistake_type_counts(self):
+        counts = Counter(self.mistake_types)
+        return {name: counts[code] for code, name in enumerate(MISTAKE_TYPES) if name}
+
+    def mistake_phase_counts(self):
+        counts = Counter(self.mistake_phases)
+        return {name: counts[code] for code, name in enumerate(PHASES) if name}
+
+    def tally(self, opening_stats, color_stats):
+        # Same totals as calling update_stats per game: games without a user
+        # color are skipped, and openings keep their first-seen order
+        colored = array('b', map(NO_COLOR.__ne__, self.game_colors))
+        result_width = len(RESULTS)
+
+        opening_totals = Counter(compress(self.game_openings, colored))
+        opening_results = Counter(compress(map(add, map(mul, self.game_openings, repeat(result_width)), self.game_results), colored))
+        for code, total in opening_totals.items():
+            stats = opening_stats[self.openings[code]]
+            stats['total'] += total
+            stats['wins'] += opening_results[code * result_width + _RESULT_CODES['win']]
+            stats['losses'] += opening_results[code * result_width + _RESULT_CODES['loss']]
+            stats['draws'] += opening_results[code * result_width + _RESULT_CODES['draw']]
+
+        color_results = Counter(compress(map(add, map(mul, self.game_colors, repeat(result_width)), self.game_results), colored))
+        for color_key, color in (('white', 1), ('black', 0)):
+            color_stats[color_key]['wins'] += color_results[color * result_width + _RESULT_CODES['win']]
+            color_stats[color_key]['losses'] += color_results[color * result_width + _RESULT_CODES['loss']]
+            color_stats[color_key]['draws'] += color_results[color * result_width + _RESULT_CODES['draw']]
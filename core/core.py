@@ -2,61 +2,148 @@
 import chess
 import chess.pgn
 import io
+import os
 import re
+import time
 import logging
+import threading
+import contextvars
 from collections import defaultdict
-from core.ai_integration import get_comprehensive_analysis
-from core.openings import detect_opening, load_opening_database
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from core.ai_integration import AI_TIMEOUT, get_comprehensive_analysis, stream_comprehensive_analysis
+from core.budget import REASONS, RequestBudget, budget_scope, current_budget
+from core.coaching import build_template_report
+from core.openings import detect_opening, detect_opening_from_headers, load_opening_database, get_opening_trie
 from core.chess_api import get_user_games_from_chess_com, fetch_lichess_puzzles
+from core.parallel import analyze_pgn_content
+from core.ingest import PgnFile
+from core.warehouse import get_warehouse
+from core.material import MaterialTracker
+from core.see import is_hanging
+from core.positions import POSITION_CACHE_PLIES, ZobristTracker, get_position_cache
+from core.columnar import AnalysisTable
+from core import metrics
 
 logger = logging.getLogger(__name__)
 
+PUZZLE_TIMEOUT = float(os.environ.get('PUZZLE_TIMEOUT', 5))
+# The puzzle lookup is a local read, so a request past its deadline still
+# waits this long for it rather than showing a partial result without puzzles
+PUZZLE_MIN_TIMEOUT = float(os.environ.get('PUZZLE_MIN_TIMEOUT', 0.5))
+FANOUT_WORKERS = int(os.environ.get('FANOUT_WORKERS', 16))
+
+CANCELLED_OUTPUTS = ("❌ So'rov bekor qilindi", "", "", "", None, None, None, None, None)
+
+_fanout_executor = None
+_fanout_lock = threading.Lock()
+
+def extract_user_elo(headers, username_lower):
+    if username_lower == headers.get("White", "").strip().lower():
+        elo = headers.get("WhiteElo", "")
+    elif username_lower == headers.get("Black", "").strip().lower():
+        elo = headers.get("BlackElo", "")
+    else:
+        return None
+    
+    if elo and elo.isdigit():
+        return int(elo)
+    return None
+
 def extract_user_rating(games, username):
     ratings = []
     username_lower = username.strip().lower()
     
     for game in games:
-        white_player = game.headers.get("White", "").strip().lower()
-        black_player = game.headers.get("Black", "").strip().lower()
-        
-        if username_lower == white_player:
-            white_elo = game.headers.get("WhiteElo", "")
-            if white_elo and white_elo.isdigit():
-                ratings.append(int(white_elo))
-        
-        elif username_lower == black_player:
-            black_elo = game.headers.get("BlackElo", "")
-            if black_elo and black_elo.isdigit():
-                ratings.append(int(black_elo))
+        elo = extract_user_elo(game.headers, username_lower)
+        if elo is not None:
+            ratings.append(elo)
     
+    return average_rating(ratings)
+
+def average_rating(ratings):
     if ratings:
         avg_rating = sum(ratings) // len(ratings)
         return avg_rating
     
     return 1500
 
-def analyze_games(username_chesscom, pgn_file, username_pgn):
+def new_opening_stats():
+    return defaultdict(lambda: {'wins': 0, 'losses': 0, 'draws': 0, 'total': 0})
+
+def new_color_stats():
+    return {
+        'white': {'wins': 0, 'losses': 0, 'draws': 0},
+        'black': {'wins': 0, 'losses': 0, 'draws': 0}
+    }
+
+def update_stats(analysis, opening_stats, color_stats):
+    opening = analysis['opening']
+    user_result = analysis.get('user_result')
+    user_color = analysis['user_color']
+    
+    if user_color is not None:
+        opening_stats[opening]['total'] += 1
+        
+        if user_result == 'win':
+            opening_stats[opening]['wins'] += 1
+            color_key = 'white' if user_color == chess.WHITE else 'black'
+            color_stats[color_key]['wins'] += 1
+        elif user_result == 'loss':
+            opening_stats[opening]['losses'] += 1
+            color_key = 'white' if user_color == chess.WHITE else 'black'
+            color_stats[color_key]['losses'] += 1
+        elif user_result == 'draw':
+            opening_stats[opening]['draws'] += 1
+            color_key = 'white' if user_color == chess.WHITE else 'black'
+            color_stats[color_key]['draws'] += 1
+
+def prepare_analysis(username_chesscom, pgn_file, username_pgn):
     actual_username = None
     pgn_content = None
     user_rating = 1500  # Default rating
 
     if username_chesscom:
-        pgn_content, error = get_user_games_from_chess_com(username_chesscom)
+        warehouse = get_warehouse()
+        if warehouse is not None:
+            # Only games newer than the stored history are fetched and analyzed
+            _, error = warehouse.sync(username_chesscom)
+            if error:
+                return None, (error, "", "", "", None, None, None, None, None)
+            with metrics.stage('aggregate'):
+                analysis_inputs = warehouse.analysis_inputs(username_chesscom)
+            summary = summarize_analyses(*analysis_inputs)
+            if summary is None:
+                return None, (no_games_message(), "", "", "", None, None, None, None, None)
+            return note_budget(summary), None
+        
+        with metrics.stage('fetch'):
+            pgn_content, error = get_user_games_from_chess_com(username_chesscom)
         if error:
-            return error, "", "", "", None, None, None, None, None
+            return None, (error, "", "", "", None, None, None, None, None)
         actual_username = username_chesscom
     
     elif pgn_file:
-        pgn_content = pgn_file.decode('utf-8') if isinstance(pgn_file, bytes) else pgn_file
+        if isinstance(pgn_file, str) and os.path.isfile(pgn_file):
+            # Uploads arrive as a path on disk; the file is indexed in place, not read into memory
+            try:
+                pgn_content = PgnFile(pgn_file)
+            except Exception as e:
+                logger.error(f"Failed to open PGN upload: {str(e)}")
+                return None, (f"❌ PGN faylni o'qib bo'lmadi: {str(e)}", "", "", "", None, None, None, None, None)
+        else:
+            pgn_content = pgn_file.decode('utf-8') if isinstance(pgn_file, bytes) else pgn_file
         
         if username_pgn and username_pgn.strip():
             actual_username = username_pgn.strip()
         else:
             try:
-                first_game = chess.pgn.read_game(io.StringIO(pgn_content))
-                if first_game:
-                    white = first_game.headers.get("White", "")
-                    black = first_game.headers.get("Black", "")
+                if isinstance(pgn_content, PgnFile):
+                    first_headers = pgn_content.first_headers()
+                else:
+                    first_headers = chess.pgn.read_headers(io.StringIO(pgn_content))
+                if first_headers:
+                    white = first_headers.get("White", "")
+                    black = first_headers.get("Black", "")
                     actual_username = white if white else black if black else "Player"
                 else:
                     actual_username = "Player"
@@ -64,57 +151,71 @@ def analyze_games(username_chesscom, pgn_file, username_pgn):
                 actual_username = "Player"
     
     else:
-        return "❌ Chess.com foydalanuvchi nomini kiriting yoki PGN faylni yuklang", "", "", "", None, None, None, None, None
+        return None, ("❌ Chess.com foydalanuvchi nomini kiriting yoki PGN faylni yuklang", "", "", "", None, None, None, None, None)
 
-    games = parse_pgn_content(pgn_content)
-    
-    if not games:
-        return "❌ O'yinlar topilmadi yoki tahlil qilinmadi", "", "", "", None, None, None, None, None
+    try:
+        summary = summarize_games(pgn_content, actual_username)
+    finally:
+        if isinstance(pgn_content, PgnFile):
+            pgn_content.close()
+    if summary is None:
+        return None, (no_games_message(), "", "", "", None, None, None, None, None)
+    return note_budget(summary), None
+
+def no_games_message():
+    # A request stopped before its first game must not read as an empty upload
+    budget = current_budget()
+    if budget is not None and budget.reason is not None:
+        return f"❌ Qisman natija: {REASONS[budget.reason]}, hech bir o'yin tahlil qilinmadi"
+    return "❌ O'yinlar topilmadi yoki tahlil qilinmadi"
+
+def note_budget(summary):
+    # A report built from part of the games says so at the top
+    budget = current_budget()
+    if budget is None:
+        return summary
+    summary['partial'] = budget.partial
+    note = budget.note(len(summary['analyses']))
+    if note:
+        summary['report'] = f"{note}\n\n{summary['report']}"
+    return summary
+
+def summarize_games(pgn_content, username):
+    # Parsing and move analysis are fused in one pass, so they share a stage
+    with metrics.stage('analyze'):
+        all_analyses, opening_stats, color_stats, user_rating = analyze_pgn_content(pgn_content, username)
+    metrics.inc('games_analyzed_total', len(all_analyses))
+    metrics.inc('moves_analyzed_total', all_analyses.total_plies())
+    return summarize_analyses(all_analyses, opening_stats, color_stats, user_rating)
+
+def summarize_analyses(all_analyses, opening_stats, color_stats, user_rating):
+    if not all_analyses:
+        return None
     
-    # Extract user rating from games
-    user_rating = extract_user_rating(games, actual_username)
     logger.info(f"Extracted user rating: {user_rating}")
     
-    all_analyses = []
-    opening_stats = defaultdict(lambda: {'wins': 0, 'losses': 0, 'draws': 0, 'total': 0})
-    color_stats = {
-        'white': {'wins': 0, 'losses': 0, 'draws': 0},
-        'black': {'wins': 0, 'losses': 0, 'draws': 0}
+    with metrics.stage('aggregate'):
+        weaknesses = categorize_mistakes(all_analyses)
+    
+    with metrics.stage('report'):
+        full_report = build_stats_report(all_analyses, weaknesses, opening_stats, color_stats, user_rating)
+    
+    summary = {
+        'analyses': all_analyses,
+        'weaknesses': weaknesses,
+        'opening_stats': opening_stats,
+        'color_stats': color_stats,
+        'user_rating': user_rating,
+        'report': full_report
     }
+    return summary
+
+def build_stats_report(all_analyses, weaknesses, opening_stats, color_stats, user_rating):
+    table = as_analysis_table(all_analyses)
     
-    for game in games:
-        analysis = analyze_game_detailed(game, actual_username)
-        all_analyses.append(analysis)
-        
-        opening = analysis['opening']
-        user_result = analysis.get('user_result')
-        user_color = analysis['user_color']
-        
-        if user_color is not None:
-            opening_stats[opening]['total'] += 1
-            
-            if user_result == 'win':
-                opening_stats[opening]['wins'] += 1
-                color_key = 'white' if user_color == chess.WHITE else 'black'
-                color_stats[color_key]['wins'] += 1
-            elif user_result == 'loss':
-                opening_stats[opening]['losses'] += 1
-                color_key = 'white' if user_color == chess.WHITE else 'black'
-                color_stats[color_key]['losses'] += 1
-            elif user_result == 'draw':
-                opening_stats[opening]['draws'] += 1
-                color_key = 'white' if user_color == chess.WHITE else 'black'
-                color_stats[color_key]['draws'] += 1
-    
-    weaknesses = categorize_mistakes(all_analyses)
-    
-    all_mistakes = []
-    for analysis in all_analyses:
-        all_mistakes.extend(analysis.get('mistakes', []))
-    
-    stats_report = f"## 📊 {len(games)} ta o'yin tahlili\n\n"
+    stats_report = f"## 📊 {len(all_analyses)} ta o'yin tahlili\n\n"
     stats_report += f"**Sizning o'rtacha reytingingiz:** {user_rating}\n\n"
-    stats_report += f"**Jami xatolar:** {len(all_mistakes)} ta\n\n"
+    stats_report += f"**Jami xatolar:** {table.mistake_count} ta\n\n"
     
     stats_report += "### 🎯 Eng zaif 5 tomoningiz:\n\n"
     if weaknesses:
@@ -155,16 +256,20 @@ def analyze_games(username_chesscom, pgn_file, username_pgn):
         color_report += f"- Yutqazishlar: {color_stats['black']['losses']}\n"
         color_report += f"- Duranglar: {color_stats['black']['draws']}\n"
     
-    full_report = stats_report + opening_report + color_report
-    
-    ai_analysis = get_comprehensive_analysis(weaknesses, opening_stats, color_stats, len(games))
-    ai_report = f"## 🤖 AI Murabbiy: To'liq Tahlil va O'quv Rejasi\n\n{ai_analysis}"
-    
+    return stats_report + opening_report + color_report
+
+def build_ai_report(ai_analysis):
+    return f"## 🤖 AI Murabbiy: To'liq Tahlil va O'quv Rejasi\n\n{ai_analysis}"
+
+def fetch_puzzles_for(weaknesses, user_rating):
     weakness_themes = [w['category'] for w in weaknesses[:5]]
-    puzzles = fetch_lichess_puzzles(weakness_themes, user_rating=user_rating, count=5)
-    
+    return fetch_lichess_puzzles(weakness_themes, user_rating=user_rating, count=5)
+
+def format_puzzle_report(puzzles, user_rating):
     puzzle_text = "## 🧩 Sizning shaxsiy masalalaringiz\n\n"
     puzzle_text += f"Sizning reytingingiz: **{user_rating}** - Masalalar shu darajaga moslashtirilgan\n\n"
+    if not puzzles:
+        puzzle_text += "Masalalarni hozircha yuklab bo'lmadi - [Lichess Training](https://lichess.org/training) bo'limida mashq qiling.\n\n"
     for i, puzzle in enumerate(puzzles, 1):
         theme = puzzle.get('theme', 'Tactics')
         rating = puzzle.get('rating', user_rating)
@@ -172,6 +277,12 @@ def analyze_games(username_chesscom, pgn_file, username_pgn):
         puzzle_text += f"**Puzzle {i}: {theme}** (Rating: {rating})\n"
         puzzle_text += f"- [Lichess Training]({url})\n\n"
     
+    return puzzle_text
+
+def build_puzzle_report(weaknesses, user_rating):
+    return format_puzzle_report(fetch_puzzles_for(weaknesses, user_rating), user_rating)
+
+def build_outputs(full_report, ai_report, puzzle_text):
     return (
         full_report,
         ai_report,
@@ -184,6 +295,125 @@ def analyze_games(username_chesscom, pgn_file, username_pgn):
         None
     )
 
+def _prepare_measured(request, username_chesscom, pgn_file, username_pgn):
+    with metrics.profile_if_slow('prepare_analysis'):
+        summary, error = prepare_analysis(username_chesscom, pgn_file, username_pgn)
+    if error:
+        request.outcome = 'error'
+    return summary, error
+
+def _get_fanout_executor():
+    global _fanout_executor
+    with _fanout_lock:
+        if _fanout_executor is None:
+            _fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='fanout')
+        return _fanout_executor
+
+def _submit_stage(request, stage_name, fn, *args):
+    # Each call gets its own context copy so its metrics land on this request
+    context = contextvars.copy_context()
+    def run():
+        with request.stage(stage_name):
+            return fn(*args)
+    return _get_fanout_executor().submit(context.run, run)
+
+def _within_budget(seconds, budget, floor=0.0):
+    # Waits after the analysis share whatever is left of the request deadline
+    remaining = budget.remaining()
+    return seconds if remaining is None else min(seconds, max(remaining, floor))
+
+def _result_within(future, deadline, call, fallback):
+    # A timed-out call keeps running in the pool; the user just stops waiting for it
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeoutError:
+        logger.warning(f"{call} did not finish in time, degrading")
+        metrics.inc('fanout_degraded_total', call=call, reason='timeout')
+    except Exception as e:
+        logger.error(f"{call} failed: {str(e)}")
+        metrics.inc('fanout_degraded_total', call=call, reason='error')
+    return fallback
+
+def analyze_games(username_chesscom, pgn_file, username_pgn):
+    # Runs under the caller's request budget, or a fresh one with the default limits
+    with metrics.request_scope('analyze_games') as request, budget_scope(current_budget() or RequestBudget()) as budget:
+        summary, error = _prepare_measured(request, username_chesscom, pgn_file, username_pgn)
+        if error:
+            return error
+        if budget.cancelled.is_set():
+            return CANCELLED_OUTPUTS
+        
+        # The AI and puzzle calls are independent, so wait for the slower one, not both
+        start = time.monotonic()
+        ai_timeout = _within_budget(AI_TIMEOUT, budget)
+        ai_future = _submit_stage(request, 'ai', get_comprehensive_analysis, summary['weaknesses'], summary['opening_stats'], summary['color_stats'], len(summary['analyses']), ai_timeout)
+        puzzle_future = _submit_stage(request, 'puzzles', fetch_puzzles_for, summary['weaknesses'], summary['user_rating'])
+        
+        puzzles = _result_within(puzzle_future, start + _within_budget(PUZZLE_TIMEOUT, budget, PUZZLE_MIN_TIMEOUT), 'puzzles', [])
+        # The AI call enforces its timeout itself; the extra second only guards against a stuck pool
+        ai_analysis = _result_within(ai_future, start + ai_timeout + 1, 'ai', None)
+        if ai_analysis is None:
+            ai_analysis = build_template_report(summary['weaknesses'], summary['opening_stats'], summary['color_stats'], len(summary['analyses']))
+        
+        return build_outputs(summary['report'], build_ai_report(ai_analysis), format_puzzle_report(puzzles, summary['user_rating']))
+
+def analyze_games_stream(username_chesscom, pgn_file, username_pgn, details=None):
+    # Same outputs as analyze_games, but the report shows up as soon as it is built.
+    # A details dict, when given, receives the summary, puzzles and AI text
+    details = {} if details is None else details
+    with metrics.request_scope('analyze_games_stream') as request, budget_scope(current_budget() or RequestBudget()) as budget:
+        summary, error = _prepare_measured(request, username_chesscom, pgn_file, username_pgn)
+        if not error and budget.cancelled.is_set():
+            error = CANCELLED_OUTPUTS
+        if error:
+            details['error'] = error[0]
+            yield error
+            return
+        details['summary'] = summary
+        
+        full_report = summary['report']
+        start = time.monotonic()
+        ai_timeout = _within_budget(AI_TIMEOUT, budget)
+        puzzle_future = _submit_stage(request, 'puzzles', fetch_puzzles_for, summary['weaknesses'], summary['user_rating'])
+        yield build_outputs(full_report, build_ai_report("⏳ AI murabbiy tahlil qilmoqda..."), "")
+        
+        # Puzzles are shown as soon as they arrive, alongside the streaming AI text.
+        # Time spent waiting on the client between chunks is not counted
+        ai_analysis = ""
+        puzzle_text = ""
+        ai_seconds = 0.0
+        chunk_start = time.perf_counter()
+        for ai_analysis in stream_comprehensive_analysis(summary['weaknesses'], summary['opening_stats'], summary['color_stats'], len(summary['analyses']), ai_timeout):
+            ai_seconds += time.perf_counter() - chunk_start
+            if budget.cancelled.is_set():
+                # Nobody is left to read the rest of the answer
+                details['error'] = CANCELLED_OUTPUTS[0]
+                return
+            if not puzzle_text and puzzle_future.done():
+                details['puzzles'] = _result_within(puzzle_future, start, 'puzzles', [])
+                puzzle_text = format_puzzle_report(details['puzzles'], summary['user_rating'])
+            yield build_outputs(full_report, build_ai_report(ai_analysis), puzzle_text)
+            chunk_start = time.perf_counter()
+        request.record_stage('ai', ai_seconds)
+        details['ai_analysis'] = ai_analysis
+        
+        if not puzzle_text:
+            details['puzzles'] = _result_within(puzzle_future, start + _within_budget(PUZZLE_TIMEOUT, budget, PUZZLE_MIN_TIMEOUT), 'puzzles', [])
+            puzzle_text = format_puzzle_report(details['puzzles'], summary['user_rating'])
+        yield build_outputs(full_report, build_ai_report(ai_analysis), puzzle_text)
+
+def summary_fields(summary):
+    # The JSON-friendly part of a summary, shared by batch records and the job API
+    return {
+        'games': len(summary['analyses']),
+        'user_rating': summary['user_rating'],
+        'weaknesses': summary['weaknesses'],
+        'opening_stats': dict(summary['opening_stats']),
+        'color_stats': summary['color_stats'],
+        'partial': summary.get('partial'),
+        'report': summary['report']
+    }
+
 def parse_pgn_content(pgn_content):
     games = []
     if isinstance(pgn_content, list):
@@ -207,54 +437,85 @@ def parse_pgn_content(pgn_content):
     
     return games
 
-def analyze_game_detailed(game, username):
-    board = game.board()
-    mistakes = []
-    move_number = 0
-    
-    white_player = game.headers.get("White", "").strip().lower()
-    black_player = game.headers.get("Black", "").strip().lower()
-    username_lower = username.strip().lower()
-    
-    user_color = None
-    if username_lower == white_player:
-        user_color = chess.WHITE
-    elif username_lower == black_player:
-        user_color = chess.BLACK
-    
-    result = game.headers.get("Result", "*")
-    opening = detect_opening(game)
-    
-    user_result = None
-    if user_color is not None and result != "*":
-        if result == "1-0":
-            user_result = "win" if user_color == chess.WHITE else "loss"
-        elif result == "0-1":
-            user_result = "win" if user_color == chess.BLACK else "loss"
-        elif result == "1/2-1/2":
-            user_result = "draw"
-    
-    material_values = {chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5, chess.QUEEN: 9}
-    
-    def count_material(board):
-        total = 0
-        for piece_type in material_values:
-            total += len(board.pieces(piece_type, chess.WHITE)) * material_values[piece_type]
-            total -= len(board.pieces(piece_type, chess.BLACK)) * material_values[piece_type]
-        return total
-    
-    for move in game.mainline_moves():
-        move_number += 1
+# Bump whenever the mistake heuristics change so cached analyses are recomputed
+ANALYZER_VERSION = 4
+
+class GameAnalysisVisitor(chess.pgn.BaseVisitor):
+    # Analyzes the mainline while it is parsed, so no GameNode tree is built
+    def __init__(self, username, max_plies=0):
+        self.username_lower = username.strip().lower()
+        self.max_plies = max_plies
+        self.truncated = False
+        self.headers = chess.pgn.Headers({})
+        self.mistakes = []
+        self.move_number = 0
+        self.user_color = None
+        self.pending_move = None
+        self.material_tracker = None
+        self.material_loss = 0
+        self.opening_node = None
+        self.moves_opening = None
+        self.position_cache = get_position_cache() if POSITION_CACHE_PLIES > 0 else None
+        self.zobrist = None
+    
+    def visit_header(self, tagname, tagvalue):
+        self.headers[tagname] = tagvalue
+    
+    def end_headers(self):
+        white_player = self.headers.get("White", "").strip().lower()
+        black_player = self.headers.get("Black", "").strip().lower()
+        
+        if self.username_lower == white_player:
+            self.user_color = chess.WHITE
+        elif self.username_lower == black_player:
+            self.user_color = chess.BLACK
+        
+        # The opening trie only describes games from the standard start
+        if "FEN" not in self.headers:
+            self.opening_node = get_opening_trie()
+    
+    def begin_variation(self):
+        return chess.pgn.SKIP
+    
+    def begin_parse_san(self, board, san):
+        # Past the ply limit the parser only scans the remaining tokens
+        if self.max_plies and self.move_number >= self.max_plies:
+            self.truncated = True
+            return chess.pgn.SKIP
+    
+    def visit_move(self, board, move):
+        self.move_number += 1
+        material_gain = self.material_tracker.push(board, move)
+        
+        if self.zobrist is not None:
+            if self.move_number <= POSITION_CACHE_PLIES:
+                self.zobrist.push(board, move)
+            else:
+                self.zobrist = None
         
-        if user_color is not None and board.turn != user_color:
-            board.push(move)
-            continue
+        if self.opening_node is not None:
+            self.opening_node = self.opening_node.step(move)
+            if self.opening_node is not None and self.opening_node.opening is not None:
+                self.moves_opening = self.opening_node.opening
         
-        material_before = count_material(board)
-        board.push(move)
-        material_after = count_material(board)
+        if self.user_color is not None and board.turn != self.user_color:
+            return
         
-        material_loss = abs(material_after - material_before) if board.turn == chess.WHITE else abs(material_before - material_after)
+        self.pending_move = move
+        self.material_loss = material_gain
+    
+    def visit_board(self, board):
+        if self.material_tracker is None:
+            self.material_tracker = MaterialTracker(board)
+            if self.position_cache is not None:
+                self.zobrist = ZobristTracker(board)
+        
+        move = self.pending_move
+        if move is None:
+            return
+        self.pending_move = None
+        
+        material_loss = self.material_loss
         
         moved_piece = board.piece_at(move.to_square)
         mistake_type = None
@@ -263,63 +524,98 @@ def analyze_game_detailed(game, username):
             mistake_type = 'blunder'
         elif material_loss >= 1:
             mistake_type = 'mistake'
-        elif moved_piece and board.is_attacked_by(not board.turn, move.to_square):
-            attackers = len(board.attackers(not board.turn, move.to_square))
-            defenders = len(board.attackers(board.turn, move.to_square))
-            if attackers > defenders:
-                mistake_type = 'hanging_piece'
+        elif moved_piece and self.is_hanging(board, move.to_square):
+            mistake_type = 'hanging_piece'
         
-        if move_number <= 10:
+        if self.move_number <= 10:
             phase = 'opening'
-        elif len(board.piece_map()) <= 10:
+        elif self.material_tracker.is_endgame():
             phase = 'endgame'
         else:
             phase = 'middlegame'
         
         if mistake_type:
-            mistakes.append({
+            self.mistakes.append({
                 'type': mistake_type,
                 'phase': phase,
-                'move_number': move_number
+                'move_number': self.move_number
             })
     
-    return {
-        'mistakes': mistakes,
-        'opening': opening,
-        'result': result,
-        'user_color': user_color,
-        'user_result': user_result
-    }
+    def is_hanging(self, board, square):
+        # Openings repeat across games and users, so their verdicts are cached by position
+        if self.zobrist is None:
+            return is_hanging(board, square)
+        key = (self.zobrist.key(board), square)
+        verdict = self.position_cache.get(key)
+        if verdict is None:
+            verdict = is_hanging(board, square)
+            self.position_cache.put(key, verdict)
+        return verdict
+    
+    def handle_error(self, error):
+        logger.warning(f"Skipping rest of game after PGN error: {str(error)}")
+    
+    def user_elo(self):
+        return extract_user_elo(self.headers, self.username_lower)
+    
+    def result(self):
+        result = self.headers.get("Result", "*")
+        user_color = self.user_color
+        
+        user_result = None
+        if user_color is not None and result != "*":
+            if result == "1-0":
+                user_result = "win" if user_color == chess.WHITE else "loss"
+            elif result == "0-1":
+                user_result = "win" if user_color == chess.BLACK else "loss"
+            elif result == "1/2-1/2":
+                user_result = "draw"
+        
+        analysis = {
+            'mistakes': self.mistakes,
+            'opening': detect_opening_from_headers(self.headers, self.moves_opening),
+            'result': result,
+            'user_color': user_color,
+            'user_result': user_result,
+            'plies': self.move_number
+        }
+        if self.truncated:
+            analysis['truncated'] = True
+        return analysis
+
+def iter_game_analyses(pgn_io, username, max_plies=0):
+    while True:
+        visitor = GameAnalysisVisitor(username, max_plies)
+        try:
+            analysis = chess.pgn.read_game(pgn_io, Visitor=lambda: visitor)
+        except Exception:
+            break
+        if analysis is None:
+            break
+        yield analysis, visitor.user_elo()
+
+def analyze_game_detailed(game, username):
+    return game.accept(GameAnalysisVisitor(username))
+
+def as_analysis_table(all_analyses):
+    # Callers may still hand in a plain list of per-game analysis dicts
+    if isinstance(all_analyses, AnalysisTable):
+        return all_analyses
+    return AnalysisTable.from_analyses(all_analyses)
 
 def categorize_mistakes(all_analyses):
     if not all_analyses:
         return []
     
-    blunders = 0
-    regular_mistakes = 0
-    hanging = 0
-    opening = 0
-    middlegame = 0
-    endgame = 0
-    
-    for analysis in all_analyses:
-        for mistake in analysis.get('mistakes', []):
-            mistake_type = mistake.get('type')
-            phase = mistake.get('phase')
-            
-            if mistake_type == 'blunder':
-                blunders += 1
-            elif mistake_type == 'mistake':
-                regular_mistakes += 1
-            elif mistake_type == 'hanging_piece':
-                hanging += 1
-            
-            if phase == 'opening':
-                opening += 1
-            elif phase == 'middlegame':
-                middlegame += 1
-            elif phase == 'endgame':
-                endgame += 1
+    table = as_analysis_table(all_analyses)
+    type_counts = table.mistake_type_counts()
+    phase_counts = table.mistake_phase_counts()
+    blunders = type_counts['blunder']
+    regular_mistakes = type_counts['mistake']
+    hanging = type_counts['hanging_piece']
+    opening = phase_counts['opening']
+    middlegame = phase_counts['middlegame']
+    endgame = phase_counts['endgame']
     
     total = blunders + regular_mistakes + hanging + opening + middlegame + endgame
     
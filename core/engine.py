@@ -0,0 +1,264 @@
+import io
+import os
+import time
+import queue
+import shlex
+import logging
+import threading
+from contextlib import contextmanager
+import chess
+import chess.pgn
+import chess.engine
+import chess.polyglot
+from core import metrics
+from core.see import capture_value, is_hanging
+from core.positions import PositionCache
+
+logger = logging.getLogger(__name__)
+
+# Unset means no engine: the material/SEE heuristics stay the only classifier
+UCI_ENGINE_PATH = os.environ.get('UCI_ENGINE_PATH')
+ENGINE_POOL_SIZE = int(os.environ.get('ENGINE_POOL_SIZE', 2))
+ENGINE_HASH_MB = int(os.environ.get('ENGINE_HASH_MB', 64))
+ENGINE_THREADS = int(os.environ.get('ENGINE_THREADS', 1))
+ENGINE_NODES_PER_POSITION = int(os.environ.get('ENGINE_NODES_PER_POSITION', 20000))
+ENGINE_REQUEST_NODES = int(os.environ.get('ENGINE_REQUEST_NODES', 2000000))
+ENGINE_REQUEST_SECONDS = float(os.environ.get('ENGINE_REQUEST_SECONDS', 20))
+
+ENGINE_CACHE_SIZE = int(os.environ.get('ENGINE_CACHE_SIZE', 100000))
+
+BLUNDER_CP = 300
+MISTAKE_CP = 100
+MATE_SCORE = 10000
+
+_eval_cache = PositionCache(ENGINE_CACHE_SIZE, name='engine_eval')
+
+_pool = None
+_pool_loaded = False
+_pool_lock = threading.Lock()
+
+
+class EnginePool:
+    # Persistent UCI processes handed out one per request; a process that dies
+    # mid-request is dropped and respawned on the next acquire
+    def __init__(self, command, size=ENGINE_POOL_SIZE, options=None):
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+        self.size = size
+        self.options = options if options is not None else {'Hash': ENGINE_HASH_MB, 'Threads': ENGINE_THREADS}
+        self.idle = queue.LifoQueue()
+        self.started = 0
+        self.lock = threading.Lock()
+
+    def _spawn(self):
+        engine = chess.engine.SimpleEngine.popen_uci(self.command)
+        options = {name: value for name, value in self.options.items() if name in engine.options}
+        if options:
+            engine.configure(options)
+        logger.info(f"Started UCI engine {engine.id.get('name', self.command[0])}")
+        return engine
+
+    def _acquire(self, timeout):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            spawn = self.started < self.size
+            if spawn:
+                self.started += 1
+        if spawn:
+            try:
+                return self._spawn()
+            except Exception:
+                with self.lock:
+                    self.started -= 1
+                raise
+        return self.idle.get(timeout=timeout)
+
+    def _discard(self, engine):
+        with self.lock:
+            self.started -= 1
+        try:
+            engine.quit()
+        except Exception:
+            pass
+
+    @contextmanager
+    def engine(self, timeout=None):
+        engine = self._acquire(timeout)
+        try:
+            yield engine
+        except (chess.engine.EngineError, chess.engine.EngineTerminatedError):
+            self._discard(engine)
+            raise
+        except BaseException:
+            self.idle.put(engine)
+            raise
+        else:
+            self.idle.put(engine)
+
+    def close(self):
+        while True:
+            try:
+                engine = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(engine)
+
+
+def _close_at_exit(pool):
+    # python-chess drives each engine from a non-daemon thread, which the
+    # interpreter joins before atexit handlers run; the main thread stopping
+    # is the last reliable signal to quit the engines
+    threading.main_thread().join()
+    pool.close()
+
+
+def get_engine_pool():
+    global _pool, _pool_loaded
+    with _pool_lock:
+        if not _pool_loaded:
+            _pool_loaded = True
+            if UCI_ENGINE_PATH:
+                _pool = EnginePool(UCI_ENGINE_PATH)
+                threading.Thread(target=_close_at_exit, args=(_pool,), name='engine-pool-reaper', daemon=True).start()
+                logger.info(f"Engine review enabled with {UCI_ENGINE_PATH} (pool of {ENGINE_POOL_SIZE})")
+        return _pool
+
+
+class EngineBudget:
+    def __init__(self, nodes=ENGINE_REQUEST_NODES, seconds=ENGINE_REQUEST_SECONDS):
+        self.nodes = nodes
+        self.deadline = time.monotonic() + seconds
+
+    def spend(self, nodes):
+        self.nodes -= nodes
+
+    def exhausted(self):
+        return self.nodes <= 0 or time.monotonic() >= self.deadline
+
+
+def _en_prise(board, color):
+    # Most material the side to move can win by a capture against color
+    return max((capture_value(board, square) for square in chess.SquareSet(board.occupied_co[color])), default=0)
+
+
+def candidate_moves(pgn_text, username):
+    # The user's moves with a cheap prior on how likely each is a mistake:
+    # material the opponent can win right after it
+    game = chess.pgn.read_game(io.StringIO(pgn_text))
+    if game is None or "FEN" in game.headers:
+        return []
+
+    username_lower = username.strip().lower()
+    user_color = None
+    if username_lower == game.headers.get("White", "").strip().lower():
+        user_color = chess.WHITE
+    elif username_lower == game.headers.get("Black", "").strip().lower():
+        user_color = chess.BLACK
+
+    candidates = []
+    board = game.board()
+    for move_number, move in enumerate(game.mainline_moves(), 1):
+        mover = board.turn
+        fen = board.fen()
+        board.push(move)
+        if user_color is None or mover == user_color:
+            endgame = chess.popcount(board.occupied) <= 10
+            candidates.append((_en_prise(board, mover), move_number, fen, move, endgame))
+    return candidates
+
+
+def evaluate(engine, board, limit, game_key):
+    # Returns (score for White, best move, nodes searched). Evaluations are
+    # shared across games and requests, so common openings are searched once
+    key = (chess.polyglot.zobrist_hash(board), limit.nodes)
+    cached = _eval_cache.get(key)
+    if cached is not None:
+        return cached + (0,)
+
+    info = engine.analyse(board, limit, game=game_key)
+    score = info['score'].white().score(mate_score=MATE_SCORE)
+    best_move = info['pv'][0] if info.get('pv') else None
+    _eval_cache.put(key, (score, best_move))
+    return score, best_move, info.get('nodes') or limit.nodes or 0
+
+
+def centipawn_loss(engine, board, move, limit, game_key):
+    # Returns (loss for the mover, nodes searched)
+    sign = 1 if board.turn == chess.WHITE else -1
+    before, best_move, nodes = evaluate(engine, board, limit, game_key)
+    if best_move == move:
+        return 0, nodes
+
+    board.push(move)
+    try:
+        after, _, after_nodes = evaluate(engine, board, limit, game_key)
+    finally:
+        board.pop()
+    return max(0, sign * (before - after)), nodes + after_nodes
+
+
+def classify(cp_loss, board_after, square):
+    if cp_loss >= BLUNDER_CP:
+        return 'blunder'
+    if cp_loss >= MISTAKE_CP:
+        return 'hanging_piece' if is_hanging(board_after, square) else 'mistake'
+    return None
+
+
+def review_games(games, username, pool=None, budget=None, nodes_per_position=None):
+    # games: (pgn_text, analysis) pairs. Returns the analyses with engine
+    # verdicts replacing the heuristic ones for every move the budget covered.
+    # Analyses may be shared with the cache, so changed ones are copied
+    pool = get_engine_pool() if pool is None else pool
+    if pool is None or not games:
+        return [analysis for _, analysis in games]
+    budget = EngineBudget() if budget is None else budget
+    limit = chess.engine.Limit(nodes=nodes_per_position or ENGINE_NODES_PER_POSITION)
+
+    candidates = []
+    for game_index, (pgn_text, _) in enumerate(games):
+        # Rank within the game breaks ties so equal priors spread over many games
+        ranked = sorted(candidate_moves(pgn_text, username), key=lambda c: -c[0])
+        candidates.extend((-prior, rank, game_index, move_number, fen, move, endgame)
+                          for rank, (prior, move_number, fen, move, endgame) in enumerate(ranked))
+    candidates.sort(key=lambda c: c[:2])
+
+    verdicts = {}
+    # One engine for the whole request so its hash carries over between the player's games
+    game_key = object()
+    try:
+        with pool.engine(timeout=max(0.0, budget.deadline - time.monotonic())) as engine:
+            for _, _, game_index, move_number, fen, move, endgame in candidates:
+                if budget.exhausted():
+                    metrics.inc('engine_budget_exhausted_total')
+                    break
+                board = chess.Board(fen)
+                with metrics.timed('engine_position_seconds'):
+                    cp_loss, nodes = centipawn_loss(engine, board, move, limit, game_key)
+                budget.spend(nodes)
+                board.push(move)
+                verdicts.setdefault(game_index, {})[move_number] = (classify(cp_loss, board, move.to_square), endgame)
+                metrics.inc('engine_positions_total')
+    except (queue.Empty, chess.engine.EngineError, chess.engine.EngineTerminatedError, OSError) as e:
+        # Whatever was reviewed before the failure is kept; the rest stays heuristic
+        logger.error(f"Engine review stopped early: {str(e)}")
+        metrics.inc('engine_errors_total')
+    hits, misses = _eval_cache.report()
+    logger.info(f"Engine review: {len(verdicts)} games touched, evaluation cache {hits} hits, {misses} misses")
+
+    reviewed = []
+    for game_index, (_, analysis) in enumerate(games):
+        game_verdicts = verdicts.get(game_index)
+        if not game_verdicts:
+            reviewed.append(analysis)
+            continue
+        mistakes = [m for m in analysis.get('mistakes', []) if m['move_number'] not in game_verdicts]
+        for move_number, (mistake_type, endgame) in game_verdicts.items():
+            if mistake_type:
+                phase = 'opening' if move_number <= 10 else 'endgame' if endgame else 'middlegame'
+                mistakes.append({'type': mistake_type, 'phase': phase, 'move_number': move_number})
+        mistakes.sort(key=lambda m: m['move_number'])
+        reviewed.append(dict(analysis, mistakes=mistakes))
+    return reviewed
@@ -0,0 +1,220 @@
+import io
+import os
+import bz2
+import gzip
+import mmap
+import logging
+import tempfile
+from array import array
+import chess.pgn
+
+logger = logging.getLogger(__name__)
+
+INGEST_CHUNK_GAMES = int(os.environ.get('INGEST_CHUNK_GAMES', 5000))
+INGEST_TMP_DIR = os.environ.get('INGEST_TMP_DIR')
+# Decompressed size an upload may reach; a small archive can expand without
+# bound, so the copy stops here instead of filling INGEST_TMP_DIR. 0 turns it off
+INGEST_MAX_DECOMPRESSED_MB = float(os.environ.get('INGEST_MAX_DECOMPRESSED_MB', 2048))
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_BZ2_MAGIC = b'BZh'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+_BOM = b'\xef\xbb\xbf'
+
+
+def detect_compression(path):
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    if head.startswith(_GZIP_MAGIC):
+        return 'gzip'
+    if head.startswith(_BZ2_MAGIC):
+        return 'bz2'
+    if head.startswith(_ZSTD_MAGIC):
+        return 'zstd'
+    return None
+
+
+def _open_decompressed(path, compression):
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'bz2':
+        return bz2.open(path, 'rb')
+    import zstandard
+    return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+
+
+def _copy_capped(source, target, limit):
+    copied = 0
+    for block in iter(lambda: source.read(1 << 20), b''):
+        copied += len(block)
+        if limit and copied > limit:
+            raise ValueError(f"ochilgan fayl {limit // (1024 * 1024)} MB dan katta")
+        target.write(block)
+
+
+class _LineReader:
+    # Feeds chess.pgn the mapped bytes line by line while the byte position
+    # stays readable, which a TextIOWrapper's tell() does not offer
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def readline(self):
+        end = self.data.find(b'\n', self.position)
+        end = len(self.data) if end == -1 else end + 1
+        line = self.data[self.position:end]
+        self.position = end
+        return line.decode('utf-8', errors='replace')
+
+
+def build_offsets(data):
+    # Game boundaries are wherever chess.pgn.read_headers stops, so headerless
+    # movetext and comment lines starting with "[" split exactly as in
+    # read_game. The skipped movetext is only tokenized for comment braces.
+    # Each offset is moved past leading blank lines onto the game's first line
+    offsets = array('Q')
+    reader = _LineReader(data)
+    while reader.position < len(data):
+        start = reader.position
+        if chess.pgn.read_headers(reader) is None:
+            break
+        while start < reader.position and data[start:start + 1] in b' \t\r\n':
+            start += 1
+        offsets.append(start + len(_BOM) if data[start:start + len(_BOM)] == _BOM else start)
+    return offsets
+
+
+def time_class(time_control):
+    # Lichess buckets: estimated duration is base + 40 * increment seconds
+    if not time_control or time_control in ('-', '?'):
+        return 'correspondence'
+    base, _, increment = time_control.partition('+')
+    try:
+        estimate = int(base) + 40 * int(increment or 0)
+    except ValueError:
+        return None
+    if estimate < 180:
+        return 'bullet'
+    if estimate < 480:
+        return 'blitz'
+    if estimate < 1500:
+        return 'rapid'
+    return 'classical'
+
+
+class HeaderFilter:
+    # Every criterion left as None matches everything. Dates are PGN style
+    # "YYYY.MM.DD" and inclusive; games with an unknown date fail a date bound
+    def __init__(self, player=None, time_classes=None, date_from=None, date_to=None):
+        self.player = player.strip().lower() if player else None
+        self.player_bytes = self.player.encode('utf-8') if self.player else None
+        self.time_classes = set(time_classes) if time_classes else None
+        self.date_from = date_from.replace('-', '.') if date_from else None
+        self.date_to = date_to.replace('-', '.') if date_to else None
+
+    def __bool__(self):
+        return any((self.player, self.time_classes, self.date_from, self.date_to))
+
+    def might_match(self, header_bytes):
+        # Byte-level pre-check so most non-matching games skip header parsing
+        return self.player_bytes is None or self.player_bytes in header_bytes.lower()
+
+    def matches(self, headers):
+        if self.player and self.player not in (headers.get('White', '').strip().lower(), headers.get('Black', '').strip().lower()):
+            return False
+        if self.time_classes and time_class(headers.get('TimeControl')) not in self.time_classes:
+            return False
+        if self.date_from or self.date_to:
+            date = headers.get('UTCDate') or headers.get('Date', '')
+            if not date or '?' in date:
+                return False
+            if self.date_from and date < self.date_from:
+                return False
+            if self.date_to and date > self.date_to:
+                return False
+        return True
+
+
+class PgnFile:
+    # A PGN export on disk, memory-mapped and indexed by game start offset.
+    # Compressed files are first streamed into an unlinked temporary file,
+    # so neither form is ever held in memory as a whole
+    def __init__(self, path):
+        self.path = path
+        self.compression = detect_compression(path)
+        if self.compression:
+            source = _open_decompressed(path, self.compression)
+            fileobj = tempfile.TemporaryFile(dir=INGEST_TMP_DIR)
+            try:
+                with source:
+                    _copy_capped(source, fileobj, int(INGEST_MAX_DECOMPRESSED_MB * 1024 * 1024))
+            except BaseException:
+                fileobj.close()
+                raise
+            fileobj.flush()
+        else:
+            fileobj = open(path, 'rb')
+
+        with fileobj:
+            self.size = os.fstat(fileobj.fileno()).st_size
+            self.data = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+
+        self.offsets = build_offsets(self.data)
+        self.indices = range(len(self.offsets))
+        logger.info(f"Indexed {len(self.offsets)} games in {path} ({self.size} bytes, {self.compression or 'uncompressed'})")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __len__(self):
+        return len(self.indices)
+
+    def _span(self, index):
+        end = self.offsets[index + 1] if index + 1 < len(self.offsets) else self.size
+        return self.offsets[index], end
+
+    def game_text(self, index):
+        start, end = self._span(index)
+        return self.data[start:end].decode('utf-8', errors='replace')
+
+    def header_bytes(self, index):
+        start, end = self._span(index)
+        blank = self.data.find(b'\n\n', start, end)
+        if blank == -1:
+            blank = self.data.find(b'\n\r\n', start, end)
+        return self.data[start:blank + 1 if blank != -1 else end]
+
+    def headers(self, index):
+        return chess.pgn.read_headers(io.StringIO(self.header_bytes(index).decode('utf-8', errors='replace')))
+
+    def apply_filter(self, header_filter):
+        # Restricts later iteration to matching games; only headers are parsed
+        if not header_filter:
+            self.indices = range(len(self.offsets))
+            return len(self.indices)
+
+        selected = array('I')
+        for index in range(len(self.offsets)):
+            if not header_filter.might_match(self.header_bytes(index)):
+                continue
+            headers = self.headers(index)
+            if headers is not None and header_filter.matches(headers):
+                selected.append(index)
+        self.indices = selected
+        logger.info(f"Header filter kept {len(selected)} of {len(self.offsets)} games")
+        return len(selected)
+
+    def first_headers(self):
+        return self.headers(self.indices[0]) if len(self.indices) else None
+
+    def iter_text_chunks(self, size=INGEST_CHUNK_GAMES):
+        # Bounded lists of game texts, so only one chunk is decoded at a time
+        for chunk_start in range(0, len(self.indices), size):
+            yield [self.game_text(index) for index in self.indices[chunk_start:chunk_start + size]]
@@ -0,0 +1,392 @@
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from core import metrics
+from core.budget import RequestBudget, budget_scope
+from core.core import CANCELLED_OUTPUTS, analyze_games_stream, summary_fields
+
+logger = logging.getLogger(__name__)
+
+# Analyses that run at once; further jobs wait in the pool's queue
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 8))
+# New jobs are turned away once this many are waiting for a worker
+JOB_QUEUE_LIMIT = int(os.environ.get('JOB_QUEUE_LIMIT', 32))
+JOB_RETRY_AFTER = 5
+# Finished jobs stay readable through the API for this long
+JOB_TTL = float(os.environ.get('JOB_TTL', 900))
+JOB_HISTORY = int(os.environ.get('JOB_HISTORY', 1000))
+JOBS_API_MAX_BODY = int(os.environ.get('JOBS_API_MAX_BODY', 50 * 1024 * 1024))
+JOBS_API_MAX_WAIT = 120.0
+# The API has no authentication, so it only listens on loopback unless another
+# interface is asked for here or with --host
+JOBS_API_HOST = os.environ.get('JOBS_API_HOST', '127.0.0.1')
+
+BUSY_OUTPUTS = ("❌ Server hozir band. Birozdan keyin qayta urinib ko'ring.", "", "", "", None, None, None, None, None)
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def _timestamp(moment):
+    return datetime.fromtimestamp(moment, timezone.utc).isoformat(timespec='seconds') if moment else None
+
+
+def content_hash(pgn_file):
+    # Uploads arrive as a path, API clients send the text itself
+    digest = hashlib.sha256()
+    if isinstance(pgn_file, str) and os.path.isfile(pgn_file):
+        with open(pgn_file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    elif pgn_file:
+        digest.update(pgn_file if isinstance(pgn_file, bytes) else pgn_file.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def job_key(username_chesscom, pgn_file, username_pgn):
+    # Mirrors prepare_analysis: a Chess.com name wins over an upload
+    if username_chesscom and username_chesscom.strip():
+        return ('chess_com', username_chesscom.strip().lower(), '')
+    if pgn_file:
+        return ('pgn', (username_pgn or '').strip().lower(), content_hash(pgn_file))
+    return ('none', '', '')
+
+
+class Job:
+    def __init__(self, key, args):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.args = args
+        self.status = 'queued'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.subscribers = 1
+        self.outputs = None
+        self.version = 0
+        self.details = {}
+        self.result = None
+        self.error = None
+        self.budget = RequestBudget()
+        self.condition = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in ('done', 'error', 'cancelled')
+
+    def publish(self, outputs):
+        with self.condition:
+            self.outputs = outputs
+            self.version += 1
+            self.condition.notify_all()
+
+    def finish(self, status, error=None):
+        # Finished jobs stay listed for JOB_TTL, so only the API result is kept:
+        # the request arguments (an API upload's whole PGN) and the full
+        # analysis table are released here
+        result = None
+        summary = self.details.get('summary')
+        if status == 'done' and summary is not None:
+            result = summary_fields(summary)
+            result['puzzles'] = self.details.get('puzzles', [])
+            result['ai_analysis'] = self.details.get('ai_analysis')
+        with self.condition:
+            self.status = status
+            self.error = error
+            self.result = result
+            self.args = None
+            self.details = {}
+            self.finished = time.time()
+            self.condition.notify_all()
+
+    def wait(self, timeout=None):
+        with self.condition:
+            self.condition.wait_for(lambda: self.done, timeout)
+            return self.done
+
+    def updates(self):
+        # Every output snapshot from the one this subscriber has not seen yet
+        # to the last; late subscribers start from the current one
+        seen = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.version != seen or self.done)
+                outputs, seen, done = self.outputs, self.version, self.done
+            if outputs is not None:
+                yield outputs
+            if done:
+                with self.condition:
+                    if self.version == seen:
+                        return
+
+    def to_dict(self):
+        with self.condition:
+            record = {
+                'id': self.id,
+                'status': self.status,
+                'source': self.key[0],
+                'username': self.key[1],
+                'subscribers': self.subscribers,
+                'created_at': _timestamp(self.created),
+                'started_at': _timestamp(self.started),
+                'finished_at': _timestamp(self.finished)
+            }
+            if self.error:
+                record['error'] = self.error
+            if self.result is not None:
+                record['result'] = self.result
+            return record
+
+
+class JobService:
+    # One execution path for the UI and API clients: identical requests
+    # that arrive while one is queued or running share that job. A job whose
+    # clients have all left is cancelled
+    def __init__(self, workers=JOB_WORKERS, queue_limit=JOB_QUEUE_LIMIT):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self.queue_limit = queue_limit
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.jobs = OrderedDict()
+        self.queued = 0
+
+    def submit(self, username_chesscom, pgn_file, username_pgn):
+        # (job, created); job is None when the queue is full
+        key = job_key(username_chesscom, pgn_file, username_pgn)
+        with self.lock:
+            job = self.inflight.get(key)
+            if job is not None:
+                with job.condition:
+                    job.subscribers += 1
+                metrics.inc('jobs_total', outcome='coalesced')
+                return job, False
+
+            if self.queue_limit and self.queued >= self.queue_limit:
+                metrics.inc('jobs_total', outcome='rejected')
+                return None, False
+            self._prune()
+            job = Job(key, (username_chesscom, pgn_file, username_pgn))
+            self.inflight[key] = job
+            self.jobs[job.id] = job
+            self.queued += 1
+        metrics.inc('jobs_total', outcome='created')
+        self.executor.submit(self._run, job)
+        return job, True
+
+    def detach(self, job):
+        # A client stopped waiting; the last one to leave cancels unfinished work
+        with self.lock:
+            with job.condition:
+                job.subscribers -= 1
+                abandoned = job.subscribers <= 0 and not job.done
+            if abandoned:
+                if self.inflight.get(job.key) is job:
+                    del self.inflight[job.key]
+                job.budget.cancel()
+        if abandoned:
+            metrics.inc('jobs_cancelled_total')
+            logger.info(f"Job {job.id} cancelled: no client is waiting for it")
+        return abandoned
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def counts(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        counts = {'queued': 0, 'running': 0, 'done': 0, 'error': 0, 'cancelled': 0}
+        for job in jobs:
+            counts[job.status] += 1
+        return counts
+
+    def _prune(self):
+        cutoff = time.time() - JOB_TTL
+        for job_id, job in list(self.jobs.items()):
+            if len(self.jobs) <= JOB_HISTORY and (job.finished is None or job.finished >= cutoff):
+                break
+            if job.done:
+                del self.jobs[job_id]
+
+    def _run(self, job):
+        with self.lock:
+            self.queued -= 1
+        with job.condition:
+            job.status = 'running'
+            job.started = time.time()
+        metrics.observe('job_queue_seconds', job.started - job.created)
+        status, error = 'done', None
+        try:
+            if job.budget.cancelled.is_set():
+                # Abandoned while it waited for a worker
+                job.publish(CANCELLED_OUTPUTS)
+            else:
+                job.budget.start()
+                with budget_scope(job.budget):
+                    for outputs in analyze_games_stream(*job.args, details=job.details):
+                        job.publish(outputs)
+            error = job.details.get('error')
+            if job.budget.cancelled.is_set():
+                status, error = 'cancelled', CANCELLED_OUTPUTS[0]
+            elif error:
+                status = 'error'
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            status, error = 'error', f"❌ Xatolik: {str(e)}"
+            job.publish((error, "", "", "", None, None, None, None, None))
+        finally:
+            # A request arriving after this point starts a fresh job
+            with self.lock:
+                if self.inflight.get(job.key) is job:
+                    del self.inflight[job.key]
+            job.finish(status, error)
+            metrics.inc('jobs_finished_total', status=status)
+
+
+def get_job_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = JobService()
+        return _service
+
+
+def analyze_games_job(username_chesscom, pgn_file, username_pgn):
+    # Gradio handler: same streamed outputs as analyze_games_stream, through the
+    # shared job path. Gradio drops the generator when the browser goes away,
+    # which closes it and detaches this client from the job
+    service = get_job_service()
+    job, _ = service.submit(username_chesscom, pgn_file, username_pgn)
+    if job is None:
+        yield BUSY_OUTPUTS
+        return
+    try:
+        yield from job.updates()
+    finally:
+        service.detach(job)
+
+
+class _JobsHandler(BaseHTTPRequestHandler):
+    # POST   /jobs  {"username": "..."} or {"pgn": "<PGN text>", "player": "..."}
+    # GET    /jobs/<id>[?wait=<seconds>]
+    # DELETE /jobs/<id>  this client no longer needs the job
+    # All answer with the job record; "result" holds the statistics once done.
+    # A full queue answers POST with 503 and Retry-After
+    service = None
+
+    def _send(self, status, body, headers=()):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _wait(self, job, query):
+        try:
+            seconds = min(float(query.get('wait', ['0'])[0]), JOBS_API_MAX_WAIT)
+        except ValueError:
+            seconds = 0.0
+        if seconds > 0:
+            job.wait(seconds)
+
+    def _job(self, url):
+        parts = url.path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'jobs':
+            self._send(404, {'error': 'not found'})
+            return None
+        job = self.service.get(parts[1])
+        if job is None:
+            self._send(404, {'error': 'unknown job'})
+        return job
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.strip('/') == 'jobs':
+            self._send(200, self.service.counts())
+            return
+        job = self._job(url)
+        if job is None:
+            return
+        self._wait(job, parse_qs(url.query))
+        self._send(200, job.to_dict())
+
+    def do_DELETE(self):
+        job = self._job(urlsplit(self.path))
+        if job is None:
+            return
+        self.service.detach(job)
+        self._send(200, job.to_dict())
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path.rstrip('/') != '/jobs':
+            self._send(404, {'error': 'not found'})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > JOBS_API_MAX_BODY:
+            self._send(413, {'error': f'body over {JOBS_API_MAX_BODY} bytes'})
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send(400, {'error': 'body must be JSON'})
+            return
+        if not isinstance(body, dict) or not (body.get('username') or body.get('pgn')):
+            self._send(400, {'error': 'give "username" (Chess.com) or "pgn" (PGN text)'})
+            return
+
+        # Bytes, so PGN text is never mistaken for a path on this host
+        pgn = body.get('pgn')
+        pgn = pgn.encode('utf-8') if isinstance(pgn, str) else None
+        job, created = self.service.submit(body.get('username'), pgn, body.get('player'))
+        if job is None:
+            self._send(503, {'error': BUSY_OUTPUTS[0]}, [('Retry-After', str(JOB_RETRY_AFTER))])
+            return
+        self._wait(job, parse_qs(url.query))
+        record = job.to_dict()
+        record['coalesced'] = not created
+        self._send(200 if job.done else 202, record)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_jobs_server(port, host=JOBS_API_HOST, service=None):
+    handler = type('JobsHandler', (_JobsHandler,), {'service': service or get_job_service()})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='jobs-server', daemon=True).start()
+    logger.info(f"Job API on http://{host}:{server.server_port}/jobs")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the analysis job API without the Gradio UI")
+    parser.add_argument('--host', default=JOBS_API_HOST, help="interface to listen on; 0.0.0.0 exposes the API to the network")
+    parser.add_argument('--port', type=int, default=int(os.environ.get('JOBS_API_PORT') or 8100))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    start_jobs_server(args.port, args.host)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
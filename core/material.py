@@ -0,0 +1,59 @@
+import chess
+
+MATERIAL_VALUES = {chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5, chess.QUEEN: 9}
+
+_VALUE_BY_TYPE = [0, 1, 3, 3, 5, 9, 0]
+
+
+def count_material(board):
+    total = 0
+    for piece_type in MATERIAL_VALUES:
+        total += len(board.pieces(piece_type, chess.WHITE)) * MATERIAL_VALUES[piece_type]
+        total -= len(board.pieces(piece_type, chess.BLACK)) * MATERIAL_VALUES[piece_type]
+    return total
+
+
+def count_material_bitboards(board):
+    white = board.occupied_co[chess.WHITE]
+    black = board.occupied_co[chess.BLACK]
+    total = 0
+    for piece_type, bb in ((chess.PAWN, board.pawns), (chess.KNIGHT, board.knights), (chess.BISHOP, board.bishops),
+                           (chess.ROOK, board.rooks), (chess.QUEEN, board.queens)):
+        total += (chess.popcount(bb & white) - chess.popcount(bb & black)) * _VALUE_BY_TYPE[piece_type]
+    return total
+
+
+def move_material_gain(board, move):
+    # Material won by the side to move, read from the board before the move
+    gain = 0
+    if board.is_en_passant(move):
+        gain = 1
+    else:
+        captured = board.piece_type_at(move.to_square)
+        if captured and board.color_at(move.to_square) != board.turn:
+            gain = _VALUE_BY_TYPE[captured]
+
+    if move.promotion:
+        gain += _VALUE_BY_TYPE[move.promotion] - 1
+
+    return gain
+
+
+class MaterialTracker:
+    def __init__(self, board):
+        self.balance = count_material_bitboards(board)
+        self.piece_count = chess.popcount(board.occupied)
+
+    def push(self, board, move):
+        # Call with the board before the move; returns the mover's material gain
+        captured = board.is_capture(move)
+        gain = move_material_gain(board, move)
+
+        if captured:
+            self.piece_count -= 1
+        self.balance += gain if board.turn == chess.WHITE else -gain
+
+        return gain
+
+    def is_endgame(self):
+        return self.piece_count <= 10
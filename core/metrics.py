@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import cProfile
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = 'uzchess_'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+# The metrics endpoint is unauthenticated, so it only listens on loopback
+# unless a scraper on another host needs it
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+
+_current_request = contextvars.ContextVar('uzchess_request', default=None)
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def counter_value(self, name, **labels):
+        with self.lock:
+            return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render_prometheus(self):
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, dict(value, buckets=list(value['buckets']))) for key, value in self.histograms.items())
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {METRICS_PREFIX}{name} counter")
+                typed.add(name)
+            lines.append(f"{METRICS_PREFIX}{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {METRICS_PREFIX}{name} histogram")
+                typed.add(name)
+            for bound, count in zip(self.buckets, histogram['buckets']):
+                lines.append(f"{METRICS_PREFIX}{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {count}")
+            lines.append(f"{METRICS_PREFIX}{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{METRICS_PREFIX}{name}_sum{_format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{METRICS_PREFIX}{name}_count{_format_labels(labels)} {histogram['count']}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in labels]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def log_sink(record):
+    logger.info(json.dumps(record, ensure_ascii=False, sort_keys=True))
+
+
+_sinks = [log_sink]
+_sinks_lock = threading.Lock()
+
+
+def add_sink(sink):
+    # A sink is any callable taking the per-request record dict
+    with _sinks_lock:
+        _sinks.append(sink)
+
+
+def remove_sink(sink):
+    with _sinks_lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+
+def inc(name, value=1, **labels):
+    REGISTRY.inc(name, value, **labels)
+    request = _current_request.get()
+    if request is not None:
+        request.count(":".join([name] + [str(v) for _, v in sorted(labels.items())]), value)
+
+
+def observe(name, value, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+@contextmanager
+def timed(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+class RequestMetrics:
+    def __init__(self, kind):
+        self.kind = kind
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.counts = {}
+        self.outcome = 'ok'
+        self.lock = threading.Lock()
+
+    def record_stage(self, name, seconds):
+        REGISTRY.observe('stage_seconds', seconds, stage=name)
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - start)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def finish(self):
+        duration = time.perf_counter() - self.start
+        REGISTRY.observe('request_seconds', duration, kind=self.kind)
+        REGISTRY.inc('requests_total', kind=self.kind, outcome=self.outcome)
+        record = {
+            'event': 'request',
+            'kind': self.kind,
+            'outcome': self.outcome,
+            'duration_ms': round(duration * 1000, 2),
+            'stages_ms': {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+            'counts': dict(self.counts)
+        }
+        with _sinks_lock:
+            sinks = list(_sinks)
+        for sink in sinks:
+            try:
+                sink(record)
+            except Exception as e:
+                logger.error(f"Metrics sink failed: {str(e)}")
+        return record
+
+
+def current_request():
+    return _current_request.get()
+
+
+@contextmanager
+def request_scope(kind):
+    # Gradio may resume generators on other threads, so avoid token-based resets
+    request = RequestMetrics(kind)
+    previous = _current_request.get()
+    _current_request.set(request)
+    try:
+        yield request
+    except BaseException:
+        request.outcome = 'exception'
+        raise
+    finally:
+        _current_request.set(previous)
+        request.finish()
+
+
+@contextmanager
+def stage(name):
+    request = _current_request.get()
+    if request is None:
+        with timed('stage_seconds', stage=name):
+            yield
+    else:
+        with request.stage(name):
+            yield
+
+
+@contextmanager
+def profile_if_slow(name, threshold_ms=None):
+    # Opt-in: set PROFILE_SLOW_MS to dump cProfile stats of slow sections to PROFILE_DIR
+    threshold_ms = PROFILE_SLOW_MS if threshold_ms is None else threshold_ms
+    if not threshold_ms:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already running in this interpreter
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms >= threshold_ms:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{name}-{int(time.time() * 1000)}-{threading.get_ident()}.prof")
+            profiler.dump_stats(path)
+            logger.warning(f"Slow {name} ({elapsed_ms:.0f} ms), profile written to {path}")
+            REGISTRY.inc('profiles_written_total', section=name)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = REGISTRY.render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host=METRICS_HOST):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Prometheus metrics on http://{host}:{server.server_port}/metrics")
+    return server
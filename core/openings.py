@@ -1,32 +1,218 @@
 
+import os
 import csv
+import re
+import hashlib
+import pickle
 import logging
+import threading
+import chess
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def load_opening_database():
-    openings = {}
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+OPENINGS_CSV_PATH = os.path.join(DATA_DIR, 'Chess Opening Reference - Sheet1.csv')
+OPENINGS_CACHE_PATH = os.environ.get('OPENINGS_CACHE_PATH', os.path.join(DATA_DIR, 'openings.cache.pickle'))
+OPENINGS_CACHE_FORMAT = 1
+
+_opening_data = None
+_opening_data_lock = threading.Lock()
+_data_fingerprint = None
+
+PAWN_CAPTURE_REGEX = re.compile(r'^([a-h])([a-h])$')
+
+def load_opening_rows():
+    rows = []
     try:
-        with open('data/Chess Opening Reference - Sheet1.csv', 'r', encoding='utf-8') as f:
+        with open(OPENINGS_CSV_PATH, 'r', encoding='utf-8') as f:
             reader = csv.DictReader(f)
             for row in reader:
                 eco = row.get('ECO Code', '').strip()
                 name = row.get('Name', '').strip()
                 if eco and name:
-                    openings[eco] = name
+                    rows.append((eco, name, row.get('Opening Moves', '').strip()))
     except Exception as e:
         logger.error(f"Failed to load openings CSV: {e}")
+    return rows
+
+def load_opening_database(rows=None):
+    openings = {}
+    for eco, name, _ in load_opening_rows() if rows is None else rows:
+        openings[eco] = name
     return openings
 
-OPENING_DB = load_opening_database()
+def _parse_reference_move(board, token):
+    try:
+        return board.parse_san(token)
+    except ValueError:
+        pass
+    
+    # Old-style pawn captures such as "dc"
+    match = PAWN_CAPTURE_REGEX.match(token)
+    if match:
+        from_file = chess.FILE_NAMES.index(match.group(1))
+        to_file = chess.FILE_NAMES.index(match.group(2))
+        candidates = [
+            move for move in board.generate_legal_captures(board.pawns & board.occupied_co[board.turn])
+            if chess.square_file(move.from_square) == from_file and chess.square_file(move.to_square) == to_file
+        ]
+        if len(candidates) == 1:
+            return candidates[0]
+    return None
+
+def parse_opening_moves(moves_text):
+    # "1 g4, a3, h3, etc." lists alternatives for the last move of the line
+    lines = []
+    prefix = None
+    for segment in moves_text.split(','):
+        tokens = [t for t in segment.split() if not t.rstrip('.').isdigit() and t != 'etc.']
+        if not tokens:
+            continue
+        if prefix is None:
+            prefix = tokens[:-1]
+            lines.append(tokens)
+        else:
+            lines.append(prefix + tokens)
+    
+    sequences = []
+    for tokens in lines:
+        board = chess.Board()
+        moves = []
+        for token in tokens:
+            move = _parse_reference_move(board, token)
+            if move is None:
+                break
+            moves.append(move)
+            board.push(move)
+        if moves:
+            sequences.append(moves)
+    return sequences
+
+class OpeningTrie:
+    __slots__ = ('children', 'opening')
+    
+    def __init__(self):
+        self.children = {}
+        self.opening = None
+    
+    def insert(self, moves, opening):
+        node = self
+        for move in moves:
+            child = node.children.get(move)
+            if child is None:
+                child = node.children[move] = OpeningTrie()
+            node = child
+        node.opening = opening
+    
+    def step(self, move):
+        return self.children.get(move)
+    
+    def lookup(self, moves):
+        node = self
+        opening = None
+        for move in moves:
+            node = node.children.get(move)
+            if node is None:
+                break
+            if node.opening is not None:
+                opening = node.opening
+        return opening
+
+def build_opening_trie(rows=None):
+    trie = OpeningTrie()
+    for eco, name, moves_text in load_opening_rows() if rows is None else rows:
+        for moves in parse_opening_moves(moves_text):
+            trie.insert(moves, name)
+    return trie
+
+def _csv_fingerprint():
+    try:
+        stat = os.stat(OPENINGS_CSV_PATH)
+    except OSError:
+        return None
+    return (OPENINGS_CACHE_FORMAT, stat.st_size, stat.st_mtime_ns)
+
+def _load_compiled_openings(fingerprint):
+    try:
+        with open(OPENINGS_CACHE_PATH, 'rb') as f:
+            data = pickle.load(f)
+        if data.get('fingerprint') == fingerprint:
+            return data['db'], data['trie']
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable openings cache: {e}")
+    return None
+
+def _save_compiled_openings(fingerprint, db, trie):
+    tmp_path = f"{OPENINGS_CACHE_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'fingerprint': fingerprint, 'db': db, 'trie': trie}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, OPENINGS_CACHE_PATH)
+    except OSError as e:
+        logger.warning(f"Could not write openings cache: {e}")
+
+def opening_data_fingerprint():
+    # Hash of the CSV contents, for caches of results that hold opening
+    # names. Unlike _csv_fingerprint it survives a checkout touching the file
+    global _data_fingerprint
+    with _opening_data_lock:
+        if _data_fingerprint is None:
+            try:
+                with open(OPENINGS_CSV_PATH, 'rb') as f:
+                    _data_fingerprint = hashlib.sha256(f.read()).hexdigest()[:16]
+            except OSError:
+                _data_fingerprint = 'none'
+        return _data_fingerprint
+
+def get_opening_data():
+    # Loaded on first use; the compiled pickle is rebuilt whenever the CSV changes
+    global _opening_data
+    with _opening_data_lock:
+        if _opening_data is None:
+            fingerprint = _csv_fingerprint()
+            compiled = _load_compiled_openings(fingerprint) if fingerprint else None
+            if compiled is None:
+                rows = load_opening_rows()
+                compiled = (load_opening_database(rows), build_opening_trie(rows))
+                if fingerprint and rows:
+                    _save_compiled_openings(fingerprint, *compiled)
+            _opening_data = compiled
+        return _opening_data
+
+def get_opening_db():
+    return get_opening_data()[0]
+
+def get_opening_trie():
+    return get_opening_data()[1]
+
+def __getattr__(name):
+    if name == 'OPENING_DB':
+        return get_opening_db()
+    if name == 'OPENING_TRIE':
+        return get_opening_trie()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def detect_opening(game):
-    eco = game.headers.get("ECO", "")
-    opening = game.headers.get("Opening", "")
+    if "FEN" in game.headers:
+        return detect_opening_from_headers(game.headers)
+    return detect_opening_from_headers(game.headers, lambda: get_opening_trie().lookup(game.mainline_moves()))
+
+def detect_opening_from_headers(headers, moves_opening=None):
+    # moves_opening is the trie match for the game, or a callable producing it
+    eco = headers.get("ECO", "")
+    opening = headers.get("Opening", "")
     
-    if eco and eco in OPENING_DB:
-        return OPENING_DB[eco]
+    opening_db = get_opening_db()
+    
+    if eco and eco in opening_db:
+        return opening_db[eco]
     elif opening:
         return opening
-    else:
-        return "Unknown Opening"
+    
+    if callable(moves_opening):
+        moves_opening = moves_opening()
+    if moves_opening:
+        return moves_opening
+    return "Unknown Opening"
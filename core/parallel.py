@@ -0,0 +1,233 @@
+import io
+import os
+import logging
+import threading
+import multiprocessing
+import chess.pgn
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import takewhile
+from core import metrics
+from core.budget import current_budget
+from core.columnar import AnalysisTable
+from core.positions import get_position_cache, record_counts
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', os.cpu_count() or 1))
+PARALLEL_MIN_GAMES = int(os.environ.get('PARALLEL_MIN_GAMES', 200))
+SHARDS_PER_WORKER = 4
+# How often a request waiting on the pool checks its deadline and cancellation
+SHARD_POLL_SECONDS = 0.25
+# Workers must not be forked from the serving process: a fork copies locks held
+# by its other threads (logging, Gradio, the job workers) and can deadlock on them
+ANALYSIS_START_METHOD = os.environ.get('ANALYSIS_START_METHOD', 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def iter_pgn_texts(pgn_content):
+    # Cut the upload into one text per game without building move trees
+    pgn_io = io.StringIO(pgn_content)
+    while True:
+        start = pgn_io.tell()
+        try:
+            headers = chess.pgn.read_headers(pgn_io)
+        except Exception:
+            break
+        if headers is None:
+            break
+        yield pgn_content[start:pgn_io.tell()]
+
+
+def split_pgn_text(pgn_content):
+    return list(iter_pgn_texts(pgn_content))
+
+
+def analyze_pgn_text(pgn_text, username, max_plies=0):
+    from core.core import iter_game_analyses
+
+    return next(iter_game_analyses(io.StringIO(pgn_text), username, max_plies), None)
+
+
+def analyze_pgn_shard(pgn_texts, username, max_plies=0):
+    # Workers have their own position cache, so its hit counts travel back with the results
+    results = [analyze_pgn_text(pgn_text, username, max_plies) for pgn_text in pgn_texts]
+    return results, get_position_cache().take_counts()
+
+
+def _cacheable(result):
+    # A game cut short by a ply limit must not stand in for its full analysis
+    return not result[0].get('truncated')
+
+
+def _get_executor(workers):
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(ANALYSIS_START_METHOD))
+            _executor_workers = workers
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = None
+
+
+def _make_shards(pgn_texts, shard_count):
+    shard_size = -(-len(pgn_texts) // shard_count)
+    return [pgn_texts[i:i + shard_size] for i in range(0, len(pgn_texts), shard_size)]
+
+
+def _analyze_serial(pgn_texts, username, cache, max_plies):
+    for pgn_text in pgn_texts:
+        key = cache.key(pgn_text, username)
+        result = cache.get(key)
+        if result is None:
+            result = analyze_pgn_text(pgn_text, username, max_plies)
+            if result is None:
+                metrics.inc('pgn_errors_total')
+                continue
+            if _cacheable(result):
+                cache.put(key, result)
+        yield pgn_text, result
+
+
+def _collect_shards(futures, budget):
+    # Results by shard index of the shards that finish before the budget runs
+    # out; shards not started by then are cancelled and their games dropped
+    if budget is None:
+        return {index: future.result() for index, future in enumerate(futures)}
+    pending = {future: index for index, future in enumerate(futures)}
+    shard_results = {}
+    try:
+        while pending and not budget.expired():
+            finished, _ = wait(pending, timeout=SHARD_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in finished:
+                shard_results[pending.pop(future)] = future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+    return shard_results
+
+
+def _analyze_parallel(pgn_texts, username, workers, cache, budget):
+    keys = [cache.key(pgn_text, username) for pgn_text in pgn_texts]
+    results = [cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+
+    if missing:
+        shards = _make_shards([pgn_texts[i] for i in missing], workers * SHARDS_PER_WORKER)
+        shard_indices = _make_shards(missing, workers * SHARDS_PER_WORKER)
+        logger.info(f"Analyzing {len(missing)} of {len(pgn_texts)} games in {len(shards)} shards on {workers} workers")
+        max_plies = budget.max_plies if budget is not None else 0
+        try:
+            executor = _get_executor(workers)
+            shard_results = _collect_shards([executor.submit(analyze_pgn_shard, shard, username, max_plies) for shard in shards], budget)
+        except BrokenProcessPool as e:
+            logger.error(f"Analysis pool failed, falling back to serial: {str(e)}")
+            _reset_executor()
+            return None
+
+        record_counts('position', sum(counts[0] for _, counts in shard_results.values()), sum(counts[1] for _, counts in shard_results.values()))
+        # Games of shards the budget cut off stay None and are dropped below
+        for shard_index, (shard, _) in shard_results.items():
+            for i, result in zip(shard_indices[shard_index], shard):
+                if result is not None:
+                    results[i] = result
+                    if _cacheable(result):
+                        cache.put(keys[i], result)
+                else:
+                    metrics.inc('pgn_errors_total')
+
+    return [(pgn_text, result) for pgn_text, result in zip(pgn_texts, results) if result is not None]
+
+
+def _analyze_texts(pgn_content, username, workers, min_games, cache, budget):
+    max_plies = budget.max_plies if budget is not None else 0
+    if workers > 1:
+        pgn_texts = pgn_content if isinstance(pgn_content, list) else split_pgn_text(pgn_content)
+        if len(pgn_texts) >= min_games:
+            if budget is not None:
+                # Games over the budget are never handed to the pool
+                pgn_texts = list(budget.games_within(pgn_texts))
+            results = _analyze_parallel(pgn_texts, username, workers, cache, budget)
+            if results is not None:
+                return results
+            if budget is not None:
+                # The pool broke after these games were admitted, so only the clock is checked
+                return _analyze_serial(takewhile(lambda _: not budget.expired(), pgn_texts), username, cache, max_plies)
+        pgn_content = pgn_texts
+
+    # Serial path streams over the content, one game at a time
+    pgn_texts = pgn_content if isinstance(pgn_content, list) else iter_pgn_texts(pgn_content)
+    if budget is not None:
+        pgn_texts = budget.games_within(pgn_texts)
+    return _analyze_serial(pgn_texts, username, cache, max_plies)
+
+
+def _analyze_chunks(pgn_file, username, workers, min_games, cache, budget):
+    # Indexed files are decoded and analyzed a bounded chunk of games at a time
+    for pgn_texts in pgn_file.iter_text_chunks():
+        yield from _analyze_texts(pgn_texts, username, workers, min_games, cache, budget)
+        if budget is not None and budget.reason is not None:
+            break
+
+
+def iter_pgn_analyses(pgn_content, username, workers=None, min_games=None, cache=None):
+    # Yields (pgn_text, (analysis, elo)) for every game that parsed and fit
+    # in the current request budget, if there is one
+    from core.cache import get_analysis_cache
+    from core.engine import ENGINE_REQUEST_SECONDS, EngineBudget, get_engine_pool, review_games
+
+    workers = ANALYSIS_WORKERS if workers is None else workers
+    min_games = PARALLEL_MIN_GAMES if min_games is None else min_games
+    cache = get_analysis_cache() if cache is None else cache
+    budget = current_budget()
+
+    if hasattr(pgn_content, 'iter_text_chunks'):
+        results = _analyze_chunks(pgn_content, username, workers, min_games, cache, budget)
+    else:
+        results = _analyze_texts(pgn_content, username, workers, min_games, cache, budget)
+
+    engine_pool = get_engine_pool()
+    if engine_pool is not None:
+        # Engine review needs every game up front to spend its budget where it matters most
+        results = list(results)
+        engine_budget = None
+        if budget is not None and budget.deadline is not None:
+            engine_budget = EngineBudget(seconds=min(ENGINE_REQUEST_SECONDS, budget.remaining()))
+        with metrics.stage('engine'):
+            analyses = review_games([(pgn_text, analysis) for pgn_text, (analysis, _) in results], username, engine_pool, engine_budget)
+        results = [(pgn_text, (analysis, elo)) for (pgn_text, (_, elo)), analysis in zip(results, analyses)]
+
+    for pgn_text, result in results:
+        if budget is not None and result[0].get('truncated'):
+            budget.truncated_games += 1
+        yield pgn_text, result
+
+    cache.flush()
+    get_position_cache().report()
+    logger.info(f"Analysis cache: {cache.hits} hits, {cache.misses} misses")
+
+
+def analyze_pgn_content(pgn_content, username, workers=None, min_games=None, cache=None):
+    from core.core import average_rating, new_opening_stats, new_color_stats
+
+    table = AnalysisTable()
+    for _, (analysis, elo) in iter_pgn_analyses(pgn_content, username, workers, min_games, cache):
+        table.append(analysis, elo)
+
+    opening_stats = new_opening_stats()
+    color_stats = new_color_stats()
+    table.tally(opening_stats, color_stats)
+
+    return table, opening_stats, color_stats, average_rating(table.elos())
@@ -0,0 +1,134 @@
+import os
+import threading
+from collections import OrderedDict
+import chess
+import chess.polyglot
+from core import metrics
+
+POSITION_CACHE_SIZE = int(os.environ.get('POSITION_CACHE_SIZE', 200000))
+# Past the opening, games rarely transpose into each other, so keys stop being tracked
+POSITION_CACHE_PLIES = int(os.environ.get('POSITION_CACHE_PLIES', 24))
+
+_RANDOM = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+_CASTLING_KEYS = (
+    (chess.BB_H1, _RANDOM[768]), (chess.BB_A1, _RANDOM[769]),
+    (chess.BB_H8, _RANDOM[770]), (chess.BB_A8, _RANDOM[771])
+)
+_TURN_KEY = _RANDOM[780]
+
+_MISSING = object()
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _piece_key(piece_type, color, square):
+    # Polyglot orders black before white within each piece type
+    return _RANDOM[64 * ((piece_type - 1) * 2 + (color == chess.WHITE)) + square]
+
+
+class ZobristTracker:
+    # Keeps the polyglot piece hash up to date move by move; castling, en
+    # passant and turn are cheap to read off the board, so they are added on
+    # demand. key() equals chess.polyglot.zobrist_hash(board)
+    def __init__(self, board):
+        self.hasher = chess.polyglot.ZobristHasher(_RANDOM)
+        self.pieces = self.hasher.hash_board(board)
+        self.stale = False
+
+    def push(self, board, move):
+        # Call with the board before the move, like MaterialTracker.push
+        if board.is_castling(move):
+            # Rare enough that a full recount in key() is simpler than the rook bookkeeping
+            self.stale = True
+            return
+
+        piece_type = board.piece_type_at(move.from_square)
+        color = board.turn
+        pieces = self.pieces ^ _piece_key(piece_type, color, move.from_square)
+
+        if board.is_en_passant(move):
+            captured_square = move.to_square + (-8 if color == chess.WHITE else 8)
+            pieces ^= _piece_key(chess.PAWN, not color, captured_square)
+        else:
+            captured = board.piece_type_at(move.to_square)
+            if captured:
+                pieces ^= _piece_key(captured, not color, move.to_square)
+
+        self.pieces = pieces ^ _piece_key(move.promotion or piece_type, color, move.to_square)
+
+    def key(self, board):
+        if self.stale:
+            self.pieces = self.hasher.hash_board(board)
+            self.stale = False
+        key = self.pieces
+        castling = board.castling_rights
+        for mask, value in _CASTLING_KEYS:
+            if castling & mask:
+                key ^= value
+        return key ^ self.hasher.hash_ep_square(board) ^ (_TURN_KEY if board.turn == chess.WHITE else 0)
+
+
+class PositionCache:
+    # Bounded LRU from position keys to whatever verdict the caller stores.
+    # Hits and misses are plain counters so worker processes can report them
+    # back; report() turns the delta since the last call into metrics
+    def __init__(self, max_entries=POSITION_CACHE_SIZE, name='position'):
+        self.max_entries = max_entries
+        self.name = name
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reported = (0, 0)
+
+    def get(self, key, default=None):
+        with self.lock:
+            value = self.entries.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def take_counts(self):
+        with self.lock:
+            hits, misses = self.hits - self.reported[0], self.misses - self.reported[1]
+            self.reported = (self.hits, self.misses)
+        return hits, misses
+
+    def report(self, counts=None):
+        hits, misses = self.take_counts() if counts is None else counts
+        record_counts(self.name, hits, misses)
+        return hits, misses
+
+
+def record_counts(name, hits, misses):
+    if hits:
+        metrics.inc('cache_requests_total', hits, cache=name, result='hit')
+    if misses:
+        metrics.inc('cache_requests_total', misses, cache=name, result='miss')
+
+
+def get_position_cache():
+    # One per process: parallel workers each keep their own, and it outlives
+    # a single request so popular openings stay warm
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PositionCache()
+        return _cache
@@ -0,0 +1,213 @@
+import os
+import io
+import sys
+import csv
+import bz2
+import gzip
+import json
+import mmap
+import random
+import struct
+import logging
+import argparse
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+PUZZLE_DB_PATH = os.environ.get('PUZZLE_DB_PATH', os.path.join(DATA_DIR, 'puzzles.bin'))
+
+# Layout: magic | header | puzzle ids (8 bytes each) | per-theme blocks | JSON directory.
+# A theme block holds its puzzles' ratings (uint16, sorted) followed by their
+# indices into the id table (uint32); everything is little-endian.
+MAGIC = b'UZPUZ001'
+HEADER = struct.Struct('<IIQ')
+ID_SIZE = 8
+
+_store = None
+_store_loaded = False
+_store_lock = threading.Lock()
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8', newline='')
+    if path.endswith('.zst'):
+        import zstandard
+        raw = open(path, 'rb')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw), encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def _little_endian(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def build_puzzle_store(csv_path, out_path, min_popularity=None):
+    ids = bytearray()
+    ratings = array('H')
+    theme_members = defaultdict(lambda: array('I'))
+
+    with _open_text(csv_path) as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            if min_popularity is not None and int(row.get('Popularity') or 0) < min_popularity:
+                continue
+            puzzle_id = row['PuzzleId'].encode('ascii')
+            if len(puzzle_id) > ID_SIZE:
+                continue
+
+            index = len(ratings)
+            ids += puzzle_id.ljust(ID_SIZE, b'\0')
+            ratings.append(min(int(row['Rating']), 0xFFFF))
+            for theme in row.get('Themes', '').split():
+                theme_members[theme].append(index)
+
+    directory = {}
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as out:
+        out.write(MAGIC)
+        out.write(HEADER.pack(len(ratings), 0, 0))
+        out.write(ids)
+
+        for theme, members in sorted(theme_members.items()):
+            ordered = array('I', sorted(members, key=ratings.__getitem__))
+            theme_ratings = array('H', (ratings[i] for i in ordered))
+
+            ratings_offset = out.tell()
+            out.write(_little_endian(theme_ratings))
+            if out.tell() % 4:
+                out.write(b'\0' * (4 - out.tell() % 4))
+            indices_offset = out.tell()
+            out.write(_little_endian(ordered))
+            directory[theme] = [ratings_offset, indices_offset, len(ordered)]
+
+        directory_offset = out.tell()
+        out.write(json.dumps(directory).encode('utf-8'))
+        out.seek(len(MAGIC))
+        out.write(HEADER.pack(len(ratings), 0, directory_offset))
+
+    os.replace(tmp_path, out_path)
+    logger.info(f"Built puzzle store with {len(ratings)} puzzles and {len(directory)} themes: {out_path}")
+    return len(ratings)
+
+
+class PuzzleStore:
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise ValueError("Puzzle store is only readable on little-endian hosts")
+
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a puzzle store: {path}")
+
+        self.count, _, directory_offset = HEADER.unpack_from(self.mm, len(MAGIC))
+        self.directory = json.loads(self.mm[directory_offset:].decode('utf-8'))
+        self.view = memoryview(self.mm)
+        self.ids_offset = len(MAGIC) + HEADER.size
+        self.theme_views = {}
+
+    def themes(self):
+        return list(self.directory)
+
+    def _theme_index(self, theme):
+        index = self.theme_views.get(theme)
+        if index is None:
+            entry = self.directory.get(theme)
+            if entry is None:
+                return None
+            ratings_offset, indices_offset, size = entry
+            index = (
+                self.view[ratings_offset:ratings_offset + size * 2].cast('H'),
+                self.view[indices_offset:indices_offset + size * 4].cast('I')
+            )
+            self.theme_views[theme] = index
+        return index
+
+    def puzzle_id(self, index):
+        start = self.ids_offset + index * ID_SIZE
+        return bytes(self.view[start:start + ID_SIZE]).rstrip(b'\0').decode('ascii')
+
+    def count_in_range(self, theme, rating, window=300):
+        index = self._theme_index(theme)
+        if index is None:
+            return 0
+        ratings = index[0]
+        return bisect_right(ratings, rating + window) - bisect_left(ratings, rating - window)
+
+    def find_puzzles(self, themes, rating, count, window=300, rng=None):
+        rng = rng or random
+        ranges = []
+        for theme in themes:
+            index = self._theme_index(theme)
+            if index is None:
+                continue
+            ratings, indices = index
+            lo = bisect_left(ratings, rating - window)
+            hi = bisect_right(ratings, rating + window)
+            if hi > lo:
+                ranges.append((theme, ratings, indices, lo, hi))
+
+        puzzles = []
+        seen = set()
+        attempts = 0
+        # Round-robin over the themes, sampling inside each rating window
+        while ranges and len(puzzles) < count and attempts < count * 10:
+            theme, ratings, indices, lo, hi = ranges[attempts % len(ranges)]
+            attempts += 1
+            position = rng.randrange(lo, hi)
+            puzzle_index = indices[position]
+            if puzzle_index in seen:
+                continue
+            seen.add(puzzle_index)
+
+            puzzle_id = self.puzzle_id(puzzle_index)
+            puzzles.append({
+                'id': puzzle_id,
+                'url': f"https://lichess.org/training/{puzzle_id}",
+                'theme': theme.title(),
+                'rating': ratings[position],
+                'themes': [theme]
+            })
+
+        return puzzles
+
+
+def get_puzzle_store():
+    global _store, _store_loaded
+    with _store_lock:
+        if not _store_loaded:
+            _store_loaded = True
+            if os.path.exists(PUZZLE_DB_PATH):
+                try:
+                    _store = PuzzleStore(PUZZLE_DB_PATH)
+                    logger.info(f"Loaded puzzle store with {_store.count} puzzles")
+                except (OSError, ValueError) as e:
+                    logger.error(f"Failed to open puzzle store: {e}")
+            else:
+                logger.warning(f"Puzzle store not found at {PUZZLE_DB_PATH}; using generic training links")
+        return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline puzzle store from a Lichess puzzle CSV dump")
+    parser.add_argument('csv_path', help="lichess_db_puzzle.csv (.gz, .bz2 or .zst also accepted)")
+    parser.add_argument('out_path', nargs='?', default=PUZZLE_DB_PATH)
+    parser.add_argument('--min-popularity', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    build_puzzle_store(args.csv_path, args.out_path, args.min_popularity)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import os
+import time
+import heapq
+import random
+import logging
+import threading
+import itertools
+import contextvars
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from core import metrics
+from core.budget import current_budget
+
+logger = logging.getLogger(__name__)
+
+# Requests per second and burst size for each upstream, shared by every caller in the process
+RATE_LIMITS = {
+    'chess_com': (float(os.environ.get('CHESS_COM_RATE', 5)), int(os.environ.get('CHESS_COM_BURST', 10))),
+    'lichess': (float(os.environ.get('LICHESS_RATE', 1)), int(os.environ.get('LICHESS_BURST', 2))),
+    'gemini': (float(os.environ.get('GEMINI_RATE', 1)), int(os.environ.get('GEMINI_BURST', 4)))
+}
+RATE_LIMIT_RETRIES = int(os.environ.get('RATE_LIMIT_RETRIES', 3))
+BACKOFF_BASE = float(os.environ.get('BACKOFF_BASE', 0.5))
+BACKOFF_MAX = float(os.environ.get('BACKOFF_MAX', 30))
+# How often a waiter with a request budget checks whether it was cancelled
+BUDGET_POLL_SECONDS = 0.25
+
+# Lower values are served first
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BATCH: 'batch'}
+THROTTLED_STATUSES = (429, 503)
+
+_priority = contextvars.ContextVar('uzchess_priority', default=INTERACTIVE)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class TokenBucket:
+    # Waiters queue by (priority, arrival), so batch work only gets a token
+    # when no interactive request is waiting. A throttling response pauses
+    # the whole bucket, since upstreams count every caller from this host
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority=None, deadline=None):
+        # deadline is a time.monotonic() value. The request budget, if any,
+        # bounds the wait too, so a cancelled or expired request gets
+        # TimeoutError instead of spending a token after it gave up
+        priority = _priority.get() if priority is None else priority
+        if self.rate <= 0:
+            return 0.0
+        budget = current_budget()
+        if budget is not None and budget.deadline is not None:
+            deadline = budget.deadline if deadline is None else min(deadline, budget.deadline)
+
+        start = time.monotonic()
+        ticket = (priority, next(self.sequence))
+        with self.condition:
+            heapq.heappush(self.waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if (deadline is not None and now >= deadline) or (budget is not None and budget.cancelled.is_set()):
+                        metrics.inc('rate_limit_expired_total', service=self.name)
+                        raise TimeoutError(f"{self.name} rate limit wait outlived its request")
+                    left = None if deadline is None else deadline - now
+                    if budget is not None:
+                        left = BUDGET_POLL_SECONDS if left is None else min(left, BUDGET_POLL_SECONDS)
+                    if self.waiters[0] != ticket:
+                        # Only the head of the queue watches the clock
+                        self.condition.wait(left)
+                        continue
+                    wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+                    if wait <= 0:
+                        self.tokens -= 1
+                        break
+                    self.condition.wait(wait if left is None else min(wait, left))
+            finally:
+                self.waiters.remove(ticket)
+                heapq.heapify(self.waiters)
+                self.condition.notify_all()
+
+        waited = time.monotonic() - start
+        priority_name = PRIORITY_NAMES.get(priority, str(priority))
+        metrics.observe('rate_limit_wait_seconds', waited, service=self.name, priority=priority_name)
+        if waited >= 0.001:
+            metrics.inc('rate_limit_wait_ms_total', round(waited * 1000), service=self.name, priority=priority_name)
+        return waited
+
+    def pause(self, seconds):
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.condition.notify_all()
+
+
+def get_limiter(service):
+    with _limiters_lock:
+        limiter = _limiters.get(service)
+        if limiter is None:
+            rate, burst = RATE_LIMITS.get(service, (0, 1))
+            limiter = _limiters[service] = TokenBucket(service, rate, burst)
+        return limiter
+
+
+def current_priority():
+    return _priority.get()
+
+
+@contextmanager
+def priority_scope(priority):
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def run_with_priority(priority, fn, *args):
+    # Thread target helper: new threads start from the default (interactive) priority
+    with priority_scope(priority):
+        return fn(*args)
+
+
+def parse_retry_after(value):
+    # Retry-After is either delay seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max((moment - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def backoff_delay(attempt, retry_after=None):
+    # Full jitter on the exponential step; a server-given delay is honored
+    # with a little jitter on top so paused callers do not return in lockstep
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX) + random.uniform(0, BACKOFF_BASE)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def throttle(service, attempt, retry_after=None):
+    # Called after a throttling response; every caller of the service waits it out
+    delay = backoff_delay(attempt, retry_after)
+    metrics.inc('rate_limited_total', service=service)
+    logger.warning(f"{service} throttled us, backing off {delay:.2f}s (attempt {attempt + 1})")
+    get_limiter(service).pause(delay)
+    return delay
+
+
+def is_throttling_error(error):
+    # Client libraries raise instead of returning a response; google.api_core
+    # errors carry the HTTP status as .code
+    code = getattr(error, 'code', None)
+    return code in THROTTLED_STATUSES or type(error).__name__ in ('ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable')
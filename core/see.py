@@ -0,0 +1,86 @@
+import chess
+
+# Same scale as core.material; the king only matters as the last capturer
+SEE_VALUES = [0, 1, 3, 3, 5, 9, 100]
+
+_BB_SQUARES = chess.BB_SQUARES
+_KNIGHT_ATTACKS = chess.BB_KNIGHT_ATTACKS
+_KING_ATTACKS = chess.BB_KING_ATTACKS
+_PAWN_ATTACKS = chess.BB_PAWN_ATTACKS
+_RANK_MASKS = chess.BB_RANK_MASKS
+_FILE_MASKS = chess.BB_FILE_MASKS
+_DIAG_MASKS = chess.BB_DIAG_MASKS
+_RANK_ATTACKS = chess.BB_RANK_ATTACKS
+_FILE_ATTACKS = chess.BB_FILE_ATTACKS
+_DIAG_ATTACKS = chess.BB_DIAG_ATTACKS
+
+
+def attackers_mask(board, square, occupied):
+    # Attackers of both colors through the given occupancy, so sliders behind
+    # a piece that has already captured (x-rays) show up once it is removed
+    rooks_and_queens = board.rooks | board.queens
+    bishops_and_queens = board.bishops | board.queens
+    attackers = (
+        (_KNIGHT_ATTACKS[square] & board.knights) |
+        (_KING_ATTACKS[square] & board.kings) |
+        (_RANK_ATTACKS[square][_RANK_MASKS[square] & occupied] & rooks_and_queens) |
+        (_FILE_ATTACKS[square][_FILE_MASKS[square] & occupied] & rooks_and_queens) |
+        (_DIAG_ATTACKS[square][_DIAG_MASKS[square] & occupied] & bishops_and_queens) |
+        (_PAWN_ATTACKS[chess.WHITE][square] & board.pawns & board.occupied_co[chess.BLACK]) |
+        (_PAWN_ATTACKS[chess.BLACK][square] & board.pawns & board.occupied_co[chess.WHITE])
+    )
+    return attackers & occupied
+
+
+def _least_valuable(board, attackers):
+    for piece_type, pieces in ((chess.PAWN, board.pawns), (chess.KNIGHT, board.knights), (chess.BISHOP, board.bishops),
+                               (chess.ROOK, board.rooks), (chess.QUEEN, board.queens), (chess.KING, board.kings)):
+        bb = attackers & pieces
+        if bb:
+            return (bb & -bb).bit_length() - 1, piece_type
+    return None, None
+
+
+def _exchange(board, square, from_square, attacker_type, side):
+    # Swap-list evaluation of the capture sequence on one square. The first
+    # capture is forced; every later one is optional for the side to play it
+    occupied = board.occupied
+    target_type = board.piece_type_at(square)
+    gains = [SEE_VALUES[target_type] if target_type else 0]
+
+    while True:
+        gains.append(SEE_VALUES[attacker_type] - gains[-1])
+        occupied &= ~_BB_SQUARES[from_square]
+        side = not side
+        attackers = attackers_mask(board, square, occupied) & board.occupied_co[side]
+        from_square, attacker_type = _least_valuable(board, attackers)
+        if from_square is None:
+            break
+
+    for i in range(len(gains) - 2, 0, -1):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+
+def see(board, move):
+    # Material the side to move nets by playing the capture move and letting
+    # both sides trade on the target square for as long as it pays
+    attacker_type = board.piece_type_at(move.from_square)
+    if attacker_type is None:
+        return 0
+    return _exchange(board, move.to_square, move.from_square, attacker_type, board.turn)
+
+
+def capture_value(board, square):
+    # Best the side to move can net by starting the exchange on square with
+    # its least valuable attacker; 0 if it has none or the trade loses
+    attackers = attackers_mask(board, square, board.occupied) & board.occupied_co[board.turn]
+    from_square, attacker_type = _least_valuable(board, attackers)
+    if from_square is None:
+        return 0
+    return max(0, _exchange(board, square, from_square, attacker_type, board.turn))
+
+
+def is_hanging(board, square):
+    # Called on the board after a move: can the opponent win material on square
+    return capture_value(board, square) > 0
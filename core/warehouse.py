@@ -0,0 +1,403 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import sqlite3
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from core import metrics
+from core.cache import game_cache_key
+from core.chess_api import ARCHIVE_FETCH_CONCURRENCY, archive_month, fetch_archive_list, fetch_archive_games
+from core.budget import budget_scope, current_budget
+from core.columnar import AnalysisTable
+from core.parallel import iter_pgn_analyses
+from core.ratelimit import BATCH, priority_scope
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: without a path, Chess.com requests fetch the last three months as before
+WAREHOUSE_PATH = os.environ.get('WAREHOUSE_PATH')
+# Months pulled on a player's first interactive sync, like the live path; 0
+# pulls the whole history. The CLI backfills everything unless told otherwise
+WAREHOUSE_SYNC_MONTHS = int(os.environ.get('WAREHOUSE_SYNC_MONTHS', 3))
+# Reports prefer these time classes and fall back to every game when none match
+WAREHOUSE_TIME_CLASSES = tuple(name for name in os.environ.get('WAREHOUSE_TIME_CLASSES', 'rapid,blitz').split(',') if name)
+# Ratings drift over a long history, so the report averages only recent games
+WAREHOUSE_RATING_GAMES = int(os.environ.get('WAREHOUSE_RATING_GAMES', 50))
+REFRESH_CHUNK_GAMES = 1000
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS games (
+        player TEXT NOT NULL,
+        game_id TEXT NOT NULL,
+        end_time INTEGER NOT NULL,
+        time_class TEXT,
+        opening TEXT NOT NULL,
+        user_color INTEGER,
+        user_result TEXT,
+        result TEXT,
+        plies INTEGER NOT NULL,
+        elo INTEGER,
+        mistakes TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        pgn TEXT NOT NULL,
+        PRIMARY KEY (player, game_id)
+    )""",
+    # The aggregate queries only read index pages: each index covers the
+    # columns its GROUP BY and filters touch
+    "CREATE INDEX IF NOT EXISTS games_by_date ON games (player, end_time)",
+    "CREATE INDEX IF NOT EXISTS games_by_opening ON games (player, opening, time_class, user_color, user_result)",
+    "CREATE INDEX IF NOT EXISTS games_by_color ON games (player, user_color, user_result, time_class)",
+    "CREATE INDEX IF NOT EXISTS games_by_time_class ON games (player, time_class, end_time)",
+)
+
+_warehouse = None
+_warehouse_loaded = False
+_warehouse_lock = threading.Lock()
+
+
+def _epoch(date_text, days=0):
+    # Accepts YYYY-MM-DD or PGN style YYYY.MM.DD, as the batch filters do
+    day = datetime.strptime(date_text.replace('.', '-'), '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    return int((day + timedelta(days=days)).timestamp())
+
+
+def _month_of(end_time):
+    moment = datetime.fromtimestamp(end_time, timezone.utc)
+    return moment.year, moment.month
+
+
+def game_id(game):
+    return game.get('url') or game.get('uuid') or game_cache_key(game['pgn'], '', 0)
+
+
+class GameWarehouse:
+    # Fetched games and their per-game analysis, one row per (player, game).
+    # Stored rows are kept at the analyzer version that produced them and
+    # re-analyzed from the stored PGN when that version changes
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.sync_locks = {}
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                self.db.execute(statement)
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def _player_lock(self, player):
+        # Two requests for the same player must not both pull the same new games
+        with self.lock:
+            return self.sync_locks.setdefault(player, threading.Lock())
+
+    def last_end_time(self, player):
+        return self._query("SELECT MAX(end_time) FROM games WHERE player = ?", (player,))[0][0]
+
+    def first_end_time(self, player):
+        return self._query("SELECT MIN(end_time) FROM games WHERE player = ?", (player,))[0][0]
+
+    def _filters(self, player, time_classes=None, since=None, until=None):
+        # Dates are inclusive, like HeaderFilter
+        clauses = ["player = ?"]
+        params = [player]
+        if time_classes:
+            clauses.append(f"time_class IN ({', '.join('?' * len(time_classes))})")
+            params.extend(time_classes)
+        if since:
+            clauses.append("end_time >= ?")
+            params.append(_epoch(since))
+        if until:
+            clauses.append("end_time < ?")
+            params.append(_epoch(until, days=1))
+        return " AND ".join(clauses), params
+
+    def count(self, player, **filters):
+        where, params = self._filters(player.strip().lower(), **filters)
+        return self._query(f"SELECT COUNT(*) FROM games WHERE {where}", params)[0][0]
+
+    def opening_stats(self, player, **filters):
+        from core.core import new_opening_stats
+
+        where, params = self._filters(player.strip().lower(), **filters)
+        rows = self._query(
+            "SELECT opening, IFNULL(SUM(user_result = 'win'), 0), IFNULL(SUM(user_result = 'loss'), 0), "
+            "IFNULL(SUM(user_result = 'draw'), 0), COUNT(*) "
+            f"FROM games WHERE {where} AND user_color IS NOT NULL GROUP BY opening ORDER BY COUNT(*) DESC, opening",
+            params
+        )
+        opening_stats = new_opening_stats()
+        for opening, wins, losses, draws, total in rows:
+            opening_stats[opening].update(wins=wins, losses=losses, draws=draws, total=total)
+        return opening_stats
+
+    def color_stats(self, player, **filters):
+        from core.core import new_color_stats
+
+        where, params = self._filters(player.strip().lower(), **filters)
+        rows = self._query(
+            f"SELECT user_color, user_result, COUNT(*) FROM games WHERE {where} "
+            "AND user_color IS NOT NULL AND user_result IS NOT NULL GROUP BY user_color, user_result",
+            params
+        )
+        color_stats = new_color_stats()
+        for user_color, user_result, total in rows:
+            stats = color_stats['white' if user_color else 'black']
+            key = {'win': 'wins', 'loss': 'losses', 'draw': 'draws'}.get(user_result)
+            if key:
+                stats[key] += total
+        return color_stats
+
+    def recent_rating(self, player, games=WAREHOUSE_RATING_GAMES, **filters):
+        from core.core import average_rating
+
+        where, params = self._filters(player.strip().lower(), **filters)
+        rows = self._query(
+            f"SELECT elo FROM games WHERE {where} AND elo IS NOT NULL ORDER BY end_time DESC LIMIT ?",
+            params + [games]
+        )
+        return average_rating([elo for elo, in rows])
+
+    def load_table(self, player, **filters):
+        where, params = self._filters(player.strip().lower(), **filters)
+        rows = self._query(
+            f"SELECT opening, user_color, user_result, plies, elo, mistakes FROM games WHERE {where} ORDER BY end_time",
+            params
+        )
+        table = AnalysisTable()
+        for opening, user_color, user_result, plies, elo, mistakes in rows:
+            table.append({
+                'opening': opening,
+                'user_color': user_color,
+                'user_result': user_result,
+                'plies': plies,
+                'mistakes': json.loads(mistakes)
+            }, elo)
+        return table
+
+    def analysis_inputs(self, player, time_classes=WAREHOUSE_TIME_CLASSES):
+        # Same shape as analyze_pgn_content, over the player's stored history
+        if time_classes and not self.count(player, time_classes=time_classes):
+            time_classes = None
+        return (
+            self.load_table(player, time_classes=time_classes),
+            self.opening_stats(player, time_classes=time_classes),
+            self.color_stats(player, time_classes=time_classes),
+            self.recent_rating(player, time_classes=time_classes)
+        )
+
+    def _archives_to_fetch(self, archives, last_end_time, months):
+        if last_end_time is None:
+            return archives[-months:] if months > 0 else archives
+        # The month of the newest stored game may have gained games since
+        since_month = _month_of(last_end_time)
+        return [url for url in archives if (archive_month(url) or since_month) >= since_month]
+
+    def _archives_to_backfill(self, archives, first_end_time, months):
+        # Months older than the stored history, which a windowed first sync
+        # left out. Stored months are always whole, so the oldest one is not
+        # fetched again. Newest first, so an interrupted backfill leaves no gap
+        if months > 0 or first_end_time is None:
+            return []
+        first_month = _month_of(first_end_time)
+        return [url for url in reversed(archives) if (archive_month(url) or first_month) < first_month]
+
+    def _analyze_rows(self, player, username, games):
+        by_text = {game['pgn']: game for game in games}
+        rows = []
+        # Stored rows must be complete, so request budgets apply between months, not games
+        with budget_scope(None):
+            analyzed = list(iter_pgn_analyses(list(by_text), username))
+        for pgn_text, (analysis, elo) in analyzed:
+            game = by_text[pgn_text]
+            user_color = analysis['user_color']
+            rows.append((
+                player, game_id(game), int(game.get('end_time') or 0), game.get('time_class'),
+                analysis['opening'], None if user_color is None else int(user_color),
+                analysis.get('user_result'), analysis.get('result'), analysis.get('plies', 0), elo,
+                json.dumps(analysis['mistakes']), self.version, pgn_text
+            ))
+        return rows
+
+    def _store(self, rows):
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO games (player, game_id, end_time, time_class, opening, user_color, user_result, "
+                "result, plies, elo, mistakes, version, pgn) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self.db.commit()
+
+    def _refresh_stale(self, player, username, budget=None):
+        # Rows a budget stops short of keep their old version and are picked up
+        # by the next sync, like the months _sync leaves unfetched
+        stale = self._query(
+            "SELECT game_id, end_time, time_class, pgn FROM games WHERE player = ? AND version != ?",
+            (player, self.version)
+        )
+        refreshed = 0
+        for chunk_start in range(0, len(stale), REFRESH_CHUNK_GAMES):
+            games = [{'url': gid, 'end_time': end_time, 'time_class': time_class, 'pgn': pgn}
+                     for gid, end_time, time_class, pgn in stale[chunk_start:chunk_start + REFRESH_CHUNK_GAMES]]
+            if budget is not None:
+                allowed = set(budget.games_within([game['pgn'] for game in games]))
+                games = [game for game in games if game['pgn'] in allowed]
+            if not games:
+                break
+            with metrics.stage('analyze'):
+                self._store(self._analyze_rows(player, username, games))
+            refreshed += len(games)
+        return refreshed
+
+    def sync(self, username, months=None):
+        # Pulls and analyzes only games newer than the newest stored one. Months
+        # are stored oldest first and committed one by one, so an interrupted
+        # first sync resumes where it stopped. months bounds a first sync
+        # (WAREHOUSE_SYNC_MONTHS by default); 0 also backfills older months
+        player = username.strip().lower()
+        months = WAREHOUSE_SYNC_MONTHS if months is None else months
+        with self._player_lock(player):
+            try:
+                return self._sync(player, username, months)
+            except Exception as e:
+                logger.error(f"Warehouse sync failed for {player}: {str(e)}")
+                return None, f"❌ Xatolik: {str(e)}"
+
+    def _sync(self, player, username, months):
+        start = time.perf_counter()
+        budget = current_budget()
+        with metrics.stage('fetch'):
+            try:
+                archives, error = fetch_archive_list(player)
+            except TimeoutError:
+                # Out of time before the list came back: report from what is stored
+                if budget is None or not budget.expired():
+                    raise
+                archives, error = [], None
+        if error:
+            return None, error
+
+        last_end_time = self.last_end_time(player)
+        known = set()
+        if last_end_time is not None:
+            known = {gid for gid, in self._query(
+                "SELECT game_id FROM games WHERE player = ? AND end_time = ?", (player, last_end_time)
+            )}
+        newer = self._archives_to_fetch(archives, last_end_time, months)
+        older = self._archives_to_backfill(archives, self.first_end_time(player), months)
+
+        def is_fresh(game):
+            return (last_end_time is None or (game.get('end_time') or 0) >= last_end_time) and game_id(game) not in known
+
+        added = self._pull_months(player, username, newer, is_fresh, budget)
+        if older:
+            logger.info(f"Warehouse backfill for {player}: {len(older)} older archives")
+            added += self._pull_months(player, username, older, lambda game: True, budget)
+
+        refreshed = self._refresh_stale(player, username, budget)
+        metrics.inc('warehouse_games_added_total', added)
+        total = self.count(player)
+        logger.info(f"Warehouse sync for {player}: {added} new, {refreshed} re-analyzed, {total} stored "
+                    f"from {len(newer) + len(older)} archives in {time.perf_counter() - start:.2f}s")
+        return {'added': added, 'refreshed': refreshed, 'games': total}, None
+
+    def _pull_months(self, player, username, archives, is_fresh, budget):
+        # Fetches, analyzes and commits the months in the given order
+        added = 0
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=ARCHIVE_FETCH_CONCURRENCY) as executor:
+            for batch_start in range(0, len(archives), ARCHIVE_FETCH_CONCURRENCY):
+                if budget is not None and budget.expired():
+                    # Months are committed in order, so the next sync picks up from here
+                    break
+                batch = archives[batch_start:batch_start + ARCHIVE_FETCH_CONCURRENCY]
+                with metrics.stage('fetch'):
+                    # A month that fails to load stops the sync; skipping it would lose it for good
+                    try:
+                        months = list(executor.map(lambda url: context.copy().run(fetch_archive_games, url, True), batch))
+                    except TimeoutError:
+                        if budget is None or not budget.expired():
+                            raise
+                        break
+                for games in months:
+                    fresh = [game for game in games if game.get('pgn') and is_fresh(game)]
+                    if not fresh:
+                        continue
+                    with metrics.stage('analyze'):
+                        rows = self._analyze_rows(player, username, fresh)
+                    self._store(rows)
+                    added += len(rows)
+        return added
+
+
+def get_warehouse():
+    global _warehouse, _warehouse_loaded
+    with _warehouse_lock:
+        if not _warehouse_loaded:
+            _warehouse_loaded = True
+            if WAREHOUSE_PATH:
+                from core.core import ANALYZER_VERSION
+                try:
+                    _warehouse = GameWarehouse(WAREHOUSE_PATH, ANALYZER_VERSION)
+                    logger.info(f"Game warehouse enabled at {WAREHOUSE_PATH}")
+                except sqlite3.Error as e:
+                    logger.error(f"Game warehouse disabled: {str(e)}")
+        return _warehouse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync Chess.com histories into the local game warehouse and print their statistics")
+    parser.add_argument('usernames', nargs='+')
+    parser.add_argument('--path', default=WAREHOUSE_PATH, help="SQLite file (defaults to WAREHOUSE_PATH)")
+    parser.add_argument('--no-sync', action='store_true', help="only query games already stored")
+    parser.add_argument('--months', type=int, default=0, help="months to pull for a new player; 0, the default, backfills the whole history")
+    parser.add_argument('--time-class', action='append', choices=['bullet', 'blitz', 'rapid', 'daily'])
+    parser.add_argument('--since', help="keep games on or after this date (YYYY-MM-DD)")
+    parser.add_argument('--until', help="keep games on or before this date (YYYY-MM-DD)")
+    args = parser.parse_args()
+    if not args.path:
+        parser.error("--path or WAREHOUSE_PATH is required")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from core.core import ANALYZER_VERSION
+    warehouse = GameWarehouse(args.path, ANALYZER_VERSION)
+
+    failed = 0
+    filters = {'time_classes': args.time_class, 'since': args.since, 'until': args.until}
+    for username in args.usernames:
+        record = {'player': username}
+        if not args.no_sync:
+            with priority_scope(BATCH):
+                sync, error = warehouse.sync(username, args.months)
+            if error:
+                failed += 1
+                print(json.dumps({'player': username, 'error': error}, ensure_ascii=False))
+                continue
+            record['sync'] = sync
+
+        start = time.perf_counter()
+        record['games'] = warehouse.count(username, **filters)
+        record['opening_stats'] = dict(warehouse.opening_stats(username, **filters))
+        record['color_stats'] = warehouse.color_stats(username, **filters)
+        record['query_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        print(json.dumps(record, ensure_ascii=False))
+
+    warehouse.close()
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,25 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_gemini import FakeModel
+from core import ai_integration, ratelimit
+
+
+@pytest.fixture(autouse=True)
+def unlimited_rates(monkeypatch):
+    # Tests talk to local fakes, so the shared token buckets never make them wait
+    for service in ratelimit.RATE_LIMITS:
+        monkeypatch.setattr(ratelimit.get_limiter(service), 'rate', 0)
+
+
+@pytest.fixture
+def fake_model():
+    model = FakeModel(latency=0.2, jitter=0.0, seed=1)
+    ai_integration.set_model(model)
+    with ai_integration._latency_lock:
+        ai_integration._latencies.clear()
+    yield model
+    ai_integration.set_model(None)
@@ -0,0 +1,57 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.fake_gemini import sample_stats
+from core import ai_integration
+from core.cache import TTLCache
+from core.coaching import build_template_report
+
+
+def test_concurrent_identical_prompts_call_the_model_once(fake_model):
+    stats = sample_stats(1)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        answers = list(executor.map(lambda _: ai_integration.get_comprehensive_analysis(*stats, timeout=5), range(8)))
+
+    assert fake_model.calls == 1
+    assert set(answers) == {fake_model.answer(ai_integration.build_analysis_prompt(*stats))}
+
+
+def test_cached_answer_is_reused(fake_model):
+    stats = sample_stats(2)
+    first = ai_integration.get_comprehensive_analysis(*stats, timeout=5)
+    assert ai_integration.get_comprehensive_analysis(*stats, timeout=5) == first
+    assert fake_model.calls == 1
+
+
+def test_error_is_not_cached(fake_model):
+    stats = sample_stats(3)
+    fake_model.error_rate = 1.0
+    assert ai_integration.get_comprehensive_analysis(*stats, timeout=5) == build_template_report(*stats)
+
+    fake_model.error_rate = 0.0
+    answer = ai_integration.get_comprehensive_analysis(*stats, timeout=5)
+    assert answer == fake_model.answer(ai_integration.build_analysis_prompt(*stats))
+    assert fake_model.calls == 2
+
+
+def test_cached_answer_expires_after_ttl(fake_model, monkeypatch):
+    monkeypatch.setattr(ai_integration, '_response_cache', TTLCache(16, 0.3, name='ai_response'))
+    stats = sample_stats(4)
+    ai_integration.get_comprehensive_analysis(*stats, timeout=5)
+    ai_integration.get_comprehensive_analysis(*stats, timeout=5)
+    assert fake_model.calls == 1
+
+    time.sleep(0.4)
+    ai_integration.get_comprehensive_analysis(*stats, timeout=5)
+    assert fake_model.calls == 2
+
+
+def test_fingerprint_depends_on_model_and_prompt():
+    class Named:
+        def __init__(self, model_name):
+            self.model_name = model_name
+
+    prompt = ai_integration.build_analysis_prompt(*sample_stats(5))
+    key = ai_integration.prompt_fingerprint(prompt, Named('a'))
+    assert key == ai_integration.prompt_fingerprint(prompt, Named('a'))
+    assert key != ai_integration.prompt_fingerprint(prompt, Named('b'))
+    assert key != ai_integration.prompt_fingerprint(prompt + ' ', Named('a'))
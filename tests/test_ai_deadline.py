@@ -0,0 +1,123 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.fake_gemini import FakeModel, sample_stats
+from core import ai_integration, metrics, ratelimit
+from core.coaching import build_template_report
+
+
+def wait_for_producers(timeout=5):
+    # A stream producer outlives a consumer that gave up; let it settle before
+    # the test ends so its log line is not written after capture is closed
+    end = time.monotonic() + timeout
+    while ai_integration._inflight.calls and time.monotonic() < end:
+        time.sleep(0.05)
+
+
+class EmptyModel(FakeModel):
+    def answer(self, prompt):
+        return ""
+
+
+class SlowFirstModel(FakeModel):
+    # The first call stalls, every later one answers quickly
+    def _draw(self):
+        latency = super()._draw()
+        return self.slow_latency if self.calls == 1 else latency
+
+
+def test_slow_call_falls_back_to_template_within_timeout(fake_model, monkeypatch):
+    monkeypatch.setattr(ai_integration, 'AI_TIMEOUT', 0.5)
+    fake_model.latency = 5.0
+    stats = sample_stats(10)
+
+    start = time.monotonic()
+    answer = ai_integration.get_comprehensive_analysis(*stats)
+
+    assert time.monotonic() - start < 1.0
+    assert answer == build_template_report(*stats)
+
+
+def test_slow_stream_falls_back_to_template_within_timeout(fake_model, monkeypatch):
+    monkeypatch.setattr(ai_integration, 'AI_TIMEOUT', 0.5)
+    fake_model.latency = 5.0
+    stats = sample_stats(11)
+
+    start = time.monotonic()
+    answers = list(ai_integration.stream_comprehensive_analysis(*stats))
+
+    assert time.monotonic() - start < 1.0
+    assert answers == [build_template_report(*stats)]
+    wait_for_producers()
+
+
+def test_empty_answer_counts_as_failure():
+    model = EmptyModel(latency=0.0, jitter=0.0)
+    ai_integration.set_model(model)
+    stats = sample_stats(12)
+    errors = metrics.REGISTRY.counter_value('ai_fallback_total', reason='error')
+    try:
+        assert ai_integration.get_comprehensive_analysis(*stats, timeout=5) == build_template_report(*stats)
+        assert list(ai_integration.stream_comprehensive_analysis(*stats, timeout=5))[-1] == build_template_report(*stats)
+        # Neither answer was cached, so each request asked the model
+        assert model.calls == 2
+        assert metrics.REGISTRY.counter_value('ai_fallback_total', reason='error') == errors + 2
+    finally:
+        ai_integration.set_model(None)
+
+
+def test_hedging_is_off_by_default(fake_model):
+    assert ai_integration.AI_HEDGE_PERCENTILE == 0
+    with ai_integration._latency_lock:
+        ai_integration._latencies.extend([0.01] * 100)
+    assert ai_integration.hedge_delay() is None
+
+    ai_integration.get_comprehensive_analysis(*sample_stats(13), timeout=5)
+    assert fake_model.calls == 1
+
+
+def test_hedge_answers_for_a_stalled_call(monkeypatch):
+    monkeypatch.setattr(ai_integration, 'AI_HEDGE_PERCENTILE', 0.5)
+    model = SlowFirstModel(latency=0.05, jitter=0.0, slow_latency=3.0)
+    ai_integration.set_model(model)
+    with ai_integration._latency_lock:
+        ai_integration._latencies.clear()
+        ai_integration._latencies.extend([0.05] * ai_integration.AI_HEDGE_MIN_SAMPLES)
+    stats = sample_stats(14)
+    try:
+        start = time.monotonic()
+        answer = ai_integration.get_comprehensive_analysis(*stats, timeout=5)
+        assert time.monotonic() - start < 1.0
+        assert answer == model.answer(ai_integration.build_analysis_prompt(*stats))
+        assert model.calls == 2
+    finally:
+        ai_integration.set_model(None)
+
+
+def test_timed_out_calls_free_their_pool_threads(fake_model):
+    fake_model.latency = 5.0
+    with ThreadPoolExecutor(max_workers=ai_integration.AI_CONCURRENCY) as executor:
+        list(executor.map(lambda i: ai_integration.get_comprehensive_analysis(*sample_stats(100 + i), timeout=0.3),
+                          range(ai_integration.AI_CONCURRENCY)))
+
+    # Every slot was taken by a call that gave up; the next request still gets the model
+    fake_model.latency = 0.05
+    stats = sample_stats(200)
+    assert ai_integration.get_comprehensive_analysis(*stats, timeout=1.0) == fake_model.answer(ai_integration.build_analysis_prompt(*stats))
+
+
+def test_rate_limit_wait_ends_at_the_deadline(fake_model, monkeypatch):
+    limiter = ratelimit.get_limiter('gemini')
+    monkeypatch.setattr(limiter, 'rate', 0.01)
+    monkeypatch.setattr(limiter, 'tokens', 0.0)
+    stats = sample_stats(15)
+
+    start = time.monotonic()
+    assert ai_integration.get_comprehensive_analysis(*stats, timeout=0.3) == build_template_report(*stats)
+    assert list(ai_integration.stream_comprehensive_analysis(*stats, timeout=0.3)) == [build_template_report(*stats)]
+    assert time.monotonic() - start < 1.0
+    # Neither request spent a token on a call it had already given up on
+    assert fake_model.calls == 0
+    wait_for_producers()
+    assert not ai_integration._inflight.calls
+    time.sleep(0.1)
+    assert not limiter.waiters
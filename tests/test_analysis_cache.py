@@ -0,0 +1,36 @@
+from core import openings
+from core.cache import AnalysisCache
+
+PGN = '[Event "Test"]\n\n1. e4 e5 2. Nf3 *\n'
+RESULT = ({'opening': 'Test Opening'}, 1500)
+
+
+def test_opening_data_changes_the_key():
+    cache = AnalysisCache(1, data_version='a')
+    assert cache.key(PGN, 'alice') != AnalysisCache(1, data_version='b').key(PGN, 'alice')
+    assert cache.key(PGN, 'alice') == AnalysisCache(1, data_version='a').key(PGN, 'alice')
+
+
+def test_disk_tier_drops_rows_from_other_opening_data(tmp_path):
+    path = str(tmp_path / "analyses.db")
+    cache = AnalysisCache(1, path=path, data_version='a')
+    cache.put(cache.key(PGN, 'alice'), RESULT)
+    cache.flush()
+
+    same = AnalysisCache(1, path=path, data_version='a')
+    assert same.get(same.key(PGN, 'alice')) == RESULT
+
+    edited = AnalysisCache(1, path=path, data_version='b')
+    assert edited.db.execute("SELECT COUNT(*) FROM game_analyses").fetchone()[0] == 0
+
+
+def test_fingerprint_follows_csv_contents(tmp_path, monkeypatch):
+    csv_path = tmp_path / "openings.csv"
+    csv_path.write_text("ECO Code,Name,Opening Moves\nC20,King's Pawn,1.e4 e5\n", encoding='utf-8')
+    monkeypatch.setattr(openings, 'OPENINGS_CSV_PATH', str(csv_path))
+    monkeypatch.setattr(openings, '_data_fingerprint', None)
+    before = openings.opening_data_fingerprint()
+
+    csv_path.write_text("ECO Code,Name,Opening Moves\nC20,King Pawn Game,1.e4 e5\n", encoding='utf-8')
+    monkeypatch.setattr(openings, '_data_fingerprint', None)
+    assert openings.opening_data_fingerprint() != before
@@ -0,0 +1,72 @@
+import json
+import threading
+import pytest
+from core import batch
+from core.batch import BatchRunner
+
+PLAYERS = [f"player{i}" for i in range(12)]
+
+
+@pytest.fixture
+def fake_pipeline(monkeypatch):
+    monkeypatch.setattr(BatchRunner, '_fetch', lambda self, source, player, path: ("pgn", None))
+    monkeypatch.setattr(batch, 'summarize_games', lambda pgn_content, player: {'weaknesses': [], 'user_rating': 1500})
+    monkeypatch.setattr(batch, 'summary_fields', lambda summary: {'games': 1})
+    monkeypatch.setattr(batch, 'fetch_puzzles_for', lambda weaknesses, user_rating: [])
+
+
+def run_batch(runner, jobs, timeout=10):
+    # A stuck reporter would hang run() forever, so it runs on a thread here
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(runner.run(jobs)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "batch run hung"
+    return result
+
+
+def read_records(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_reporting_failure_is_recorded_per_player(tmp_path, fake_pipeline, monkeypatch):
+    def fail(weaknesses, user_rating):
+        raise RuntimeError("puzzle store down")
+    monkeypatch.setattr(batch, 'fetch_puzzles_for', fail)
+    output = tmp_path / "out.jsonl"
+    runner = BatchRunner(str(output), fetch_workers=2, analyze_workers=2, queue_size=1)
+
+    summary = run_batch(runner, [('chess_com', player, None) for player in PLAYERS])
+
+    records = read_records(output)
+    assert summary['players'] == len(PLAYERS)
+    assert summary['failed'] == len(PLAYERS)
+    assert sorted(record['player'] for record in records) == sorted(PLAYERS)
+    assert all('puzzle store down' in record['error'] for record in records)
+
+
+def test_write_failure_does_not_hang_the_run(tmp_path, fake_pipeline, monkeypatch):
+    # A field json cannot encode makes every write of the record fail
+    monkeypatch.setattr(batch, 'summary_fields', lambda summary: {'games': 1, 'started': object()})
+    output = tmp_path / "out.jsonl"
+    runner = BatchRunner(str(output), fetch_workers=2, analyze_workers=2, queue_size=1)
+
+    summary = run_batch(runner, [('chess_com', player, None) for player in PLAYERS])
+
+    assert summary['players'] == len(PLAYERS)
+    assert summary['failed'] == len(PLAYERS)
+    assert read_records(output) == []
+
+
+def test_ai_failure_keeps_the_records(tmp_path, fake_pipeline, monkeypatch):
+    def fail(requests):
+        raise RuntimeError("model down")
+    monkeypatch.setattr(batch, 'get_comprehensive_analyses', fail)
+    output = tmp_path / "out.jsonl"
+    runner = BatchRunner(str(output), analyze_workers=2, queue_size=1, with_ai=True)
+
+    summary = run_batch(runner, [('chess_com', player, None) for player in PLAYERS])
+
+    assert summary['failed'] == 0
+    assert all(record['status'] == 'ok' and 'ai_analysis' not in record for record in read_records(output))
@@ -0,0 +1,52 @@
+import time
+import pytest
+import core.core as cc
+from core.budget import RequestBudget, budget_scope
+
+PUZZLES = [{'id': 'x', 'url': 'https://lichess.org/training/fork', 'theme': 'Fork', 'rating': 1500, 'themes': ['fork']}]
+
+
+@pytest.fixture(scope='module')
+def corpus_pgn():
+    from benchmarks.corpus import PLAYER, generate_corpus
+    return generate_corpus(200).encode('utf-8'), PLAYER
+
+
+@pytest.fixture
+def local_puzzles(monkeypatch, fake_model):
+    def fetch(weaknesses, user_rating):
+        time.sleep(0.05)
+        return PUZZLES
+    monkeypatch.setattr(cc, 'fetch_puzzles_for', fetch)
+
+
+def test_puzzles_survive_a_deadline_hit(corpus_pgn, local_puzzles):
+    pgn, player = corpus_pgn
+    budget = RequestBudget(seconds=0.2)
+    with budget_scope(budget):
+        outputs = cc.analyze_games(None, pgn, player)
+
+    assert budget.reason == 'deadline'
+    assert 'Qisman natija' in outputs[0]
+    assert 'lichess.org/training/fork' in outputs[2]
+
+
+def test_streamed_puzzles_survive_a_deadline_hit(corpus_pgn, local_puzzles):
+    pgn, player = corpus_pgn
+    budget = RequestBudget(seconds=0.2)
+    details = {}
+    with budget_scope(budget):
+        list(cc.analyze_games_stream(None, pgn, player, details=details))
+
+    assert budget.reason == 'deadline'
+    assert details['puzzles'] == PUZZLES
+
+
+def test_pgn_size_limit_counts_game_text():
+    budget = RequestBudget(seconds=0, max_pgn_mb=1 / 1024)
+    texts = ['x' * 400, 'y' * 400, 'z' * 400]
+
+    assert list(budget.games_within(texts)) == texts[:2]
+    assert budget.reason == 'pgn_size'
+    assert budget.pgn_chars == 800
+    assert 'PGN hajmi' in budget.note(2)
@@ -0,0 +1,123 @@
+import time
+from datetime import datetime, timezone
+import pytest
+from core import chess_api
+
+BASE = 'https://chess.test/pub'
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def json(self):
+        return self.body
+
+
+class FakeSession:
+    # Routes map a URL to a response, or to a function of the request headers
+    def __init__(self, routes, delays=None):
+        self.routes = routes
+        self.delays = delays or {}
+        self.requests = []
+
+    def get(self, url, timeout=None, headers=None):
+        self.requests.append((url, dict(headers or {})))
+        time.sleep(self.delays.get(url, 0))
+        route = self.routes.get(url)
+        if route is None:
+            return FakeResponse(404)
+        return route(headers or {}) if callable(route) else route
+
+
+def month_url(year, month):
+    return f"{BASE}/player/alice/games/{year}/{month:02d}"
+
+
+def month_games(label, count=3):
+    return [{'pgn': f'[Event "{label} {i}"]\n\n1. e4 *\n', 'time_class': 'blitz'} for i in range(count)]
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setattr(chess_api, 'CHESS_COM_API_URL', BASE)
+    monkeypatch.setattr(chess_api, '_archive_cache', type(chess_api._archive_cache)())
+
+    def install(routes, delays=None):
+        fake = FakeSession(routes, delays)
+        monkeypatch.setattr(chess_api, '_session', fake)
+        return fake
+    return install
+
+
+def player_routes(archives):
+    return {
+        f"{BASE}/player/alice": FakeResponse(200, {'username': 'alice'}),
+        f"{BASE}/player/alice/games/archives": FakeResponse(200, {'archives': archives})
+    }
+
+
+def test_concurrent_months_keep_archive_order(session):
+    archives = [month_url(2024, month) for month in (1, 2, 3)]
+    routes = player_routes(archives)
+    for month, url in enumerate(archives, 1):
+        routes[url] = FakeResponse(200, {'games': month_games(f'm{month}', 10)})
+    # The newest month answers last, so completion order is the reverse of archive order
+    session(routes, delays={archives[2]: 0.2, archives[1]: 0.1})
+
+    pgn_list, error = chess_api.get_user_games_from_chess_com('alice')
+
+    assert error is None
+    labels = [pgn.split('"')[1].split()[0] for pgn in pgn_list]
+    assert labels == ['m3'] * 10 + ['m2'] * 10 + ['m1'] * 10
+
+
+def test_not_modified_month_reuses_cached_games(session):
+    now = datetime.now(timezone.utc)
+    url = month_url(now.year, now.month)
+    games = month_games('current')
+
+    def route(headers):
+        if headers.get('If-None-Match') == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, {'games': games}, {'ETag': '"v1"', 'Last-Modified': 'Tue, 01 Oct 2024 00:00:00 GMT'})
+    fake = session({url: route})
+
+    assert chess_api.fetch_archive_games(url) == games
+    assert chess_api.fetch_archive_games(url) == games
+    assert len(fake.requests) == 2
+    assert fake.requests[1][1] == {'If-None-Match': '"v1"', 'If-Modified-Since': 'Tue, 01 Oct 2024 00:00:00 GMT'}
+
+
+def test_closed_month_is_never_fetched_again(session):
+    url = month_url(2020, 1)
+    games = month_games('closed')
+    fake = session({url: FakeResponse(200, {'games': games}, {'ETag': '"v1"'})})
+
+    for _ in range(3):
+        assert chess_api.fetch_archive_games(url) == games
+    assert [request_url for request_url, _ in fake.requests] == [url]
+
+
+def test_failed_month_keeps_the_others(session):
+    archives = [month_url(2024, month) for month in (1, 2, 3)]
+    routes = player_routes(archives)
+    routes[archives[0]] = FakeResponse(200, {'games': month_games('m1')})
+    routes[archives[1]] = FakeResponse(500)
+    routes[archives[2]] = FakeResponse(200, {'games': month_games('m3')})
+    session(routes)
+
+    pgn_list, error = chess_api.get_user_games_from_chess_com('alice')
+
+    assert error is None
+    assert [pgn.split('"')[1].split()[0] for pgn in pgn_list] == ['m3'] * 3 + ['m1'] * 3
+
+
+def test_failed_month_raises_when_required(session):
+    url = month_url(2024, 2)
+    session({url: FakeResponse(500)})
+
+    with pytest.raises(RuntimeError):
+        chess_api.fetch_archive_games(url, required=True)
@@ -0,0 +1,93 @@
+import sys
+import pytest
+from benchmarks.corpus import PLAYER, generate_corpus
+from core import engine, metrics, parallel
+from core.cache import AnalysisCache
+from core.positions import PositionCache
+
+ROOT_DIR = __file__.rsplit('/tests/', 1)[0]
+STUB_COMMAND = [sys.executable, '-m', 'benchmarks.stub_uci_engine']
+
+# The user (White) hangs the queen on move 3 and plays book moves otherwise
+PGN = '[White "alice"]\n[Black "bob"]\n\n1. e4 e5 2. Nf3 Nc6 3. Qe2 Nd4 4. Qd3 *\n'
+
+
+@pytest.fixture
+def stub_engine(monkeypatch):
+    # UCI_ENGINE_PATH pointed at the stub, with a fresh pool and evaluation
+    # cache so every test spawns and searches for itself
+    monkeypatch.chdir(ROOT_DIR)
+    monkeypatch.setattr(engine, 'UCI_ENGINE_PATH', ' '.join(STUB_COMMAND))
+    monkeypatch.setattr(engine, '_pool', None)
+    monkeypatch.setattr(engine, '_pool_loaded', False)
+    monkeypatch.setattr(engine, '_eval_cache', PositionCache(1000, name='engine_eval'))
+    pool = engine.get_engine_pool()
+    yield pool
+    pool.close()
+
+
+def heuristic(*move_numbers):
+    return {'mistakes': [{'type': 'blunder', 'phase': 'opening', 'move_number': n} for n in move_numbers]}
+
+
+def test_engine_clears_a_heuristic_blunder_it_rates_as_fine(stub_engine):
+    # Ply 1 (1. e4) loses nothing, so the engine drops the heuristic's verdict
+    reviewed, = engine.review_games([(PGN, heuristic(1))], 'alice')
+
+    assert all(m['move_number'] != 1 for m in reviewed['mistakes'])
+
+
+def test_engine_review_does_not_modify_shared_analyses(stub_engine):
+    analysis = heuristic(1)
+    engine.review_games([(PGN, analysis)], 'alice')
+
+    assert analysis == heuristic(1)
+
+
+def test_budget_stops_the_review_early(stub_engine):
+    exhausted = metrics.REGISTRY.counter_value('engine_budget_exhausted_total')
+    positions = metrics.REGISTRY.counter_value('engine_positions_total')
+
+    # One node: the first reviewed position spends it, the rest keep the heuristic verdicts
+    reviewed, = engine.review_games([(PGN, heuristic(1, 3, 5, 7))], 'alice', budget=engine.EngineBudget(nodes=1))
+
+    assert metrics.REGISTRY.counter_value('engine_positions_total') == positions + 1
+    assert metrics.REGISTRY.counter_value('engine_budget_exhausted_total') == exhausted + 1
+    assert len([m for m in reviewed['mistakes'] if m['type'] == 'blunder']) >= 3
+
+
+def test_expired_budget_leaves_analyses_untouched(stub_engine):
+    analysis = heuristic(1, 3)
+    reviewed, = engine.review_games([(PGN, analysis)], 'alice', budget=engine.EngineBudget(seconds=0))
+
+    assert reviewed is analysis
+
+
+def test_pool_reuses_one_process_across_requests(stub_engine):
+    for _ in range(3):
+        engine.review_games([(PGN, heuristic(1))], 'alice')
+
+    assert stub_engine.started == 1
+    assert stub_engine.idle.qsize() == 1
+
+
+def test_results_unchanged_without_an_engine(monkeypatch):
+    monkeypatch.setattr(engine, 'UCI_ENGINE_PATH', None)
+    monkeypatch.setattr(engine, '_pool', None)
+    monkeypatch.setattr(engine, '_pool_loaded', False)
+    texts = parallel.split_pgn_text(generate_corpus(20))
+
+    analyzed = dict(parallel.iter_pgn_analyses(texts, PLAYER, workers=1, cache=AnalysisCache(1)))
+
+    assert engine.get_engine_pool() is None
+    assert [analyzed[text] for text in texts] == [parallel.analyze_pgn_text(text, PLAYER) for text in texts]
+
+
+def test_analysis_pipeline_uses_the_configured_engine(stub_engine):
+    positions = metrics.REGISTRY.counter_value('engine_positions_total')
+    texts = parallel.split_pgn_text(generate_corpus(5))
+
+    analyzed = list(parallel.iter_pgn_analyses(texts, PLAYER, workers=1, cache=AnalysisCache(1)))
+
+    assert len(analyzed) == 5
+    assert metrics.REGISTRY.counter_value('engine_positions_total') > positions
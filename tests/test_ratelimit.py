@@ -0,0 +1,62 @@
+import threading
+import time
+import pytest
+from core.budget import RequestBudget, budget_scope
+from core.ratelimit import TokenBucket
+
+
+def empty_bucket():
+    # One token every 100 seconds, none left
+    bucket = TokenBucket('test', rate=0.01, burst=1)
+    bucket.tokens = 0.0
+    return bucket
+
+
+def test_token_is_taken_without_waiting():
+    bucket = TokenBucket('test', rate=1, burst=2)
+    assert bucket.acquire() < 0.05
+    assert bucket.tokens < 2
+
+
+def test_wait_ends_at_the_given_deadline():
+    bucket = empty_bucket()
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        bucket.acquire(deadline=time.monotonic() + 0.2)
+    assert time.monotonic() - start < 0.5
+    assert not bucket.waiters
+
+
+def test_wait_ends_at_the_request_deadline():
+    bucket = empty_bucket()
+    start = time.monotonic()
+    with budget_scope(RequestBudget(seconds=0.2)):
+        with pytest.raises(TimeoutError):
+            bucket.acquire()
+    assert time.monotonic() - start < 0.5
+    assert not bucket.waiters
+
+
+def test_wait_ends_when_the_request_is_cancelled():
+    bucket = empty_bucket()
+    budget = RequestBudget(seconds=0)
+    threading.Timer(0.1, budget.cancel).start()
+    start = time.monotonic()
+    with budget_scope(budget):
+        with pytest.raises(TimeoutError):
+            bucket.acquire()
+    assert time.monotonic() - start < 0.6
+    assert not bucket.waiters
+
+
+def test_queued_waiter_behind_the_head_also_gives_up():
+    bucket = empty_bucket()
+    head = threading.Thread(target=lambda: pytest.raises(TimeoutError, bucket.acquire, deadline=time.monotonic() + 0.5))
+    head.start()
+    time.sleep(0.05)
+    start = time.monotonic()
+    with budget_scope(RequestBudget(seconds=0.1)):
+        with pytest.raises(TimeoutError):
+            bucket.acquire()
+    assert time.monotonic() - start < 0.4
+    head.join()
@@ -0,0 +1,44 @@
+import chess
+import pytest
+from core.see import capture_value, is_hanging, see
+
+# (FEN, capture move, expected SEE in pawns)
+KNOWN_CAPTURES = [
+    ("1k1r4/1pp4p/p7/4p3/8/P5P1/1PP4P/2K1R3 w - - 0 1", "e1e5", 1),
+    ("1k1r3q/1ppn3p/p4b2/4p3/8/P2N2P1/1PP1R1BP/2K1Q3 w - - 0 1", "d3e5", -2),
+    ("4k3/8/8/3q4/8/8/8/3RK3 w - - 0 1", "d1d5", 9),
+    ("4k3/8/2p5/3p4/8/4N3/8/4K3 w - - 0 1", "e3d5", -2),
+    ("3r2k1/3r4/8/3p4/8/8/3R4/3R2K1 w - - 0 1", "d2d5", -4),
+    ("3r2k1/8/8/3p4/8/8/3R4/3R2K1 w - - 0 1", "d2d5", 1),
+    ("4k3/8/4p3/3p4/4Q3/5B2/8/4K3 w - - 0 1", "e4d5", -7),
+    ("4k3/8/4p3/3p4/4B3/5Q2/8/4K3 w - - 0 1", "e4d5", -1),
+    ("4k3/8/8/8/8/8/3p4/3K4 w - - 0 1", "d1d2", 1),
+    ("rn1q2nr/1b4pp/p1p1k3/1p1pp1p1/1P5b/N1KP1P2/PBP1P1PP/R3QBR1 b - - 1 13", "h4e1", 6),
+]
+
+# (FEN, square, expected best gain for the side to move capturing there)
+KNOWN_SQUARES = [
+    ("4k3/8/8/3q4/8/8/8/3RK3 w - - 0 1", "d5", 9),
+    ("4k3/8/2p5/3p4/8/4N3/8/4K3 w - - 0 1", "d5", 0),
+    ("4k3/4r3/8/8/4N3/8/8/4K3 b - - 0 1", "e4", 3),
+    ("4k3/4r3/8/3p4/4N3/8/8/4K3 b - - 0 1", "e4", 3),
+    ("4k3/4r3/8/8/4N3/3P4/8/4K3 b - - 0 1", "e4", 0),
+    ("4k3/4r3/8/8/4N3/3P4/8/4R1K1 b - - 0 1", "e4", 0),
+]
+
+
+
+
+@pytest.mark.parametrize('fen, uci, expected', KNOWN_CAPTURES)
+def test_see(fen, uci, expected):
+    assert see(chess.Board(fen), chess.Move.from_uci(uci)) == expected
+
+
+@pytest.mark.parametrize('fen, name, expected', KNOWN_SQUARES)
+def test_capture_value(fen, name, expected):
+    assert capture_value(chess.Board(fen), chess.parse_square(name)) == expected
+
+
+@pytest.mark.parametrize('fen, name, expected', KNOWN_SQUARES)
+def test_is_hanging(fen, name, expected):
+    assert is_hanging(chess.Board(fen), chess.parse_square(name)) == (expected > 0)
@@ -0,0 +1,66 @@
+import json
+from datetime import datetime, timezone
+import pytest
+from core import warehouse
+from core.warehouse import GameWarehouse
+
+ARCHIVES = [f"https://api.chess.com/pub/player/alice/games/2024/{month:02d}" for month in range(1, 7)]
+
+
+def month_games(url):
+    month = int(url.rsplit('/', 1)[1])
+    end_time = int(datetime(2024, month, 10, tzinfo=timezone.utc).timestamp())
+    return [{'url': f"{url}/game{i}", 'end_time': end_time + i, 'time_class': 'blitz', 'pgn': f"[Event \"{month}-{i}\"]"}
+            for i in range(2)]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    fetched = []
+
+    def fetch_games(url, required=False):
+        fetched.append(url)
+        return month_games(url)
+
+    def analyze_rows(self, player, username, games):
+        # Real analysis is covered elsewhere; rows only need their dates here
+        return [(player, warehouse.game_id(game), game['end_time'], game['time_class'], 'Test', 1, 'win', '1-0', 40, 1500,
+                 json.dumps([]), self.version, game['pgn']) for game in games]
+
+    monkeypatch.setattr(warehouse, 'fetch_archive_list', lambda username: (ARCHIVES, None))
+    monkeypatch.setattr(warehouse, 'fetch_archive_games', fetch_games)
+    monkeypatch.setattr(GameWarehouse, '_analyze_rows', analyze_rows)
+    db = GameWarehouse(str(tmp_path / "games.db"), 1)
+    yield db, fetched
+    db.close()
+
+
+def test_first_sync_pulls_recent_months(store):
+    db, fetched = store
+    result, error = db.sync('alice')
+
+    assert error is None
+    assert fetched == ARCHIVES[-warehouse.WAREHOUSE_SYNC_MONTHS:]
+    assert result['games'] == 2 * warehouse.WAREHOUSE_SYNC_MONTHS
+
+
+def test_full_sync_backfills_older_months(store):
+    db, fetched = store
+    db.sync('alice')
+    fetched.clear()
+    result, error = db.sync('alice', months=0)
+
+    assert error is None
+    # The newest stored month is checked for new games, older months come newest first
+    assert fetched == ARCHIVES[-1:] + ARCHIVES[-warehouse.WAREHOUSE_SYNC_MONTHS - 1::-1]
+    assert result['games'] == 2 * len(ARCHIVES)
+
+
+def test_backfill_is_not_repeated(store):
+    db, fetched = store
+    db.sync('alice', months=0)
+    fetched.clear()
+    result, _ = db.sync('alice', months=0)
+
+    assert fetched == ARCHIVES[-1:]
+    assert result['added'] == 0